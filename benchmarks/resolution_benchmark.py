@@ -0,0 +1,243 @@
+### Measures how resolution, archive handling, container file generation, and registry loading scale with their input,
+### on synthetic inputs (see `synthetic_inputs.py`). Reports throughput and peak (python) memory, and compares both
+### against a stored baseline, so regressions show up.
+### Usage: `python benchmarks/resolution_benchmark.py [--scale large] [--only NAME ...] [--save-baseline]`
+import argparse
+import contextlib
+import io
+import json
+import os
+import platform
+import shutil
+import sys
+import tempfile
+import time
+import tracemalloc
+from dataclasses import dataclass, asdict
+from typing import Callable
+
+_benchmarks_dir = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.dirname(_benchmarks_dir))  # run from a checkout; bsander needn't be installed
+
+from bsander.bsandr_utils.experiment_archive import extract_archive_returning_pbif_paths, \
+    read_archive_pbif_documents, write_archive_with_replacements
+from bsander.bsandr_utils.input_types import ProgramArguments, ContainerizationTypes, ContainerizationEngine
+from bsander.pbic3g.containerization.container_constructor import determine_dependencies, localize_document_text, \
+    formulate_dockerfile_for_necessary_env
+from bsander.pbic3g.local_registry import load_local_modules
+from synthetic_inputs import generate_pbif_document, generate_address_listing, write_omex_archive, \
+    write_fake_distributions
+
+DEFAULT_BASELINE_PATH: str = os.path.join(_benchmarks_dir, "baseline.json")
+DEFAULT_TOLERANCE: float = 0.25
+_addresses_per_archived_document = 100
+
+
+@dataclass
+class BenchmarkCase:
+    item_count: int  # what throughput is measured in (addresses, classes, ...)
+    run: Callable[[], object]
+    prepare: Callable[[], None] = lambda: None  # before every (timed) run, untimed
+    cleanup: Callable[[], None] = lambda: None
+
+
+@dataclass
+class Benchmark:
+    name: str
+    unit: str
+    sizes: tuple[int, ...]
+    large_sizes: tuple[int, ...]  # added with `--scale large`
+    set_up: Callable[[int, str], BenchmarkCase]  # (size, scratch directory) -> case
+
+
+@dataclass
+class BenchmarkResult:
+    seconds: float  # best of the repeats
+    throughput: float  # items per second
+    peak_memory_bytes: int | None
+
+
+def _set_up_determine_dependencies(size: int, scratch_dir: str) -> BenchmarkCase:
+    listing = generate_address_listing(size)
+    return BenchmarkCase(size, lambda: determine_dependencies(listing))
+
+
+def _set_up_localize_document_text(size: int, scratch_dir: str) -> BenchmarkCase:
+    document = generate_pbif_document(size)
+    return BenchmarkCase(size, lambda: localize_document_text(document))
+
+
+def _set_up_formulate_dockerfile(size: int, scratch_dir: str) -> BenchmarkCase:
+    # Localizes in place, so every run starts from a fresh copy of the document
+    source_path = os.path.join(scratch_dir, "source.pbif")
+    document_path = os.path.join(scratch_dir, "document.pbif")
+    with open(source_path, "w") as source_file:
+        source_file.write(generate_pbif_document(size))
+    program_arguments = ProgramArguments(document_path, scratch_dir, None, ContainerizationTypes.SINGLE,
+                                         ContainerizationEngine.DOCKER)
+    return BenchmarkCase(size, lambda: formulate_dockerfile_for_necessary_env(program_arguments),
+                         prepare=lambda: shutil.copyfile(source_path, document_path))
+
+
+def _set_up_extract_archive(size: int, scratch_dir: str) -> BenchmarkCase:
+    archive_path = os.path.join(scratch_dir, "experiment.omex")
+    address_count = write_omex_archive(archive_path, size, _addresses_per_archived_document)
+    output_dir = os.path.join(scratch_dir, "extracted")
+    return BenchmarkCase(address_count, lambda: extract_archive_returning_pbif_paths(archive_path, output_dir),
+                         prepare=lambda: shutil.rmtree(output_dir, ignore_errors=True))
+
+
+def _set_up_stream_archive(size: int, scratch_dir: str) -> BenchmarkCase:
+    archive_path = os.path.join(scratch_dir, "experiment.omex")
+    address_count = write_omex_archive(archive_path, size, _addresses_per_archived_document)
+    rewritten_path = os.path.join(scratch_dir, "rewritten.omex")
+
+    def read_localize_and_rewrite():
+        documents = read_archive_pbif_documents(archive_path)
+        replacements = { member_name : localize_document_text(document)[2]
+                         for member_name, document in documents.items() }
+        write_archive_with_replacements(archive_path, rewritten_path, replacements)
+    return BenchmarkCase(address_count, read_localize_and_rewrite)
+
+
+def _set_up_registry(size: int, scratch_dir: str, use_cache: bool) -> BenchmarkCase:
+    # `size` distributions are installed into a directory put on `sys.path` for the duration of the benchmark;
+    # whatever is really installed is scanned too, as it would be
+    site_dir = os.path.join(scratch_dir, "site-packages")
+    class_count = write_fake_distributions(site_dir, size)
+    cache_path = os.path.join(scratch_dir, "registry.json")
+    distribution_index_cache_path = os.path.join(scratch_dir, "distribution_index.json")
+    sys.path.insert(0, site_dir)
+
+    def load_registry():
+        return load_local_modules(use_cache=use_cache, cache_path=cache_path, isolate_imports=False,
+                                  distribution_index_cache_path=distribution_index_cache_path)
+    if use_cache:
+        load_registry()  # warm the caches; only unchanged distributions are measured
+    return BenchmarkCase(class_count, load_registry, cleanup=lambda: sys.path.remove(site_dir))
+
+
+BENCHMARKS: list[Benchmark] = [
+    Benchmark("determine_dependencies", "addresses", (1_000, 10_000), (100_000, 1_000_000),
+              _set_up_determine_dependencies),
+    Benchmark("localize_document_text", "addresses", (1_000, 10_000), (100_000, 1_000_000),
+              _set_up_localize_document_text),
+    Benchmark("formulate_dockerfile", "addresses", (1_000, 10_000), (100_000, 1_000_000),
+              _set_up_formulate_dockerfile),
+    Benchmark("extract_archive", "addresses", (10, 100), (1_000,), _set_up_extract_archive),
+    Benchmark("stream_archive", "addresses", (10, 100), (1_000,), _set_up_stream_archive),
+    Benchmark("load_local_modules_cold", "classes", (10, 100), (1_000,),
+              lambda size, scratch_dir: _set_up_registry(size, scratch_dir, use_cache=False)),
+    Benchmark("load_local_modules_warm", "classes", (10, 100), (1_000,),
+              lambda size, scratch_dir: _set_up_registry(size, scratch_dir, use_cache=True)),
+]
+
+
+def run_benchmark_case(case: BenchmarkCase, repeats: int, measure_memory: bool) -> BenchmarkResult:
+    durations: list[float] = []
+    with contextlib.redirect_stdout(io.StringIO()):  # progress output isn't what's being measured
+        for _ in range(repeats):
+            case.prepare()
+            start = time.perf_counter()
+            case.run()
+            durations.append(time.perf_counter() - start)
+        peak_memory_bytes: int | None = None
+        if measure_memory:  # separately: tracing slows everything down
+            case.prepare()
+            tracemalloc.start()
+            try:
+                case.run()
+                peak_memory_bytes = tracemalloc.get_traced_memory()[1]
+            finally:
+                tracemalloc.stop()
+    best_duration = min(durations)
+    return BenchmarkResult(best_duration, case.item_count / best_duration if best_duration > 0 else float("inf"),
+                           peak_memory_bytes)
+
+
+def find_regressions(results: dict[str, BenchmarkResult], baseline: dict[str, dict],
+                     tolerance: float) -> list[str]:
+    regressions: list[str] = []
+    for key, result in results.items():
+        baseline_result = baseline.get(key)
+        if baseline_result is None:
+            continue
+        if result.throughput < baseline_result["throughput"] * (1 - tolerance):
+            regressions.append(f"{key}: throughput {result.throughput:,.0f}/s is below the baseline's "
+                               f"{baseline_result['throughput']:,.0f}/s")
+        baseline_memory = baseline_result.get("peak_memory_bytes")
+        if result.peak_memory_bytes is not None and baseline_memory is not None \
+                and result.peak_memory_bytes > baseline_memory * (1 + tolerance):
+            regressions.append(f"{key}: peak memory {result.peak_memory_bytes / 2**20:,.1f} MiB is above the "
+                               f"baseline's {baseline_memory / 2**20:,.1f} MiB")
+    return regressions
+
+
+def load_baseline(baseline_path: str) -> dict[str, dict]:
+    if not os.path.exists(baseline_path):
+        return {}
+    with open(baseline_path, "r") as baseline_file:
+        return json.load(baseline_file)["results"]
+
+
+def save_baseline(baseline_path: str, results: dict[str, BenchmarkResult]):
+    # Merged into what's there, so a partial (`--only`) run only replaces what it measured
+    merged_results = load_baseline(baseline_path)
+    merged_results.update({ key : asdict(result) for key, result in results.items() })
+    with open(baseline_path, "w") as baseline_file:
+        json.dump({"python": platform.python_version(), "machine": platform.machine(),
+                   "results": dict(sorted(merged_results.items()))}, baseline_file, indent=2)
+
+
+def _format_row(key: str, unit: str, result: BenchmarkResult, baseline_result: dict | None) -> str:
+    memory = f"{result.peak_memory_bytes / 2**20:9.1f} MiB" if result.peak_memory_bytes is not None else "        -    "
+    change = ""
+    if baseline_result is not None:
+        change = f"  ({result.throughput / baseline_result['throughput'] - 1:+.0%} vs baseline)"
+    return f"{key:>36}: {result.seconds * 1000:10.1f} ms {result.throughput:14,.0f} {unit}/s {memory}{change}"
+
+
+def main():
+    parser = argparse.ArgumentParser(description="throughput and peak memory of bsander's resolution pipeline")
+    parser.add_argument("--scale", choices=["default", "large"], default="default",
+                        help="`large` adds the biggest inputs (documents of up to a million addresses)")
+    parser.add_argument("--only", nargs="+", choices=[benchmark.name for benchmark in BENCHMARKS],
+                        help="run only these benchmarks")
+    parser.add_argument("--repeats", type=int, default=3, help="timed runs per case; the best is kept")
+    parser.add_argument("--no-memory", action="store_true", help="skip the (slow) peak memory measurement")
+    parser.add_argument("--baseline", type=str, default=DEFAULT_BASELINE_PATH, help="baseline file to compare against")
+    parser.add_argument("--save-baseline", action="store_true", help="record these results as the baseline")
+    parser.add_argument("--tolerance", type=float, default=DEFAULT_TOLERANCE,
+                        help="fractional slowdown (or memory growth) tolerated before a result counts as a regression")
+    args = parser.parse_args()
+
+    baseline = load_baseline(args.baseline)
+    results: dict[str, BenchmarkResult] = {}
+    for benchmark in BENCHMARKS:
+        if args.only is not None and benchmark.name not in args.only:
+            continue
+        sizes = benchmark.sizes + (benchmark.large_sizes if args.scale == "large" else ())
+        for size in sizes:
+            key = f"{benchmark.name}@{size}"
+            with tempfile.TemporaryDirectory() as scratch_dir:
+                with contextlib.redirect_stdout(io.StringIO()):
+                    case = benchmark.set_up(size, scratch_dir)
+                try:
+                    results[key] = run_benchmark_case(case, args.repeats, not args.no_memory)
+                finally:
+                    case.cleanup()
+            print(_format_row(key, benchmark.unit, results[key], baseline.get(key)), flush=True)
+
+    if args.save_baseline:
+        save_baseline(args.baseline, results)
+        print(f"Baseline saved to `{args.baseline}`")
+        return
+    regressions = find_regressions(results, baseline, args.tolerance)
+    for regression in regressions:
+        print(f"REGRESSION {regression}", file=sys.stderr)
+    if len(regressions) != 0:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
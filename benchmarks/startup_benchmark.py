@@ -0,0 +1,70 @@
+### Measures cold CLI startup: every run is a fresh interpreter, the way shell loops over many inputs invoke bsander.
+### Usage: `python benchmarks/startup_benchmark.py [--runs N] [--import-profile]`
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+_repository_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+_main_path = os.path.join(_repository_dir, "main.py")
+_sample_document = {"state": {"simulate": {"address": "pypi:numpy[>=2.0.0]@numpy.random.rand"}}}
+
+
+def time_command(command: list[str], runs: int, environment: dict[str, str]) -> list[float]:
+    durations: list[float] = []
+    for _ in range(runs):
+        start = time.perf_counter()
+        subprocess.run(command, cwd=_repository_dir, env=environment, check=True,
+                       stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+        durations.append(time.perf_counter() - start)
+    return durations
+
+
+def report_slowest_imports(command: list[str], environment: dict[str, str], count: int = 15):
+    completed = subprocess.run([sys.executable, "-X", "importtime"] + command[1:], cwd=_repository_dir,
+                               env=environment, stdout=subprocess.DEVNULL, stderr=subprocess.PIPE, text=True)
+    cumulative_times: list[tuple[int, str]] = []
+    for line in completed.stderr.splitlines():
+        if not line.startswith("import time:") or "cumulative" in line:
+            continue
+        _, cumulative, module_name = line[len("import time:"):].split("|")
+        cumulative_times.append((int(cumulative), module_name.rstrip()))
+    for cumulative, module_name in sorted(cumulative_times, reverse=True)[:count]:
+        print(f"    {cumulative / 1000:8.1f} ms {module_name}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="cold-start timings for `main.py`")
+    parser.add_argument("--runs", type=int, default=10)
+    parser.add_argument("--import-profile", action="store_true",
+                        help="also list the imports with the highest cumulative time for each scenario")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmpdir:
+        document_path = os.path.join(tmpdir, "experiment.pbif")
+        with open(document_path, "w") as document_file:
+            json.dump(_sample_document, document_file)
+        output_dir = os.path.join(tmpdir, "out")
+        os.mkdir(output_dir)
+        # A private cache, warmed by a first untimed run, so every scenario measures the steady state of a shell loop
+        environment = dict(os.environ, BSANDER_CACHE_DIR=os.path.join(tmpdir, "cache"))
+        scenarios = {
+            "--help": [sys.executable, _main_path, "--help"],
+            "validation only": [sys.executable, _main_path, document_path, "-o", output_dir],
+            "interpreter only": [sys.executable, "-c", "pass"],
+        }
+        time_command(scenarios["validation only"], 1, environment)
+        for scenario_name, command in scenarios.items():
+            durations = time_command(command, args.runs, environment)
+            print(f"{scenario_name:>16}: median {statistics.median(durations) * 1000:7.1f} ms, "
+                  f"min {min(durations) * 1000:7.1f} ms, max {max(durations) * 1000:7.1f} ms ({args.runs} runs)")
+            if args.import_profile and command[1] == _main_path:
+                report_slowest_imports(command, environment)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,83 @@
+### Generators for synthetic benchmark inputs: PBIF documents of any size, OMEX archives holding many of them, and fake
+### installed distributions for the local registry to discover. Everything is deterministic for a given size.
+import json
+import os
+import zipfile
+
+DEFAULT_PACKAGE_COUNT: int = 50  # distinct packages a document's addresses are spread over
+_omex_manifest_header = '<?xml version="1.0" encoding="UTF-8"?>\n' \
+                        '<omexManifest xmlns="http://identifiers.org/combine.specifications/omex-manifest">\n'
+
+
+def generate_address(index: int, package_count: int = DEFAULT_PACKAGE_COUNT) -> str:
+    package_index = index % package_count
+    return f"pypi:package-{package_index}[>=1.{package_index % 7}]@package_{package_index}.processes.Process{index}"
+
+
+def generate_pbif_document(address_count: int, package_count: int = DEFAULT_PACKAGE_COUNT) -> str:
+    # A flat composite of processes, each with config and ports, formatted the way documents are usually written
+    state = {
+        f"process_{index}": {
+            "_type": "process",
+            "address": generate_address(index, package_count),
+            "config": {"rate": index * 0.001, "description": f"synthetic process {index}"},
+            "inputs": {"species": ["species_store"]},
+            "outputs": {"species": ["species_store"]},
+        } for index in range(address_count)
+    }
+    return json.dumps({"state": state}, indent=2)
+
+
+def generate_address_listing(address_count: int, package_count: int = DEFAULT_PACKAGE_COUNT) -> str:
+    # The non-JSON form: one quoted address per line
+    return "\n".join(json.dumps(generate_address(index, package_count)) for index in range(address_count))
+
+
+def write_omex_archive(archive_path: str, document_count: int, addresses_per_document: int,
+                       data_member_bytes: int = 1 << 20) -> int:
+    # Every document is listed in the manifest, next to an incompressible data member of the given size.
+    # Returns the total number of addresses in the archive.
+    manifest_entries: list[str] = []
+    with zipfile.ZipFile(archive_path, "w", zipfile.ZIP_DEFLATED) as archive:
+        for document_index in range(document_count):
+            member_name = f"experiments/experiment_{document_index}.pbif"
+            archive.writestr(member_name, generate_pbif_document(addresses_per_document))
+            manifest_entries.append(f'  <content location="./{member_name}" format="pbif"/>\n')
+        archive.writestr("data/results.h5", os.urandom(data_member_bytes))
+        manifest_entries.append('  <content location="./data/results.h5" format="application/x-hdf5"/>\n')
+        archive.writestr("manifest.xml", _omex_manifest_header + "".join(manifest_entries) + "</omexManifest>\n")
+    return document_count * addresses_per_document
+
+
+def write_fake_distributions(site_dir: str, distribution_count: int, modules_per_distribution: int = 5,
+                             classes_per_module: int = 10) -> int:
+    # Installs (as far as `importlib.metadata` can tell) distributions that require bsail, each with modules of
+    # Process subclasses that static discovery can resolve without importing anything. Returns the class count.
+    os.makedirs(site_dir, exist_ok=True)
+    for distribution_index in range(distribution_count):
+        package_name = f"fake_simulator_{distribution_index}"
+        record_lines: list[str] = []
+        for module_index in range(modules_per_distribution):
+            relative_path = f"{package_name}/module_{module_index}.py"
+            classes = "\n".join(
+                f"class Process{class_index}(pb.Process):\n"
+                f"    config_schema = {{'rate': 'float'}}\n\n"
+                f"    def inputs(self):\n        return {{'species': 'map[float]'}}\n"
+                for class_index in range(classes_per_module))
+            _write_file(os.path.join(site_dir, relative_path), "import process_bigraph as pb\n\n\n" + classes)
+            record_lines.append(f"{relative_path},,")
+        _write_file(os.path.join(site_dir, package_name, "__init__.py"), "")
+        record_lines.append(f"{package_name}/__init__.py,,")
+        dist_info_dir = os.path.join(site_dir, f"{package_name}-1.0.dist-info")
+        _write_file(os.path.join(dist_info_dir, "METADATA"),
+                    f"Metadata-Version: 2.1\nName: fake-simulator-{distribution_index}\nVersion: 1.0\n"
+                    f"Requires-Dist: bsail (>=0.1,<1.0)\n")
+        record_lines.append(f"{package_name}-1.0.dist-info/METADATA,,")
+        _write_file(os.path.join(dist_info_dir, "RECORD"), "\n".join(record_lines) + "\n")
+    return distribution_count * modules_per_distribution * classes_per_module
+
+
+def _write_file(path: str, contents: str):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, "w") as output_file:
+        output_file.write(contents)
@@ -0,0 +1,89 @@
+### File with bsander's in-process API: PBIF content goes in, and the environment it needs comes back as a model (its
+### dependencies, the localized document, and the rendered container build files). Nothing is written to the
+### filesystem; the only thing read is the local registry, and only for documents with abstract processes when no
+### registry is handed in.
+import json
+from dataclasses import dataclass, field
+from typing import IO
+
+from bsander.bsandr_utils.input_types import ContainerizationEngine, DockerfileTemplateMode
+from bsander.bsandr_utils.instrumentation import span, count
+from bsander.pbic3g.registry_cache import RegistryEntry
+
+
+@dataclass
+class ResolvedEnvironment:
+    pypi_deps: list[str]
+    conda_deps: list[str]
+    localized_document: str  # every dependency address rewritten to the `local` protocol; formatting is kept
+    container_files: dict[str, str] = field(default_factory=dict)  # file name -> contents, for the requested engine
+    lockfiles: dict[str, str] = field(default_factory=dict)  # lockfile name -> contents, when lock sources were given
+    image_tag: str | None = None  # identical environments share it (the same tag a file-based run reports)
+    abstract_processes_resolved: int = 0
+
+    def load_localized_document(self) -> dict:
+        return json.loads(self.localized_document)
+
+
+def resolve_environment(pb_document: str | bytes | dict | IO,
+                        whitelist_entries: list[str] | None = None,
+                        containerization_engine: ContainerizationEngine = ContainerizationEngine.DOCKER,
+                        template_mode: DockerfileTemplateMode = DockerfileTemplateMode.GENERIC,
+                        local_registry: dict[str, list[RegistryEntry]] | None = None,
+                        pypi_lock_index: str | None = None, conda_lock_channel: str | None = None,
+                        conda_lock_channel_url: str | None = None) -> ResolvedEnvironment:
+    # The in-memory counterpart of a single-container `execute_bsander` run. `ContainerizationEngine.NONE` only
+    # resolves and localizes. Raises what a run would (e.g. `ValueError` for untrusted packages or documents without
+    # dependencies, `AbstractResolutionError` for abstract processes nothing registered fits).
+    from bsander.pbic3g.abstract_resolution import contains_abstract_processes, get_implementation_index, \
+        resolve_abstract_text
+    from bsander.pbic3g.containerization.container_constructor import localize_document_text
+    from bsander.pbic3g.containerization.container_environment import ContainerEnvironment, get_engine_templates, \
+        render_container_files
+    from bsander.pbic3g.containerization.output_cache import compute_environment_hash, get_environment_image_tag
+    from bsander.pbic3g.dependency_resolution.lockfile import generate_lockfiles, DEFAULT_CONDA_CHANNEL_URL
+    from bsander.pbic3g.local_registry import load_local_modules
+    pb_document_str = read_pbif_content(pb_document)
+    with span("resolve_environment"):
+        resolved_count = 0
+        if contains_abstract_processes(pb_document_str):
+            if local_registry is None:
+                with span("load_local_modules"):
+                    local_registry = load_local_modules()
+            with span("resolve_abstracts"):
+                pb_document_str, resolved_count = resolve_abstract_text(pb_document_str,
+                                                                        get_implementation_index(local_registry))
+        with span("localize"):
+            pypi_deps, conda_deps, localized_document = localize_document_text(pb_document_str, whitelist_entries)
+        count("abstract_processes_resolved", resolved_count)
+        resolved_environment = ResolvedEnvironment(pypi_deps, conda_deps, localized_document,
+                                                   abstract_processes_resolved=resolved_count)
+        if containerization_engine == ContainerizationEngine.NONE:
+            return resolved_environment
+
+        with span("generate_lockfiles"):
+            resolved_environment.lockfiles = generate_lockfiles(pypi_deps, conda_deps, pypi_lock_index,
+                                                                conda_lock_channel,
+                                                                conda_lock_channel_url or DEFAULT_CONDA_CHANNEL_URL)
+        environment = ContainerEnvironment(pypi_deps, conda_deps, template_mode, set(resolved_environment.lockfiles))
+        with span("render_container_files"):
+            resolved_environment.container_files = render_container_files(environment, containerization_engine)
+        environment_hash = compute_environment_hash(get_engine_templates(containerization_engine, template_mode),
+                                                    pypi_deps, conda_deps, containerization_engine,
+                                                    resolved_environment.lockfiles)
+        resolved_environment.image_tag = get_environment_image_tag(environment_hash)
+        return resolved_environment
+
+
+def read_pbif_content(pb_document: str | bytes | dict | IO) -> str:
+    # Documents given as a dictionary are serialized; byte content (and binary streams) must be UTF-8
+    if isinstance(pb_document, dict):
+        return json.dumps(pb_document, indent=2)
+    if hasattr(pb_document, "read"):
+        pb_document = pb_document.read()
+    if isinstance(pb_document, (bytes, bytearray, memoryview)):
+        return bytes(pb_document).decode("utf-8")
+    if isinstance(pb_document, str):
+        return pb_document
+    raise TypeError(f"PBIF content must be text, bytes, a dictionary, or a stream of them; got "
+                    f"`{type(pb_document).__name__}`")
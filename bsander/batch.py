@@ -0,0 +1,120 @@
+import dataclasses
+import glob
+import json
+import os
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass, asdict
+
+from bsander.bsandr_utils.input_types import ProgramArguments
+from bsander.bsandr_utils.instrumentation import span, carry_context
+from bsander.execution import execute_bsander
+from bsander.pbic3g.local_registry import load_local_modules
+from bsander.pbic3g.registry_cache import RegistryEntry
+
+SUPPORTED_INPUT_SUFFIXES: tuple[str, ...] = (".json", ".pbif", ".zip", ".omex")
+MANIFEST_SUFFIXES: tuple[str, ...] = (".txt", ".lst", ".manifest")
+BATCH_REPORT_FILE_NAME: str = "bsander_batch_report.json"
+
+
+@dataclass
+class BatchInputResult:
+    input_file_path: str
+    output_dir: str
+    succeeded: bool
+    duration_seconds: float
+    error: str | None = None
+    image_tag: str | None = None
+
+
+def collect_batch_inputs(batch_source: str) -> list[str]:
+    # A batch source is either a directory (searched recursively), a manifest listing one input per line
+    # (relative paths are relative to the manifest; `#` starts a comment), or a glob pattern.
+    candidate_paths: list[str]
+    if os.path.isdir(batch_source):
+        candidate_paths = glob.glob(os.path.join(glob.escape(batch_source), "**", "*"), recursive=True)
+    elif os.path.isfile(batch_source) and batch_source.endswith(MANIFEST_SUFFIXES):
+        manifest_dir = os.path.dirname(os.path.abspath(batch_source))
+        candidate_paths = []
+        with open(batch_source, "r") as manifest_file:
+            for line in manifest_file:
+                entry = line.split("#", 1)[0].strip()
+                if entry == "":
+                    continue
+                entry_path = os.path.join(manifest_dir, os.path.expanduser(entry))
+                if not os.path.isfile(entry_path):
+                    raise ValueError(f"manifest `{batch_source}` lists `{entry}`, which is not a file that exists")
+                candidate_paths.append(entry_path)
+    else:
+        candidate_paths = glob.glob(os.path.expanduser(batch_source), recursive=True)
+    input_file_paths = sorted({os.path.abspath(path) for path in candidate_paths
+                               if os.path.isfile(path) and path.endswith(SUPPORTED_INPUT_SUFFIXES)})
+    if len(input_file_paths) == 0:
+        raise ValueError(f"No JSON/PBIF or ZIP/OMEX inputs found for batch source `{batch_source}`")
+    return input_file_paths
+
+
+def execute_bsander_batch(input_file_paths: list[str], shared_program_arguments: ProgramArguments,
+                          max_workers: int | None = None,
+                          local_registry: dict[str, list[RegistryEntry]] | None = None) -> list[BatchInputResult]:
+    # Every input gets its own sub-directory of `shared_program_arguments.output_dir`, named after the input
+    batch_start = time.perf_counter()
+    if local_registry is None:
+        with span("load_local_modules"):
+            local_registry = load_local_modules(use_cache=shared_program_arguments.use_cache)  # once, for every input
+    registry_load_duration = time.perf_counter() - batch_start
+    output_dirs = _assign_output_directories(input_file_paths, shared_program_arguments.output_dir)
+
+    def process_input(input_file_path: str) -> BatchInputResult:
+        input_start = time.perf_counter()
+        output_dir = output_dirs[input_file_path]
+        try:
+            os.makedirs(output_dir, exist_ok=True)
+            image_tag = execute_bsander(dataclasses.replace(shared_program_arguments, input_file_path=input_file_path,
+                                                            output_dir=output_dir), local_registry)
+        except Exception as e:
+            print(f"error: `{input_file_path}` failed: {e}", file=sys.stderr)
+            return BatchInputResult(input_file_path, output_dir, False, time.perf_counter() - input_start, str(e))
+        return BatchInputResult(input_file_path, output_dir, True, time.perf_counter() - input_start,
+                                image_tag=image_tag)
+
+    max_workers = max_workers if max_workers is not None else (os.cpu_count() or 1)
+    with ThreadPoolExecutor(max_workers=max(1, max_workers)) as executor:
+        results = list(executor.map(carry_context(process_input), input_file_paths))
+    write_batch_report(results, shared_program_arguments.output_dir, time.perf_counter() - batch_start,
+                       registry_load_duration)
+    return results
+
+
+def write_batch_report(results: list[BatchInputResult], output_dir: str, total_duration: float,
+                       registry_load_duration: float) -> str:
+    report_path = os.path.join(output_dir, BATCH_REPORT_FILE_NAME)
+    failed_count = len([result for result in results if not result.succeeded])
+    report = {
+        "total_inputs": len(results),
+        "succeeded": len(results) - failed_count,
+        "failed": failed_count,
+        "total_duration_seconds": total_duration,
+        "registry_load_duration_seconds": registry_load_duration,
+        "inputs": [asdict(result) for result in results],
+    }
+    with open(report_path, "w") as report_file:
+        json.dump(report, report_file, indent=2)
+    print(f"Batch complete: {len(results) - failed_count}/{len(results)} succeeded; report at `{report_path}`")
+    return report_path
+
+
+def _assign_output_directories(input_file_paths: list[str], output_dir: str) -> dict[str, str]:
+    output_dirs: dict[str, str] = {}
+    used_names: set[str] = set()
+    for input_file_path in input_file_paths:
+        base_name = os.path.basename(input_file_path).split(".")[0]
+        candidate_name = base_name
+        suffix = 1
+        while candidate_name in used_names:  # e.g. `a/model.omex` and `b/model.omex`
+            suffix += 1
+            candidate_name = f"{base_name}_{suffix}"
+        used_names.add(candidate_name)
+        output_dirs[input_file_path] = os.path.join(output_dir, candidate_name)
+    return output_dirs
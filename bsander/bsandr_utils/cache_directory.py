@@ -0,0 +1,15 @@
+# This file contains utility functions to locate where bsander may persist data between runs
+import os
+
+
+def get_cache_directory() -> str:
+    cache_dir = os.environ.get("BSANDER_CACHE_DIR")
+    if cache_dir is None:
+        xdg_cache_home = os.environ.get("XDG_CACHE_HOME", os.path.join(os.path.expanduser("~"), ".cache"))
+        cache_dir = os.path.join(xdg_cache_home, "bsander")
+    os.makedirs(cache_dir, exist_ok=True)
+    return cache_dir
+
+
+def get_cache_file_path(file_name: str) -> str:
+    return os.path.join(get_cache_directory(), file_name)
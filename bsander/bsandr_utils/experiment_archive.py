@@ -1,32 +1,171 @@
 # This file contains utility functions to deal with parsing input archives for relevant info
+import copy
 import os
+import shutil
+import struct
+import tempfile
+import xml.etree.ElementTree as ElementTree
 import zipfile
 
-def _extract_pbif_from_zip(archive_path: str, output_dir: str) -> str:
+OMEX_MANIFEST_NAME: str = "manifest.xml"
+_pbif_suffixes = (".pbif", ".json")
+_pbif_format_marker = "pbif"
+_json_format_suffix = "application/json"
+_copy_chunk_size = 1 << 20
+_data_descriptor_flag = 0x08
+_zip64_extra_id = 0x0001
+# The local file header, per the ZIP specification (APPNOTE 4.3.7): signature, then fixed fields up to the name and
+# extra field lengths (the last two)
+_local_header_format = "<4s5H3L2H"
+_local_header_size = struct.calcsize(_local_header_format)
+_local_header_signature = b"PK\x03\x04"
+_extra_field_header_format = "<2H"
+_extra_field_header_size = struct.calcsize(_extra_field_header_format)
+# What appending already-compressed members to a `zipfile.ZipFile` relies on; none of it is documented, so the raw copy
+# is only used when all of it is there
+_raw_copy_archive_attributes = ("fp", "filelist", "NameToInfo", "start_dir", "_didModify")
+
+def _extract_pbifs_from_zip(archive_path: str, output_dir: str) -> list[str]:
     archive_shortname = os.path.basename(archive_path).split(".")[0]
     extraction_destination = os.path.join(output_dir, archive_shortname)
     os.makedirs(extraction_destination, exist_ok=True)
-    target_pbif = None
     with zipfile.ZipFile(archive_path) as archive:
-        for name in archive.namelist():
-            current_file = archive.extract(name, extraction_destination)
-            if (not name.endswith(".pbif") and not name.endswith(".json") or "/__MACOSX/._" in current_file):
-                continue
-            target_pbif = current_file # Note: This scheme does not support multiple pbif!
-            #TODO: Allow for multi-pbif files? May require omex enforcment...
-    if target_pbif is None:
+        archive.extractall(extraction_destination)
+        member_names = _find_pbif_member_names(archive)
+    if len(member_names) == 0:
         raise ValueError(f"Could not locate Process Bigraph Intermediate Format file within archive: {archive_path}")
-    return target_pbif
+    return [os.path.join(extraction_destination, *member_name.split("/")) for member_name in member_names]
 
-def _extract_pbif_from_omex(archive_path: str, output_dir: str):
-    # At the moment, we're not doing anything complicated...
-    return _extract_pbif_from_zip(archive_path, output_dir)
+def _extract_pbifs_from_omex(archive_path: str, output_dir: str) -> list[str]:
+    # OMEX archives are zip archives; their manifest (if any) is honoured by `_find_pbif_member_names`
+    return _extract_pbifs_from_zip(archive_path, output_dir)
 
-def extract_archive_returning_pbif_path(archive_path: str, output_dir: str):
+def extract_archive_returning_pbif_paths(archive_path: str, output_dir: str) -> list[str]:
     if archive_path.endswith(".omex"):
-        return _extract_pbif_from_omex(archive_path, output_dir)
+        return _extract_pbifs_from_omex(archive_path, output_dir)
     elif archive_path.endswith(".zip"):
-        return _extract_pbif_from_zip(archive_path, output_dir)
+        return _extract_pbifs_from_zip(archive_path, output_dir)
     else:
         raise Exception(f"Unsupported archive: {archive_path}")
 
+def extract_archive_returning_pbif_path(archive_path: str, output_dir: str):
+    # For callers that expect a single document: the last one found
+    return extract_archive_returning_pbif_paths(archive_path, output_dir)[-1]
+
+
+def _find_pbif_member_names(archive: zipfile.ZipFile) -> list[str]:
+    archive_names = set(archive.namelist())
+    manifest_names: list[str] = []
+    if OMEX_MANIFEST_NAME in archive_names:
+        try:
+            manifest = ElementTree.fromstring(archive.read(OMEX_MANIFEST_NAME))
+        except ElementTree.ParseError as e:
+            raise ValueError(f"invalid OMEX manifest: {e}") from e
+        for content in manifest.iter():
+            if not content.tag.endswith("content"):
+                continue
+            location = content.get("location", "").removeprefix("./")
+            content_format = content.get("format", "").lower()
+            if location not in archive_names or location == OMEX_MANIFEST_NAME:
+                continue
+            # The manifest's format is trusted over the name: a `.json` of results isn't a document
+            if location.endswith(".pbif") or _pbif_format_marker in content_format \
+                    or (location.endswith(".json") and content_format.endswith(_json_format_suffix)):
+                manifest_names.append(location)
+    if len(manifest_names) != 0:
+        return manifest_names
+    # Plain zip archives (or manifests that don't list the document): fall back to the file names
+    return [name for name in archive.namelist() if name.endswith(_pbif_suffixes) and "__MACOSX/" not in name]
+
+
+################################################################################
+# Streaming mode: only PBIF members are ever read (and so decompressed); everything else is copied as raw bytes
+################################################################################
+def read_archive_pbif_documents(archive_path: str) -> dict[str, str]:
+    # Returns member name -> document text, for every PBIF member (in manifest order, when there is one)
+    with zipfile.ZipFile(archive_path) as archive:
+        member_names = _find_pbif_member_names(archive)
+        if len(member_names) == 0:
+            raise ValueError(f"Could not locate Process Bigraph Intermediate Format file within archive: {archive_path}")
+        return {member_name: archive.read(member_name).decode("utf-8") for member_name in member_names}
+
+
+def write_archive_with_replacements(source_archive_path: str, destination_archive_path: str,
+                                    replacements: dict[str, str]):
+    # Writes a copy of the source archive where `replacements` (member name -> new text) are re-compressed, and every
+    # other member's compressed bytes are copied verbatim. The destination may be the source archive itself.
+    if len(replacements) == 0:
+        if os.path.abspath(source_archive_path) != os.path.abspath(destination_archive_path):
+            shutil.copyfile(source_archive_path, destination_archive_path)
+        return
+    destination_dir = os.path.dirname(os.path.abspath(destination_archive_path))
+    file_descriptor, temp_path = tempfile.mkstemp(dir=destination_dir, prefix=".bsander-", suffix=".zip")
+    os.close(file_descriptor)
+    try:
+        with zipfile.ZipFile(source_archive_path) as source_archive, \
+                open(source_archive_path, "rb") as source_file, \
+                zipfile.ZipFile(temp_path, "w") as destination_archive:
+            can_copy_raw = _can_copy_raw_members(destination_archive)
+            for info in source_archive.infolist():
+                if info.filename in replacements:
+                    replaced_info = zipfile.ZipInfo(info.filename, info.date_time)
+                    replaced_info.compress_type = info.compress_type
+                    replaced_info.external_attr = info.external_attr
+                    replaced_info.create_system = info.create_system
+                    destination_archive.writestr(replaced_info, replacements[info.filename].encode("utf-8"))
+                elif can_copy_raw:
+                    _copy_raw_member(source_file, info, destination_archive)
+                else:  # decompresses and recompresses the member, but produces the same archive
+                    destination_archive.writestr(copy.copy(info), source_archive.read(info))
+        os.replace(temp_path, destination_archive_path)
+    finally:
+        if os.path.exists(temp_path):
+            os.remove(temp_path)
+
+
+def _can_copy_raw_members(destination_archive: zipfile.ZipFile) -> bool:
+    return all(hasattr(destination_archive, attribute) for attribute in _raw_copy_archive_attributes) \
+        and hasattr(zipfile.ZipInfo, "FileHeader")
+
+
+def _copy_raw_member(source_file, info: zipfile.ZipInfo, destination_archive: zipfile.ZipFile):
+    # `zipfile` has no public API for this, so the local header is rebuilt from the central directory entry and the
+    # compressed data is streamed across untouched. The source's local header is only read for its variable length.
+    source_file.seek(info.header_offset)
+    local_header = struct.unpack(_local_header_format, source_file.read(_local_header_size))
+    if local_header[0] != _local_header_signature:
+        raise ValueError(f"corrupt archive member: {info.filename}")
+    file_name_length, extra_field_length = local_header[-2:]
+    source_file.seek(file_name_length + extra_field_length, os.SEEK_CUR)
+    copied_info = copy.copy(info)
+    copied_info.flag_bits &= ~_data_descriptor_flag  # sizes are known up front, so they go in the local header
+    copied_info.extra = _strip_extra_fields(info.extra, _zip64_extra_id)  # rewritten if (and as) still needed
+    requires_zip64 = info.file_size > zipfile.ZIP64_LIMIT or info.compress_size > zipfile.ZIP64_LIMIT
+    destination_file = destination_archive.fp
+    copied_info.header_offset = destination_file.tell()
+    destination_file.write(copied_info.FileHeader(requires_zip64))
+    remaining_bytes = info.compress_size
+    while remaining_bytes > 0:
+        chunk = source_file.read(min(remaining_bytes, _copy_chunk_size))
+        if len(chunk) == 0:
+            raise ValueError(f"truncated archive member: {info.filename}")
+        destination_file.write(chunk)
+        remaining_bytes -= len(chunk)
+    destination_archive.filelist.append(copied_info)
+    destination_archive.NameToInfo[copied_info.filename] = copied_info
+    destination_archive.start_dir = destination_file.tell()
+    destination_archive._didModify = True
+
+
+def _strip_extra_fields(extra: bytes, field_id: int) -> bytes:
+    # Extra fields are `(id, size)` headers each followed by `size` bytes (APPNOTE 4.5); anything malformed is kept
+    kept_fields: list[bytes] = []
+    position = 0
+    while position + _extra_field_header_size <= len(extra):
+        current_id, size = struct.unpack_from(_extra_field_header_format, extra, position)
+        field_end = position + _extra_field_header_size + size
+        if current_id != field_id:
+            kept_fields.append(extra[position:field_end])
+        position = field_end
+    kept_fields.append(extra[position:])
+    return b"".join(kept_fields)
@@ -1,4 +1,4 @@
-from dataclasses import dataclass
+from dataclasses import dataclass, fields
 from enum import Enum
 
 
@@ -15,6 +15,16 @@ class ContainerizationEngine(Enum):
     BOTH=3
 
 
+class DockerfileTemplateMode(Enum):
+    GENERIC=0
+    OPTIMIZED=1  # merged layers + BuildKit cache mounts; stable layers ordered before volatile ones
+
+
+class ArchiveMode(Enum):
+    EXTRACT=0  # extract every member, then re-zip the extracted directory
+    STREAMING=1  # read only the PBIF members; copy every other member's compressed bytes as-is
+
+
 @dataclass
 class ProgramArguments:
     input_file_path: str
@@ -22,3 +32,47 @@ class ProgramArguments:
     whitelist_entries: list[str]
     containerization_type: ContainerizationTypes
     containerization_engine: ContainerizationEngine
+    # Reuse the on-disk registry and container file caches between runs
+    use_cache: bool = True
+    template_mode: DockerfileTemplateMode = DockerfileTemplateMode.GENERIC
+    archive_mode: ArchiveMode = ArchiveMode.EXTRACT
+    # When set, `input_file_path` is a directory, glob, or manifest of many inputs
+    batch_mode: bool = False
+    batch_workers: int | None = None
+    # Local (offline) package sources to pin dependencies against; when set, builds install from generated lockfiles
+    pypi_lock_index: str | None = None
+    conda_lock_channel: str | None = None
+    conda_lock_channel_url: str = "https://conda.anaconda.org/conda-forge"
+    # Re-localize only what changed since the last run into the same output directory (single documents only)
+    incremental: bool = False
+    # Where to write a timing report (Chrome trace format, with a summary) of the run; not profiled when unset
+    profile_path: str | None = None
+    # Read plain documents straight from the input, writing only the resolved output document (instead of copying the
+    # input into `output_dir` and resolving the copy in place)
+    zero_copy: bool = False
+
+
+
+def program_arguments_to_json(program_arguments: ProgramArguments) -> dict:
+    # Enums travel by name, so both ends only need to agree on the names
+    raw_arguments = {}
+    for field in fields(program_arguments):
+        value = getattr(program_arguments, field.name)
+        raw_arguments[field.name] = value.name if isinstance(value, Enum) else value
+    return raw_arguments
+
+
+def program_arguments_from_json(raw_arguments: dict) -> ProgramArguments:
+    known_fields = { field.name : field for field in fields(ProgramArguments) }
+    unknown_fields = set(raw_arguments) - set(known_fields)
+    if len(unknown_fields) != 0:
+        raise ValueError(f"unknown program arguments: {', '.join(sorted(unknown_fields))}")
+    arguments = {}
+    for name, value in raw_arguments.items():
+        field_type = known_fields[name].type
+        if isinstance(field_type, type) and issubclass(field_type, Enum):
+            if value not in field_type.__members__:
+                raise ValueError(f"`{value}` is not a valid {field_type.__name__}")
+            value = field_type[value]
+        arguments[name] = value
+    return ProgramArguments(**arguments)
@@ -0,0 +1,176 @@
+### File that instruments bsander's pipeline: stages are timed as (nested) spans, and counters tally the work done
+### (addresses localized, bytes read and written, ...). Nothing is recorded unless a profiler is active in the current
+### context (see `profiling`) or a hook is registered (see `add_span_hook`), so instrumented code pays next to nothing
+### otherwise. Reports are Chrome trace files (open them in `chrome://tracing` or Perfetto) that also carry a summary.
+import contextvars
+import json
+import os
+import sys
+import threading
+import time
+from contextlib import contextmanager
+from dataclasses import dataclass, field
+from typing import Callable, Iterator
+
+try:
+    import resource
+except ImportError:  # not available on Windows; peak memory is then left out
+    resource = None
+
+
+@dataclass
+class SpanRecord:
+    name: str
+    start_time: float  # `time.perf_counter()` when the span began
+    duration_seconds: float
+    thread_id: int
+    depth: int  # how many spans enclose this one
+    attributes: dict = field(default_factory=dict)
+    peak_memory_bytes: int | None = None  # the process' peak resident memory when the span ended
+
+
+@dataclass
+class ProfileReport:
+    duration_seconds: float
+    spans: list[SpanRecord]
+    counters: dict[str, int]
+    peak_memory_bytes: int | None
+    start_time: float
+
+    def get_stage_durations(self) -> dict[str, float]:
+        # Total seconds spent in each kind of span (spans of the same name on several threads add up)
+        stage_durations: dict[str, float] = {}
+        for span_record in self.spans:
+            stage_durations[span_record.name] = stage_durations.get(span_record.name, 0.0) \
+                                                + span_record.duration_seconds
+        return stage_durations
+
+    def to_chrome_trace(self) -> dict:
+        process_id = os.getpid()
+        trace_events = [{"name": span_record.name, "cat": "bsander", "ph": "X", "pid": process_id,
+                         "tid": span_record.thread_id,
+                         "ts": (span_record.start_time - self.start_time) * 1e6,
+                         "dur": span_record.duration_seconds * 1e6,
+                         "args": dict(span_record.attributes, peak_memory_bytes=span_record.peak_memory_bytes)}
+                        for span_record in self.spans]
+        trace_events.append({"name": "counters", "cat": "bsander", "ph": "C", "pid": process_id, "tid": 0,
+                             "ts": self.duration_seconds * 1e6, "args": self.counters})
+        return {
+            "traceEvents": trace_events,
+            "displayTimeUnit": "ms",
+            "bsander": {  # trace viewers ignore this; it's the summary for everything else
+                "duration_seconds": self.duration_seconds,
+                "peak_memory_bytes": self.peak_memory_bytes,
+                "counters": self.counters,
+                "stage_durations_seconds": self.get_stage_durations(),
+            },
+        }
+
+
+class Profiler:
+    def __init__(self):
+        self.start_time: float = time.perf_counter()
+        self.spans: list[SpanRecord] = []
+        self.counters: dict[str, int] = {}
+        self._lock = threading.Lock()  # spans and counts arrive from worker threads too
+        self._module_count_at_start = len(sys.modules)
+
+    def record_span(self, span_record: SpanRecord):
+        with self._lock:
+            self.spans.append(span_record)
+
+    def add(self, counter_name: str, amount: int):
+        with self._lock:
+            self.counters[counter_name] = self.counters.get(counter_name, 0) + amount
+
+    def report(self) -> ProfileReport:
+        with self._lock:
+            counters = dict(self.counters)
+            counters["modules_imported"] = max(0, len(sys.modules) - self._module_count_at_start)
+            spans = sorted(self.spans, key=lambda span_record: span_record.start_time)
+        return ProfileReport(time.perf_counter() - self.start_time, spans, counters, get_peak_memory_bytes(),
+                             self.start_time)
+
+
+_active_profiler: contextvars.ContextVar[Profiler | None] = contextvars.ContextVar("bsander_profiler", default=None)
+_span_depth: contextvars.ContextVar[int] = contextvars.ContextVar("bsander_span_depth", default=0)
+_span_hooks: list[Callable[[SpanRecord], None]] = []
+
+
+@contextmanager
+def profiling(profiler: Profiler | None = None) -> Iterator[Profiler]:
+    # Everything run in this context (and in threads started through `carry_context`) is recorded by the profiler
+    profiler = profiler if profiler is not None else Profiler()
+    token = _active_profiler.set(profiler)
+    try:
+        yield profiler
+    finally:
+        _active_profiler.reset(token)
+
+
+@contextmanager
+def profile_to_file(report_path: str | None) -> Iterator[Profiler | None]:
+    # Profiles the enclosed run into a report at `report_path` (even if the run fails); does nothing without a path
+    if report_path is None:
+        yield None
+        return
+    with profiling() as profiler:
+        try:
+            yield profiler
+        finally:
+            write_profile_report(profiler.report(), report_path)
+            print(f"Profile written to `{report_path}`")
+
+
+def write_profile_report(report: ProfileReport, report_path: str):
+    with open(report_path, "w") as report_file:
+        json.dump(report.to_chrome_trace(), report_file, indent=1)
+
+
+@contextmanager
+def span(name: str, **attributes) -> Iterator[dict]:
+    # Times the enclosed block as a pipeline stage; attributes (e.g. sizes only known once the stage ran) can be added
+    # to the yielded dictionary
+    profiler = _active_profiler.get()
+    if profiler is None and len(_span_hooks) == 0:
+        yield attributes
+        return
+    depth = _span_depth.get()
+    depth_token = _span_depth.set(depth + 1)
+    start_time = time.perf_counter()
+    try:
+        yield attributes
+    finally:
+        _span_depth.reset(depth_token)
+        span_record = SpanRecord(name, start_time, time.perf_counter() - start_time, threading.get_ident(), depth,
+                                 attributes, get_peak_memory_bytes())
+        if profiler is not None:
+            profiler.record_span(span_record)
+        for hook in list(_span_hooks):
+            hook(span_record)
+
+
+def count(counter_name: str, amount: int = 1):
+    profiler = _active_profiler.get()
+    if profiler is not None:
+        profiler.add(counter_name, amount)
+
+
+def add_span_hook(hook: Callable[[SpanRecord], None]) -> Callable[[], None]:
+    # `hook` sees every span that finishes, on any thread, profiled or not (e.g. to export production timings).
+    # Returns a function that removes the hook again.
+    _span_hooks.append(hook)
+    return lambda: _span_hooks.remove(hook) if hook in _span_hooks else None
+
+
+def carry_context(function: Callable) -> Callable:
+    # Thread pools don't inherit context; work submitted through this wrapper reports to the submitter's profiler
+    context = contextvars.copy_context()
+    return lambda *args, **kwargs: context.copy().run(function, *args, **kwargs)
+
+
+def get_peak_memory_bytes() -> int | None:
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak if sys.platform == "darwin" else peak * 1024  # macOS reports bytes; everything else, KiB
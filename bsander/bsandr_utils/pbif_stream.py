@@ -0,0 +1,161 @@
+# This file contains an incremental (event based) reader for Process Bigraph Intermediate Format (PBIF) documents.
+# Documents are tokenized chunk by chunk and echoed to a destination as they are read, so memory use is bounded by
+# the largest single token rather than by the document, and only `address` values are ever decoded or rewritten.
+import json
+import re
+from dataclasses import dataclass
+from typing import Callable, Iterator, TextIO
+
+DEFAULT_CHUNK_SIZE: int = 1 << 16
+
+WHITESPACE = "whitespace"
+PUNCTUATION = "punctuation"
+STRING = "string"
+LITERAL = "literal"
+
+# Leading whitespace is folded into the token that follows it, which halves the number of tokens to walk
+_token_pattern = re.compile(r'(?P<whitespace>[ \t\n\r]*)(?:(?P<punctuation>[{}\[\]:,])'
+                            r'|(?P<string>"[^"\\]*(?:\\.[^"\\]*)*")|(?P<literal>[^ \t\n\r{}\[\]:,"]+))')
+_trailing_whitespace_pattern = re.compile(r"[ \t\n\r]+")
+_literal_pattern = re.compile(r"true|false|null|NaN|-?Infinity|-?(?:0|[1-9]\d*)(?:\.\d+)?(?:[eE][+-]?\d+)?")
+_address_key = "address"
+
+
+class PbifFormatError(ValueError):
+    pass
+
+
+@dataclass(frozen=True)
+class AddressCheckpoint:
+    # A point just past an `address` value, where the rewrite can later be resumed from. Offsets are in characters,
+    # into the source and the destination; the container stack ("{", "[") is the only state the walk carries there.
+    input_end: int
+    output_end: int
+    container_stack: str
+    input_token: str  # raw (JSON-encoded) address, as read
+    output_token: str  # raw address, as written
+
+
+def iterate_json_tokens(source_stream: TextIO,
+                        chunk_size: int = DEFAULT_CHUNK_SIZE) -> Iterator[tuple[str, str, str]]:
+    # Yields `(token_type, leading_whitespace, token)`; trailing whitespace comes out as a final WHITESPACE token
+    buffer: str = ""
+    position: int = 0
+    at_end_of_stream: bool = False
+    match_token = _token_pattern.match
+    while True:
+        match = match_token(buffer, position)
+        # A token touching the end of the buffer may continue in the next chunk (or, for strings, not match at all yet)
+        if (match is None or match.end() == len(buffer)) and not at_end_of_stream:
+            # Read at least as much as we hold, so a huge token is re-scanned a logarithmic number of times
+            new_chunk = source_stream.read(max(chunk_size, len(buffer) - position))
+            at_end_of_stream = len(new_chunk) == 0
+            buffer = buffer[position:] + new_chunk
+            position = 0
+            continue
+        if match is None:
+            trailing_whitespace = _trailing_whitespace_pattern.fullmatch(buffer, position)
+            if trailing_whitespace is not None:
+                yield WHITESPACE, trailing_whitespace.group(), ""
+            elif position < len(buffer):
+                raise PbifFormatError(f"malformed document near: {buffer[position:position + 40]!r}")
+            return
+        position = match.end()
+        token_type = match.lastgroup
+        yield token_type, match.group(WHITESPACE), match.group(token_type)
+
+
+def rewrite_pbif_addresses(source_stream: TextIO, destination_stream: TextIO | None,
+                           rewrite_address: Callable[[str], str], chunk_size: int = DEFAULT_CHUNK_SIZE,
+                           address_checkpoints: list[AddressCheckpoint] | None = None,
+                           resume_container_stack: str | None = None, require_complete: bool = True) -> int:
+    # Walks the document structure, hands every string found under an `address` key to `rewrite_address`, and echoes
+    # the (possibly rewritten) document into `destination_stream`. Returns the number of addresses that changed.
+    # With `address_checkpoints`, a checkpoint is recorded after every address (`destination_stream` must then be an
+    # in-memory stream, so its position is a character offset). `resume_container_stack` starts the walk from such a
+    # checkpoint instead of from the top of a document; without `require_complete`, the source may stop anywhere.
+    container_stack: list[str] = list(resume_container_stack or "")  # "{" or "["
+    expecting: str = "value" if resume_container_stack is None else "separator"
+    current_key: str | None = None
+    previous_token: str = "" if resume_container_stack is None else '""'
+    rewritten_count: int = 0
+    length_change: int = 0  # output length minus input length, so far
+    for token_type, leading_whitespace, raw_token in iterate_json_tokens(source_stream, chunk_size):
+        output_token = raw_token
+        if token_type == WHITESPACE:
+            if destination_stream is not None:
+                destination_stream.write(leading_whitespace)
+            continue
+        if expecting == "end":
+            raise PbifFormatError(f"unexpected content after end of document: {raw_token[:40]!r}")
+        elif previous_token == "" and raw_token != "{":
+            raise PbifFormatError("PBIF documents must be JSON objects")
+        elif token_type == PUNCTUATION:
+            expecting, current_key = _advance_on_punctuation(raw_token, expecting, container_stack, current_key,
+                                                             previous_token)
+        elif expecting == "key":
+            if token_type != STRING:
+                raise PbifFormatError(f"expected an object key, found: {raw_token[:40]!r}")
+            current_key = _decode_string(raw_token)
+            expecting = "colon"
+        elif expecting == "value":
+            if token_type == LITERAL and _literal_pattern.fullmatch(raw_token) is None:
+                raise PbifFormatError(f"invalid literal: {raw_token[:40]!r}")
+            in_object = len(container_stack) != 0 and container_stack[-1] == "{"
+            if token_type == STRING and in_object and current_key == _address_key:
+                address = _decode_string(raw_token)
+                new_address = rewrite_address(address)
+                if new_address != address:
+                    output_token = json.dumps(new_address)
+                    rewritten_count += 1
+                if address_checkpoints is not None:
+                    destination_stream.write(leading_whitespace + output_token)
+                    output_end = destination_stream.tell()
+                    length_change += len(output_token) - len(raw_token)
+                    address_checkpoints.append(AddressCheckpoint(output_end - length_change, output_end,
+                                                                 "".join(container_stack), raw_token, output_token))
+                    previous_token = raw_token
+                    expecting = "separator"
+                    continue
+            expecting = "separator" if len(container_stack) != 0 else "end"
+        else:
+            raise PbifFormatError(f"unexpected token: {raw_token[:40]!r}")
+        previous_token = raw_token
+        if destination_stream is not None:
+            destination_stream.write(leading_whitespace + output_token if leading_whitespace else output_token)
+    if require_complete and (expecting != "end" or len(container_stack) != 0):
+        raise PbifFormatError("document ended unexpectedly")
+    return rewritten_count
+
+
+def _advance_on_punctuation(punctuation: str, expecting: str, container_stack: list[str], current_key: str | None,
+                            previous_token: str) -> tuple[str, str | None]:
+    if punctuation in "{[":
+        if expecting != "value":
+            raise PbifFormatError(f"unexpected `{punctuation}`")
+        container_stack.append(punctuation)
+        return ("key" if punctuation == "{" else "value"), None
+    if punctuation in "}]":
+        opener = "{" if punctuation == "}" else "["
+        closes_empty = previous_token == opener
+        if len(container_stack) == 0 or container_stack[-1] != opener or not (expecting == "separator" or closes_empty):
+            raise PbifFormatError(f"unexpected `{punctuation}`")
+        container_stack.pop()
+        return ("separator" if len(container_stack) != 0 else "end"), None
+    if punctuation == ":":
+        if expecting != "colon":
+            raise PbifFormatError("unexpected `:`")
+        return "value", current_key
+    # punctuation == ","
+    if expecting != "separator":
+        raise PbifFormatError("unexpected `,`")
+    return ("key" if container_stack[-1] == "{" else "value"), None
+
+
+def _decode_string(raw_token: str) -> str:
+    if "\\" not in raw_token:
+        return raw_token[1:-1]  # nothing escaped; by far the common case for keys
+    try:
+        return json.loads(raw_token)
+    except ValueError as e:
+        raise PbifFormatError(f"invalid string {raw_token[:40]!r}: {e}") from e
@@ -0,0 +1,239 @@
+### File that keeps bsander warm between requests: the registry is loaded (and containerization imported) once, and
+### requests arrive over a local Unix socket, one line of JSON each, answered by one line of JSON.
+### Start it with `python -m bsander.daemon`; `main.py --daemon` forwards a run to it.
+import argparse
+import asyncio
+import contextvars
+import io
+import json
+import os
+import signal
+import socket
+import sys
+import threading
+import time
+from dataclasses import asdict
+
+from bsander.bsandr_utils.cache_directory import get_cache_file_path
+from bsander.bsandr_utils.input_types import ProgramArguments, program_arguments_to_json, program_arguments_from_json
+from bsander.bsandr_utils.instrumentation import profile_to_file
+from bsander.pbic3g.registry_cache import RegistryEntry
+
+DEFAULT_SOCKET_NAME: str = "bsander.sock"
+_max_message_bytes = 64 * 1024 * 1024  # whitelists travel inside requests, and can be long
+# The output of the request being served in this context. Context (unlike thread-local state) follows the work into
+# the threads batch mode and localization fan out to, since they are started through `carry_context`.
+_captured_output: contextvars.ContextVar[io.StringIO | None] = contextvars.ContextVar("bsander_daemon_output",
+                                                                                     default=None)
+
+
+def get_default_socket_path() -> str:
+    return get_cache_file_path(DEFAULT_SOCKET_NAME)
+
+
+class _RequestRoutedStream(io.TextIOBase):
+    # Replaces stdout / stderr while serving: whatever a request prints (on any of its threads) goes into that
+    # request's response
+    def __init__(self, fallback_stream):
+        self.fallback_stream = fallback_stream
+
+    def write(self, text: str) -> int:
+        capture = _captured_output.get()
+        (capture if capture is not None else self.fallback_stream).write(text)
+        return len(text)
+
+    def flush(self):
+        self.fallback_stream.flush()
+
+
+class BsanderDaemon:
+    def __init__(self, socket_path: str | None = None, use_cache: bool = True,
+                 local_registry: dict[str, list[RegistryEntry]] | None = None):
+        self.socket_path = socket_path if socket_path is not None else get_default_socket_path()
+        self.use_cache = use_cache
+        self.local_registry = local_registry
+        self.stopped: asyncio.Event | None = None
+        self._stdout = _RequestRoutedStream(sys.stdout)
+        self._stderr = _RequestRoutedStream(sys.stderr)
+        self._stream_lock = threading.Lock()
+
+    def warm(self):
+        # Everything a request would otherwise pay for on a cold start
+        import bsander.execution  # noqa: F401
+        import bsander.pbic3g.containerization.container_environment  # noqa: F401
+        import bsander.pbic3g.containerization.multi_container  # noqa: F401
+        import bsander.pbic3g.dependency_resolution.lockfile  # noqa: F401
+        if self.local_registry is None:
+            from bsander.pbic3g.local_registry import load_local_modules
+            self.local_registry = load_local_modules(use_cache=self.use_cache)
+
+    async def serve(self):
+        _claim_socket_path(self.socket_path)
+        await asyncio.to_thread(self.warm)
+        self.stopped = asyncio.Event()
+        server = await asyncio.start_unix_server(self._handle_connection, path=self.socket_path,
+                                                 limit=_max_message_bytes)
+        os.chmod(self.socket_path, 0o600)  # requests name arbitrary local paths; only our user may send them
+        print(f"bsander daemon listening on `{self.socket_path}`", flush=True)
+        try:
+            async with server:
+                await self.stopped.wait()
+        finally:
+            with self._stream_lock:
+                if sys.stdout is self._stdout:
+                    sys.stdout = self._stdout.fallback_stream
+                if sys.stderr is self._stderr:
+                    sys.stderr = self._stderr.fallback_stream
+            if os.path.exists(self.socket_path):
+                os.remove(self.socket_path)
+
+    def stop(self):
+        if self.stopped is not None:
+            self.stopped.set()
+
+    async def _handle_connection(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        try:
+            while True:  # a client may send many requests over one connection
+                try:
+                    request_line = await reader.readline()
+                except ValueError:  # past the stream's limit, so where the next request starts is lost too
+                    error = f"request is longer than {_max_message_bytes} bytes"
+                    writer.write(json.dumps({"ok": False, "error": error}).encode("utf-8") + b"\n")
+                    await writer.drain()
+                    break
+                if request_line == b"":
+                    break
+                try:
+                    request = json.loads(request_line)
+                    response = await self._handle_request(request) if isinstance(request, dict) \
+                        else {"ok": False, "error": "requests must be JSON objects"}
+                except ValueError as e:
+                    response = {"ok": False, "error": f"malformed request: {e}"}
+                writer.write(json.dumps(response).encode("utf-8") + b"\n")
+                await writer.drain()
+        except (ConnectionError, asyncio.IncompleteReadError):
+            pass  # the client went away; nothing to answer
+        except asyncio.CancelledError:
+            pass  # shutting down with the connection still open
+        finally:
+            writer.close()
+
+    async def _handle_request(self, request: dict) -> dict:
+        command = request.get("command")
+        if command == "ping":
+            return {"ok": True, "pid": os.getpid()}
+        if command == "shutdown":
+            self.stop()
+            return {"ok": True}
+        if command == "reload":  # e.g. after installing new distributions
+            from bsander.pbic3g.local_registry import load_local_modules
+            self.local_registry = await asyncio.to_thread(load_local_modules, self.use_cache)
+            return {"ok": True}
+        if command == "execute":
+            return await asyncio.to_thread(self._execute, request.get("arguments"))
+        return {"ok": False, "error": f"unknown command `{command}`"}
+
+    def _execute(self, raw_arguments) -> dict:
+        from bsander.batch import collect_batch_inputs, execute_bsander_batch
+        from bsander.execution import execute_bsander
+        start = time.perf_counter()
+        self._route_standard_streams()
+        captured_output = io.StringIO()
+        capture_token = _captured_output.set(captured_output)
+        response: dict
+        try:
+            if not isinstance(raw_arguments, dict):
+                raise ValueError("`execute` requires the program arguments")
+            program_arguments = program_arguments_from_json(raw_arguments)
+            with profile_to_file(program_arguments.profile_path):  # each request gets its own profiler
+                if program_arguments.batch_mode:
+                    results = execute_bsander_batch(collect_batch_inputs(program_arguments.input_file_path),
+                                                    program_arguments, program_arguments.batch_workers,
+                                                    self.local_registry)
+                    response = {"ok": all(result.succeeded for result in results),
+                                "results": [asdict(result) for result in results]}
+                else:
+                    response = {"ok": True, "image_tag": execute_bsander(program_arguments, self.local_registry)}
+        except Exception as e:
+            response = {"ok": False, "error": str(e)}
+        finally:
+            _captured_output.reset(capture_token)
+        response["output"] = captured_output.getvalue()
+        response["duration_seconds"] = time.perf_counter() - start
+        return response
+
+    def _route_standard_streams(self):
+        # (Re)installed per request, in case something else swapped the streams out since the last one
+        with self._stream_lock:
+            if sys.stdout is not self._stdout:
+                self._stdout.fallback_stream, sys.stdout = sys.stdout, self._stdout
+            if sys.stderr is not self._stderr:
+                self._stderr.fallback_stream, sys.stderr = sys.stderr, self._stderr
+
+
+def _claim_socket_path(socket_path: str):
+    if os.path.exists(socket_path):
+        try:
+            send_daemon_request({"command": "ping"}, socket_path, timeout=1.0)
+        except OSError:
+            os.remove(socket_path)  # left behind by a daemon that didn't shut down cleanly
+        else:
+            raise ValueError(f"a bsander daemon is already listening on `{socket_path}`")
+    os.makedirs(os.path.dirname(os.path.abspath(socket_path)), exist_ok=True)
+
+
+def send_daemon_request(request: dict, socket_path: str | None = None, timeout: float | None = None) -> dict:
+    # Plain blocking socket: the client side stays cheap to import and start
+    socket_path = socket_path if socket_path is not None else get_default_socket_path()
+    with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as client:
+        client.settimeout(timeout)
+        client.connect(socket_path)
+        client.sendall(json.dumps(request).encode("utf-8") + b"\n")
+        response_bytes = b""
+        while not response_bytes.endswith(b"\n"):
+            chunk = client.recv(1 << 16)
+            if chunk == b"":
+                raise ConnectionError("the bsander daemon closed the connection without answering")
+            response_bytes += chunk
+    return json.loads(response_bytes)
+
+
+def forward_to_daemon(program_arguments: ProgramArguments, socket_path: str | None = None) -> dict:
+    return send_daemon_request({"command": "execute", "arguments": program_arguments_to_json(program_arguments)},
+                               socket_path)
+
+
+def run_daemon(socket_path: str | None = None, use_cache: bool = True):
+    daemon = BsanderDaemon(socket_path, use_cache)
+
+    async def serve_until_signalled():
+        loop = asyncio.get_running_loop()
+        for signal_number in (signal.SIGINT, signal.SIGTERM):
+            loop.add_signal_handler(signal_number, daemon.stop)
+        await daemon.serve()
+
+    asyncio.run(serve_until_signalled())
+
+
+def main():
+    parser = argparse.ArgumentParser(prog="python -m bsander.daemon",
+                                     description="keeps bsander's registry warm and serves requests from "
+                                                 "`main.py --daemon` over a local Unix socket")
+    parser.add_argument("-s", "--socket", type=str, help=f"socket path (defaults to `{DEFAULT_SOCKET_NAME}` in the "
+                                                         f"bsander cache directory)")
+    parser.add_argument("--no-cache", action="store_true", help="ignore (and don't update) the on-disk caches")
+    parser.add_argument("--stop", action="store_true", help="ask the daemon listening on the socket to shut down")
+    args = parser.parse_args()
+    socket_path = os.path.abspath(os.path.expanduser(args.socket)) if args.socket is not None else None
+    try:
+        if args.stop:
+            send_daemon_request({"command": "shutdown"}, socket_path)
+            return
+        run_daemon(socket_path, use_cache=not args.no_cache)
+    except (OSError, ValueError) as e:
+        print(e, file=sys.stderr)
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,59 +1,445 @@
+import asyncio
+import dataclasses
+import filecmp
 import os
 import shutil
+from dataclasses import dataclass, field
+from typing import TYPE_CHECKING
 
-from bsander.bsandr_utils.experiment_archive import extract_archive_returning_pbif_path
-from bsander.bsandr_utils.input_types import ProgramArguments, ContainerizationTypes, ContainerizationEngine
-from bsander.pbic3g.containerization.container_constructor import formulate_dockerfile_for_necessary_env
+from bsander.bsandr_utils.experiment_archive import extract_archive_returning_pbif_paths, read_archive_pbif_documents, \
+    write_archive_with_replacements
+from bsander.bsandr_utils.input_types import ProgramArguments, ContainerizationTypes, ContainerizationEngine, \
+    ArchiveMode
+from bsander.bsandr_utils.instrumentation import span, count
+from bsander.pbic3g.abstract_resolution import get_implementation_index, resolve_abstract_text, resolve_abstract_file, \
+    contains_abstract_processes, file_contains_abstract_processes
 from bsander.pbic3g.local_registry import load_local_modules
-from spython.main.parse.parsers import DockerParser
-from spython.main.parse.writers import SingularityWriter
+from bsander.pbic3g.registry_cache import RegistryEntry
 
+if TYPE_CHECKING:
+    from bsander.pbic3g.containerization.multi_container import DependencyCluster
 
 
-def execute_bsander(original_program_arguments: ProgramArguments):
+
+def execute_bsander(original_program_arguments: ProgramArguments,
+                    local_registry: dict[str, list[RegistryEntry]] | None = None) -> str | None:
+    # Every stage below is timed (see `bsandr_utils/instrumentation.py`) when a run is profiled
+    with span("execute_bsander", input=original_program_arguments.input_file_path):
+        prepared_input = _prepare_input(original_program_arguments)
+        if local_registry is None:  # callers processing many inputs load it once and hand it to us
+            local_registry = _load_registry(original_program_arguments.use_cache)
+        with span("resolve_abstracts"):
+            _resolve_abstract_documents(prepared_input, local_registry)
+        environment_image_tag = _containerize_prepared_input(prepared_input)
+        _write_prepared_outputs(original_program_arguments, prepared_input)
+        return environment_image_tag
+
+
+async def execute_bsander_async(original_program_arguments: ProgramArguments,
+                                local_registry: dict[str, list[RegistryEntry]] | None = None) -> str | None:
+    # Same outputs as `execute_bsander`, for asyncio callers: the registry loads while the input is copied / extracted
+    # and scanned for abstract processes, and documents without any go on to localization without waiting for it.
+    # The load is still awaited before returning, so it never outlives the call.
+    with span("execute_bsander", input=original_program_arguments.input_file_path, pipeline="async"):
+        registry_load: asyncio.Task | None = None
+        if local_registry is None:
+            registry_load = asyncio.create_task(asyncio.to_thread(_load_registry,
+                                                                  original_program_arguments.use_cache))
+        try:
+            prepared_input = await asyncio.to_thread(_prepare_input, original_program_arguments)
+            if await asyncio.to_thread(_has_abstract_processes, prepared_input):
+                if registry_load is not None:
+                    local_registry = await registry_load
+                with span("resolve_abstracts"):
+                    await asyncio.to_thread(_resolve_abstract_documents, prepared_input, local_registry)
+            environment_image_tag = await asyncio.to_thread(_containerize_prepared_input, prepared_input)
+            await asyncio.to_thread(_write_prepared_outputs, original_program_arguments, prepared_input)
+        finally:
+            if registry_load is not None:
+                # Unneeded by this input (or the run already failed), so a failed load isn't this run's error
+                await asyncio.gather(registry_load, return_exceptions=True)
+        return environment_image_tag
+
+
+@dataclass
+class _PreparedInput:
+    program_arguments: ProgramArguments  # pointing at the copy (or extracted document) that gets resolved in place
+    input_is_archive: bool
+    # Archives may hold many documents (every one is resolved into the same environment). Streamed archives are never
+    # extracted; their documents are held in memory (member name -> text) until the archive is rewritten.
+    pbif_paths: list[str] = field(default_factory=list)
+    streamed_documents: dict[str, str] | None = None
+    original_streamed_documents: dict[str, str] = field(default_factory=dict)
+    is_incremental: bool = False  # only single documents (not archives) are localized incrementally
+    previous_output: str | None = None
+    # Zero-copy runs read the input itself until the (resolved) output document is first written
+    uncopied_source_path: str | None = None
+
+    def get_source_paths(self) -> list[str]:
+        # Where each of `pbif_paths` is currently read from
+        return [self.uncopied_source_path] if self.uncopied_source_path is not None else self.pbif_paths
+
+
+def _prepare_input(original_program_arguments: ProgramArguments) -> _PreparedInput:
+    # Copies, extracts, or reads the input into the output directory (or, in zero-copy mode, only decides where the
+    # output goes); nothing here needs the registry
     new_input_file_path: None | str = None
     input_is_archive = original_program_arguments.input_file_path.endswith(
         ".zip") or original_program_arguments.input_file_path.endswith(".omex")
-    required_program_arguments: ProgramArguments
-    if input_is_archive:
-        new_input_file_path = extract_archive_returning_pbif_path(original_program_arguments.input_file_path, original_program_arguments.output_dir)
+    prepared_input = _PreparedInput(original_program_arguments, input_is_archive)
+    if input_is_archive and original_program_arguments.archive_mode == ArchiveMode.STREAMING:
+        with span("read_archive"):
+            prepared_input.streamed_documents = read_archive_pbif_documents(original_program_arguments.input_file_path)
+        count("bytes_read", os.path.getsize(original_program_arguments.input_file_path))
+        prepared_input.original_streamed_documents = dict(prepared_input.streamed_documents)
+        new_input_file_path = original_program_arguments.input_file_path
+    elif input_is_archive:
+        with span("extract_archive"):
+            prepared_input.pbif_paths = extract_archive_returning_pbif_paths(original_program_arguments.input_file_path, original_program_arguments.output_dir)
+        count("bytes_read", os.path.getsize(original_program_arguments.input_file_path))
+        new_input_file_path = prepared_input.pbif_paths[-1]
+    elif _is_output_the_input(original_program_arguments):
+        # No output directory of its own (e.g. no `-o`): the document is only validated (and containerized), in
+        # memory, and never written back over the input
+        with open(original_program_arguments.input_file_path, "r") as pbif_file:
+            prepared_input.streamed_documents = { os.path.basename(original_program_arguments.input_file_path) :
+                                                  pbif_file.read() }
+        count("bytes_read", os.path.getsize(original_program_arguments.input_file_path))
+        new_input_file_path = original_program_arguments.input_file_path
     else:
         new_input_file_path = os.path.join(original_program_arguments.output_dir, os.path.basename(original_program_arguments.input_file_path))
+        # Incremental runs build on the previous output, so it's read before the copy replaces it
+        prepared_input.is_incremental = original_program_arguments.incremental \
+            and original_program_arguments.containerization_type != ContainerizationTypes.NONE
+        if prepared_input.is_incremental and os.path.isfile(new_input_file_path):
+            with open(new_input_file_path, "r") as previous_output_file:
+                prepared_input.previous_output = previous_output_file.read()
+
+        if original_program_arguments.zero_copy:
+            prepared_input.uncopied_source_path = original_program_arguments.input_file_path
+        else:
+            with span("copy_input"):
+                print("file copied to `{}`".format(shutil.copy(original_program_arguments.input_file_path, new_input_file_path)))
+            input_size = os.path.getsize(new_input_file_path)
+            count("bytes_read", input_size)
+            count("bytes_written", input_size)
+        prepared_input.pbif_paths = [new_input_file_path]
+    prepared_input.program_arguments = dataclasses.replace(original_program_arguments,
+                                                           input_file_path=new_input_file_path)
+    return prepared_input
+
+
+def _is_output_the_input(program_arguments: ProgramArguments) -> bool:
+    output_path = os.path.join(program_arguments.output_dir, os.path.basename(program_arguments.input_file_path))
+    return os.path.exists(output_path) and os.path.samefile(output_path, program_arguments.input_file_path)
 
-        print("file copied to `{}`".format(shutil.copy(original_program_arguments.input_file_path, new_input_file_path)))
-    required_program_arguments = ProgramArguments(new_input_file_path, original_program_arguments.output_dir,
-                                                  original_program_arguments.whitelist_entries,
-                                                  original_program_arguments.containerization_type,
-                                                  original_program_arguments.containerization_engine)
-
-    load_local_modules()  # Collect Abstracts
-    # TODO: Add feature - resolve abstracts
-
-    if required_program_arguments.containerization_type != ContainerizationTypes.NONE:
-        if required_program_arguments.containerization_type != ContainerizationTypes.SINGLE:
-            raise NotImplementedError("Only single containerization is currently supported")
-        docker_template: str = formulate_dockerfile_for_necessary_env(required_program_arguments)
-        container_file_path: str
-        container_file_path = os.path.join(required_program_arguments.output_dir, "Dockerfile")
-        with open(container_file_path, "w") as docker_file:
-            docker_file.write(docker_template)
-        if required_program_arguments.containerization_engine == ContainerizationEngine.APPTAINER \
-                or required_program_arguments.containerization_engine == ContainerizationEngine.BOTH:
-            dockerfile_path = container_file_path
-            container_file_path = os.path.join(required_program_arguments.output_dir, "singularity.def")
-            dockerfile_parser = DockerParser(dockerfile_path)
-            singularity_writer = SingularityWriter(dockerfile_parser.recipe)
-            results = singularity_writer.convert()
-            with open(container_file_path, "w") as container_file:
-                container_file.write(results)
-            if required_program_arguments.containerization_engine != ContainerizationEngine.BOTH:
-                os.remove(dockerfile_path)
-        print(f"Container build file located at '{container_file_path}'")
 
+def _load_registry(use_cache: bool) -> dict[str, list[RegistryEntry]]:
+    with span("load_local_modules"):
+        return load_local_modules(use_cache=use_cache)  # Collect Abstracts
+
+
+def _has_abstract_processes(prepared_input: _PreparedInput) -> bool:
+    if prepared_input.streamed_documents is not None:
+        return any(contains_abstract_processes(pb_document_str)
+                   for pb_document_str in prepared_input.streamed_documents.values())
+    return any(file_contains_abstract_processes(source_path) for source_path in prepared_input.get_source_paths())
+
+
+def _containerize_prepared_input(prepared_input: _PreparedInput) -> str | None:
+    program_arguments = prepared_input.program_arguments
+    if program_arguments.containerization_type == ContainerizationTypes.NONE:
+        return None
+    if prepared_input.is_incremental:
+        is_containerized, environment_image_tag = _containerize_incrementally(
+            program_arguments, prepared_input.previous_output, prepared_input.get_source_paths()[0])
+        if is_containerized:
+            prepared_input.uncopied_source_path = None
+            return environment_image_tag
+    environment_image_tag = _containerize(program_arguments, prepared_input.pbif_paths,
+                                          prepared_input.get_source_paths(), prepared_input.streamed_documents)
+    prepared_input.uncopied_source_path = None  # localization wrote the output document
+    return environment_image_tag
+
+
+def _write_prepared_outputs(original_program_arguments: ProgramArguments, prepared_input: _PreparedInput):
+    if prepared_input.uncopied_source_path is not None:
+        # Nothing was resolved or localized into the output document, so it's the input as is; an identical output
+        # (e.g. from an earlier run) is left alone
+        output_path = prepared_input.pbif_paths[0]
+        if os.path.isfile(output_path) and filecmp.cmp(prepared_input.uncopied_source_path, output_path, shallow=False):
+            print(f"`{output_path}` is already up to date")
+        else:
+            with span("copy_input"):
+                shutil.copyfile(prepared_input.uncopied_source_path, output_path)
+            print(f"file copied to `{output_path}`")
+            count("bytes_written", os.path.getsize(output_path))
+        prepared_input.uncopied_source_path = None
     # Reconstitute if archive
-    if input_is_archive:
-        base_name = os.path.basename(original_program_arguments.input_file_path)
-        new_archive_path = os.path.join(original_program_arguments.output_dir, base_name)
-        target_dir = os.path.join(original_program_arguments.output_dir, base_name.split(".")[0])
+    if not prepared_input.input_is_archive:
+        return
+    with span("write_archive"):
+        new_archive_path = _write_output_archive(original_program_arguments, prepared_input.streamed_documents,
+                                                 prepared_input.original_streamed_documents)
+    count("bytes_written", os.path.getsize(new_archive_path))
+
+
+def _write_output_archive(program_arguments: ProgramArguments, streamed_documents: dict[str, str] | None,
+                          original_streamed_documents: dict[str, str]) -> str:
+    base_name = os.path.basename(program_arguments.input_file_path)
+    new_archive_path = os.path.join(program_arguments.output_dir, base_name)
+    if streamed_documents is not None:
+        archive_replacements = { member_name : document_str for member_name, document_str in streamed_documents.items()
+                                 if document_str != original_streamed_documents[member_name] }
+        write_archive_with_replacements(program_arguments.input_file_path, new_archive_path, archive_replacements)
+    else:
+        target_dir = os.path.join(program_arguments.output_dir, base_name.split(".")[0])
         shutil.make_archive(new_archive_path, 'zip', target_dir)
         shutil.move(new_archive_path + ".zip", new_archive_path) # get rid of extra suffix
+    return new_archive_path
+
+
+def _resolve_abstract_documents(prepared_input: _PreparedInput, local_registry: dict[str, list[RegistryEntry]]):
+    # Substitutes every `abstract:` process with its best registered implementation: in place for extracted / copied
+    # documents (from the input into the output for zero-copy ones), in memory for streamed ones
+    implementation_index = get_implementation_index(local_registry)
+    resolved_count = 0
+    streamed_documents = prepared_input.streamed_documents
+    if streamed_documents is not None:
+        for member_name, pb_document_str in streamed_documents.items():
+            streamed_documents[member_name], document_resolved_count = resolve_abstract_text(pb_document_str,
+                                                                                             implementation_index)
+            resolved_count += document_resolved_count
+    for pbif_path, source_path in zip(prepared_input.pbif_paths, prepared_input.get_source_paths()):
+        resolved_count += resolve_abstract_file(pbif_path, implementation_index, source_path)
+    if resolved_count != 0 and prepared_input.uncopied_source_path is not None:
+        prepared_input.uncopied_source_path = None  # the output document now exists
+    count("abstract_processes_resolved", resolved_count)
+    if resolved_count != 0:
+        print(f"Resolved {resolved_count} abstract process(es) to registered implementations")
+
+
+def _read_document_texts(pbif_paths: list[str], streamed_documents: dict[str, str] | None) -> dict[str, str]:
+    if streamed_documents is not None:
+        return streamed_documents
+    document_texts: dict[str, str] = {}
+    for pbif_path in pbif_paths:
+        with open(pbif_path, "r") as pbif_file:
+            document_texts[os.path.basename(pbif_path)] = pbif_file.read()
+    return document_texts
+
+
+def _containerize(program_arguments: ProgramArguments, pbif_paths: list[str], source_paths: list[str],
+                  streamed_documents: dict[str, str] | None) -> str | None:
+    # Localizes every document (from its source path into its path, or streamed ones in memory) and writes the
+    # container build files; returns the image tag of a single environment. Imported here, so runs that only validate
+    # never load containerization at all.
+    from bsander.pbic3g.containerization.container_constructor import localize_many_document_files, \
+        localize_many_document_texts
+    from bsander.pbic3g.containerization.multi_container import cluster_document_processes
+    from bsander.pbic3g.dependency_resolution.whitelist import get_whitelist_index
+    is_multiple = program_arguments.containerization_type == ContainerizationTypes.MULTIPLE
+    whitelist_index = get_whitelist_index(program_arguments.whitelist_entries)  # compiled once for every step below
+    clusters: list["DependencyCluster"] = []
+    if is_multiple:  # processes are clustered by what they request, so this reads documents before localizing
+        with span("cluster_processes"):
+            clusters = cluster_document_processes(_read_document_texts(source_paths, streamed_documents),
+                                                  whitelist_index)
+    with span("localize", documents=len(streamed_documents) if streamed_documents is not None else len(pbif_paths)):
+        if streamed_documents is not None:
+            pypi_deps, conda_deps, localized_documents = localize_many_document_texts(
+                streamed_documents, whitelist_index, resolve_environment=not is_multiple)
+            streamed_documents.update(localized_documents)
+        else:
+            pypi_deps, conda_deps = localize_many_document_files(pbif_paths, whitelist_index,
+                                                                 resolve_environment=not is_multiple,
+                                                                 source_paths=source_paths)
+            count("bytes_read", sum(os.path.getsize(source_path) for source_path in source_paths))
+            count("bytes_written", sum(os.path.getsize(pbif_path) for pbif_path in pbif_paths))
+    if is_multiple:
+        _write_multi_container_files(program_arguments, clusters)
+        return None
+    return _write_single_container_files(program_arguments, pypi_deps, conda_deps)[0]
+
+
+def _containerize_incrementally(program_arguments: ProgramArguments, previous_output: str | None,
+                                source_path: str) -> tuple[bool, str | None]:
+    # For a single document: only the addresses around what changed since the last run (see its manifest) are
+    # localized again, and the container build files are only regenerated if any address changed. Returns whether
+    # the document could be handled this way (only JSON documents can), and the image tag of its environment.
+    from bsander.bsandr_utils.pbif_stream import PbifFormatError
+    from bsander.pbic3g.containerization.container_constructor import get_address_localizer, \
+        resolve_address_dependencies
+    from bsander.pbic3g.containerization.multi_container import cluster_document_processes
+    from bsander.pbic3g.dependency_resolution.whitelist import get_whitelist_index
+    from bsander.pbic3g.incremental import IncrementalManifest, get_manifest_path, load_manifest, save_manifest, \
+        localize_document_incrementally, localize_document_fully, collect_distinct_addresses, hash_text
+    pbif_path = program_arguments.input_file_path
+    with open(source_path, "r") as source_file:
+        pb_document_str = source_file.read()
+    manifest_path = get_manifest_path(pbif_path)
+    settings_fingerprint = _compute_incremental_settings_fingerprint(program_arguments)
+    previous_manifest = load_manifest(manifest_path, settings_fingerprint) if previous_output is not None else None
+    whitelist_index = get_whitelist_index(program_arguments.whitelist_entries)  # compiled once for every step below
+    address_localizer = get_address_localizer(whitelist_index)
+    localization = None
+    with span("localize_incrementally") as attributes:
+        if previous_manifest is not None:
+            localization = localize_document_incrementally(pb_document_str, previous_output, previous_manifest,
+                                                           address_localizer)
+        if localization is None:
+            previous_manifest = None
+            try:
+                localization = localize_document_fully(pb_document_str, address_localizer)
+            except PbifFormatError:
+                if os.path.exists(manifest_path):
+                    os.remove(manifest_path)
+                return False, None
+        attributes["walked_addresses"] = localization.walked_address_count
+    count("addresses_localized", localization.walked_address_count)
+    # A zero-copy run leaves the previous output in place until now, so an unchanged one isn't rewritten
+    if source_path == pbif_path or localization.localized_document != previous_output:
+        with open(pbif_path, "w") as pbif_file:
+            pbif_file.write(localization.localized_document)
+        count("bytes_written", os.path.getsize(pbif_path))
+    print(f"Re-resolved {localization.walked_address_count} of {len(localization.checkpoints)} addresses")
+
+    if previous_manifest is not None and not localization.addresses_changed \
+            and _are_output_files_intact(program_arguments.output_dir, previous_manifest.output_files):
+        print("Container build files are up to date")
+        if localization.localized_document == previous_output:
+            return True, previous_manifest.image_tag  # the manifest still describes this run exactly
+        output_files, environment_image_tag = previous_manifest.output_files, previous_manifest.image_tag
+    else:
+        environment_image_tag: str | None = None
+        if program_arguments.containerization_type == ContainerizationTypes.MULTIPLE:
+            with span("cluster_processes"):
+                clusters = cluster_document_processes({ os.path.basename(pbif_path) : pb_document_str },
+                                                      whitelist_index)
+            written_files = _write_multi_container_files(program_arguments, clusters)
+        else:
+            pypi_deps, conda_deps = resolve_address_dependencies(
+                collect_distinct_addresses(localization.checkpoints), whitelist_index)
+            environment_image_tag, written_files = _write_single_container_files(program_arguments, pypi_deps,
+                                                                                 conda_deps)
+        output_files = { relative_path : hash_text(contents) for relative_path, contents in written_files.items() }
+    save_manifest(manifest_path, IncrementalManifest(settings_fingerprint, hash_text(pb_document_str),
+                                                     hash_text(localization.localized_document),
+                                                     localization.checkpoints, output_files, environment_image_tag))
+    return True, environment_image_tag
+
+
+def _compute_incremental_settings_fingerprint(program_arguments: ProgramArguments) -> str:
+    # Everything other than the document that localization and the container build files depend on
+    from bsander.pbic3g.containerization.container_environment import get_engine_templates
+    from bsander.pbic3g.incremental import compute_settings_fingerprint
+    lock_source_times = [os.stat(lock_source).st_mtime_ns if os.path.isdir(lock_source) else None
+                         for lock_source in (program_arguments.pypi_lock_index, program_arguments.conda_lock_channel)
+                         if lock_source is not None]  # adding (or removing) packages changes what gets pinned
+    return compute_settings_fingerprint(program_arguments.whitelist_entries,
+                                        program_arguments.containerization_type.name,
+                                        program_arguments.containerization_engine.name,
+                                        get_engine_templates(program_arguments.containerization_engine,
+                                                             program_arguments.template_mode),
+                                        program_arguments.pypi_lock_index, program_arguments.conda_lock_channel,
+                                        program_arguments.conda_lock_channel_url, lock_source_times)
+
+
+def _are_output_files_intact(output_dir: str, output_files: dict[str, str]) -> bool:
+    from bsander.pbic3g.incremental import hash_text
+    for relative_path, content_hash in output_files.items():
+        output_file_path = os.path.join(output_dir, relative_path)
+        if not os.path.isfile(output_file_path):
+            return False
+        with open(output_file_path, "r") as output_file:
+            if hash_text(output_file.read()) != content_hash:
+                return False
+    return True
+
+
+def _write_single_container_files(program_arguments: ProgramArguments, pypi_deps: list[str],
+                                  conda_deps: list[str]) -> tuple[str, dict[str, str]]:
+    # Returns the environment's image tag, and every file written (relative path -> contents)
+    from bsander.pbic3g.containerization.container_environment import ContainerEnvironment, \
+        get_engine_templates, get_engine_container_file_names, render_container_files
+    from bsander.pbic3g.containerization.output_cache import compute_environment_hash, \
+        get_environment_image_tag, load_cached_container_files, store_container_files
+    from bsander.pbic3g.dependency_resolution.lockfile import generate_lockfiles
+    engine = program_arguments.containerization_engine
+    with span("generate_lockfiles"):
+        lockfiles = generate_lockfiles(pypi_deps, conda_deps, program_arguments.pypi_lock_index,
+                                       program_arguments.conda_lock_channel,
+                                       program_arguments.conda_lock_channel_url)
+    for lockfile_name, lockfile_contents in lockfiles.items():
+        lockfile_path = os.path.join(program_arguments.output_dir, lockfile_name)
+        _write_output_file(lockfile_path, lockfile_contents)
+        print(f"Lockfile located at '{lockfile_path}'")
+    environment = ContainerEnvironment(pypi_deps, conda_deps, program_arguments.template_mode, set(lockfiles))
+    environment_hash = compute_environment_hash(get_engine_templates(engine, environment.template_mode),
+                                                pypi_deps, conda_deps, engine, lockfiles)
+    container_files: dict[str, str] | None = None
+    if program_arguments.use_cache:
+        container_files = load_cached_container_files(environment_hash)
+    if container_files is None:
+        with span("render_container_files"):
+            container_files = render_container_files(environment, engine)
+        if program_arguments.use_cache:
+            store_container_files(environment_hash, container_files)
+    else:
+        print("Reusing previously generated container build files for this environment")
+
+    written_files = dict(lockfiles)
+    for file_name in get_engine_container_file_names(engine):
+        container_file_path = os.path.join(program_arguments.output_dir, file_name)
+        _write_output_file(container_file_path, container_files[file_name])
+        written_files[file_name] = container_files[file_name]
+        print(f"Container build file located at '{container_file_path}'")
+    environment_image_tag = get_environment_image_tag(environment_hash)
+    print(f"Environment image tag: '{environment_image_tag}' (identical environments share this tag)")
+    return environment_image_tag, written_files
+
+
+def _write_multi_container_files(program_arguments: ProgramArguments,
+                                 clusters: list["DependencyCluster"]) -> dict[str, str]:
+    # One directory per image (the shared base and every cluster), each its own build context, plus the compose file
+    from bsander.pbic3g.containerization.container_environment import ContainerEnvironment, \
+        render_apptainer_definition
+    from bsander.pbic3g.containerization.multi_container import render_multi_container_files
+    from bsander.pbic3g.containerization.output_cache import APPTAINER_DEFINITION_NAME
+    from bsander.pbic3g.dependency_resolution.lockfile import generate_lockfiles
+    engine = program_arguments.containerization_engine
+    template_mode = program_arguments.template_mode
+    with span("generate_lockfiles", clusters=len(clusters)):
+        lockfiles_by_cluster = { cluster.name : generate_lockfiles(cluster.pypi_deps, cluster.conda_deps,
+                                                                   program_arguments.pypi_lock_index,
+                                                                   program_arguments.conda_lock_channel,
+                                                                   program_arguments.conda_lock_channel_url)
+                                 for cluster in clusters }
+    with span("render_container_files", clusters=len(clusters)):
+        container_files = render_multi_container_files(clusters, template_mode, engine, lockfiles_by_cluster)
+    if engine == ContainerizationEngine.APPTAINER:  # only the definitions (and the lockfiles they install) are wanted
+        container_files = { f"{cluster_name}/{lockfile_name}" : lockfile_contents
+                            for cluster_name, lockfiles in lockfiles_by_cluster.items()
+                            for lockfile_name, lockfile_contents in lockfiles.items() }
+    if engine == ContainerizationEngine.APPTAINER or engine == ContainerizationEngine.BOTH:
+        # Apptainer has no named build contexts, so every cluster's definition carries the base steps itself
+        with span("render_apptainer_definitions", clusters=len(clusters)):
+            for cluster in clusters:
+                cluster_environment = ContainerEnvironment(cluster.pypi_deps, cluster.conda_deps, template_mode,
+                                                           set(lockfiles_by_cluster[cluster.name]))
+                container_files[f"{cluster.name}/{APPTAINER_DEFINITION_NAME}"] = render_apptainer_definition(
+                    cluster_environment)
+    for relative_path, contents in container_files.items():
+        container_file_path = os.path.join(program_arguments.output_dir, relative_path)
+        os.makedirs(os.path.dirname(container_file_path), exist_ok=True)
+        _write_output_file(container_file_path, contents)
+        print(f"Container build file located at '{container_file_path}'")
+    for cluster in clusters:
+        print(f"Cluster '{cluster.name}' runs: {', '.join(cluster.process_paths)}")
+    return container_files
+
+
+def _write_output_file(output_file_path: str, contents: str):
+    with open(output_file_path, "w") as output_file:
+        output_file.write(contents)
+    count("bytes_written", os.path.getsize(output_file_path))
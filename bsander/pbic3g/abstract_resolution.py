@@ -0,0 +1,250 @@
+### File that resolves abstract processes: nodes addressed as `abstract:<base class>` are substituted with the concrete
+### Process / Step from the local registry that best fits them. A node's `inputs`, `outputs` and `config` keys are what
+### the implementation has to declare; `abstract:` alone (no base) matches on those alone.
+import io
+import json
+import mmap
+import os
+import tempfile
+from collections import Counter
+from dataclasses import dataclass
+
+from bsander.bsandr_utils.pbif_stream import PbifFormatError, rewrite_pbif_addresses
+from bsander.pbic3g.registry_cache import RegistryEntry
+
+ABSTRACT_PROTOCOL: str = "abstract"
+_address_key = "address"
+_inputs_key = "inputs"
+_outputs_key = "outputs"
+_config_key = "config"
+_type_key = "_type"
+_kinds_by_node_type = {"process": {"Process", "Composite"}, "step": {"Step"}}
+
+
+class AbstractResolutionError(ValueError):
+    def __init__(self, unresolved_nodes: list[str]):
+        super().__init__("No registered implementation fits these abstract processes:\n  "
+                         + "\n  ".join(unresolved_nodes))
+        self.unresolved_nodes = unresolved_nodes
+
+
+@dataclass(frozen=True)
+class AbstractRequirement:
+    base: str | None
+    inputs: frozenset[str]
+    outputs: frozenset[str]
+    config_keys: frozenset[str]
+    kinds: frozenset[str] | None = None  # `None` accepts any kind
+
+    def describe(self) -> str:
+        return (f"{ABSTRACT_PROTOCOL}:{self.base or ''} (inputs: {sorted(self.inputs)}, "
+                f"outputs: {sorted(self.outputs)}, config: {sorted(self.config_keys)})")
+
+
+class ImplementationIndex:
+    def __init__(self, local_registry: dict[str, list[RegistryEntry]]):
+        # Built once per registry; every lookup after that only touches the postings it needs
+        self.implementations: list[tuple[str, RegistryEntry]] = []
+        self.by_base: dict[str, set[int]] = {}  # qualified *and* short ancestor names -> implementation ids
+        self.by_port: dict[tuple[str, str], set[int]] = {}  # (direction, port name) -> implementation ids
+        self.unknown_port_ids: dict[str, set[int]] = {_inputs_key: set(), _outputs_key: set()}
+        self._best_matches: dict[AbstractRequirement, tuple[str, RegistryEntry] | None] = {}
+        for distribution_name in sorted(local_registry):
+            for entry in local_registry[distribution_name]:
+                implementation_id = len(self.implementations)
+                self.implementations.append((distribution_name, entry))
+                for base in entry.bases:
+                    self.by_base.setdefault(base, set()).add(implementation_id)
+                    self.by_base.setdefault(base.rpartition(".")[2], set()).add(implementation_id)
+                for direction, ports in [(_inputs_key, entry.inputs), (_outputs_key, entry.outputs)]:
+                    if ports is None:
+                        self.unknown_port_ids[direction].add(implementation_id)
+                        continue
+                    for port in ports:
+                        self.by_port.setdefault((direction, port), set()).add(implementation_id)
+
+    def find_best_implementation(self, requirement: AbstractRequirement) -> tuple[str, RegistryEntry] | None:
+        # Returns (distribution name, entry). Documents repeat the same abstract node many times, so answers are kept.
+        if requirement not in self._best_matches:
+            self._best_matches[requirement] = self._search(requirement)
+        return self._best_matches[requirement]
+
+    def _search(self, requirement: AbstractRequirement) -> tuple[str, RegistryEntry] | None:
+        postings: list[set[int]] = []
+        if requirement.base is not None:
+            postings.append(self.by_base.get(requirement.base, set()))
+        for direction, ports in [(_inputs_key, requirement.inputs), (_outputs_key, requirement.outputs)]:
+            for port in ports:
+                postings.append(self.by_port.get((direction, port), set()) | self.unknown_port_ids[direction])
+        if len(postings) == 0:
+            return None  # nothing to go on; every implementation would fit equally (and arbitrarily)
+        postings.sort(key=len)  # intersect from the rarest up
+        candidate_ids = set(postings[0])
+        for posting in postings[1:]:
+            candidate_ids &= posting
+            if len(candidate_ids) == 0:
+                return None
+        best_id: int | None = None
+        best_score: tuple | None = None
+        for candidate_id in candidate_ids:
+            score = self._score(candidate_id, requirement)
+            if score is not None and (best_score is None or score < best_score):
+                best_id, best_score = candidate_id, score
+        return self.implementations[best_id] if best_id is not None else None
+
+    def _score(self, implementation_id: int, requirement: AbstractRequirement) -> tuple | None:
+        # Lower is better: known interfaces over guesses, then the fewest unused ports, then the nearest descendant
+        distribution_name, entry = self.implementations[implementation_id]
+        if requirement.kinds is not None and entry.kind not in requirement.kinds:
+            return None
+        if entry.config_keys is not None and not requirement.config_keys <= set(entry.config_keys):
+            return None  # the node configures something the implementation doesn't accept
+        unknown_count = sum(1 for names in [entry.inputs, entry.outputs, entry.config_keys] if names is None)
+        unused_ports = sum(len(set(ports) - required) for ports, required in
+                           [(entry.inputs, requirement.inputs), (entry.outputs, requirement.outputs)]
+                           if ports is not None)
+        base_distance = 0
+        if requirement.base is not None:
+            base_distance = next(index for index, base in enumerate(entry.bases)
+                                 if base == requirement.base or base.rpartition(".")[2] == requirement.base)
+        return unknown_count, unused_ports, base_distance, entry.address, distribution_name
+
+
+_indexes: dict[int, tuple[dict, ImplementationIndex]] = {}
+
+
+def get_implementation_index(local_registry: dict[str, list[RegistryEntry]]) -> ImplementationIndex:
+    # Batch runs (and the daemon) share one registry across many documents; its index is built once
+    cached = _indexes.get(id(local_registry))
+    if cached is None or cached[0] is not local_registry:
+        cached = (local_registry, ImplementationIndex(local_registry))
+        _indexes.clear()
+        _indexes[id(local_registry)] = cached
+    return cached[1]
+
+
+def contains_abstract_processes(pb_document_str: str) -> bool:
+    # A cheap pre-check: documents without any abstract address need neither the registry nor a parse
+    return f'"{ABSTRACT_PROTOCOL}:' in pb_document_str
+
+
+def resolve_abstract_text(pb_document_str: str, implementation_index: ImplementationIndex) -> tuple[str, int]:
+    # Returns the document with every abstract address substituted (and the number substituted). Only `address`
+    # values change; everything else is echoed exactly as written.
+    if not contains_abstract_processes(pb_document_str):
+        return pb_document_str, 0
+    try:
+        pb_document = json.loads(pb_document_str, object_pairs_hook=_reject_duplicate_keys)
+    except PbifFormatError:
+        raise
+    except ValueError:
+        return pb_document_str, 0  # not JSON, so there are no nodes (or ports) to resolve against
+    if not isinstance(pb_document, dict):
+        raise PbifFormatError("PBIF documents must be JSON objects; unable to resolve abstract processes")
+    abstract_nodes: list[tuple[str, AbstractRequirement]] = []
+    _collect_abstract_nodes(pb_document, [], abstract_nodes)
+    resolved_addresses: list[str] = []
+    unresolved_nodes: list[str] = []
+    for node_path, requirement in abstract_nodes:
+        best_implementation = implementation_index.find_best_implementation(requirement)
+        if best_implementation is None:
+            unresolved_nodes.append(f"`{node_path}`: {requirement.describe()}")
+            continue
+        distribution_name, entry = best_implementation
+        # Addressed through its distribution, so containerization installs whatever provides it
+        resolved_addresses.append(f"pypi:{distribution_name}@{entry.address}")
+    if len(unresolved_nodes) != 0:
+        raise AbstractResolutionError(unresolved_nodes)
+
+    # Both walks see the same addresses in the same order (duplicate keys, which `json` would drop, are rejected above);
+    # checked anyway, as a mismatch would hand nodes each other's implementations
+    pending_addresses = iter(resolved_addresses)
+
+    def substitute(address: str) -> str:
+        if _parse_abstract_base(address) is False:
+            return address
+        resolved_address = next(pending_addresses, None)
+        if resolved_address is None:
+            raise PbifFormatError("found more abstract addresses than abstract nodes; unable to resolve them")
+        return resolved_address
+
+    resolved_document = io.StringIO()
+    rewrite_pbif_addresses(io.StringIO(pb_document_str), resolved_document, substitute)
+    if next(pending_addresses, None) is not None:
+        raise PbifFormatError("found fewer abstract addresses than abstract nodes; unable to resolve them")
+    return resolved_document.getvalue(), len(resolved_addresses)
+
+
+def file_contains_abstract_processes(pbif_path: str) -> bool:
+    # `contains_abstract_processes` for a file, scanned through a memory map: no document text is built, so concrete
+    # documents (the usual case) of any size cost one pass over their pages
+    with open(pbif_path, "rb") as pbif_file:
+        if os.fstat(pbif_file.fileno()).st_size == 0:
+            return False  # empty files can't be mapped
+        with mmap.mmap(pbif_file.fileno(), 0, access=mmap.ACCESS_READ) as pbif_buffer:
+            return pbif_buffer.find(f'"{ABSTRACT_PROTOCOL}:'.encode("utf-8")) != -1
+
+
+def resolve_abstract_file(pbif_path: str, implementation_index: ImplementationIndex,
+                          source_path: str | None = None) -> int:
+    # Resolves the document at `source_path` (by default, `pbif_path` itself) into `pbif_path`, which is only
+    # (atomically) written if anything was resolved
+    source_path = source_path if source_path is not None else pbif_path
+    if not file_contains_abstract_processes(source_path):
+        return 0
+    with open(source_path, "r") as pbif_file:
+        pb_document_str = pbif_file.read()
+    resolved_document_str, resolved_count = resolve_abstract_text(pb_document_str, implementation_index)
+    if resolved_count != 0:
+        file_descriptor, temp_path = tempfile.mkstemp(dir=os.path.dirname(os.path.abspath(pbif_path)),
+                                                      prefix=".bsander-", suffix=".pbif")
+        try:
+            with os.fdopen(file_descriptor, "w") as temp_file:
+                temp_file.write(resolved_document_str)
+            os.replace(temp_path, pbif_path)
+        except BaseException:
+            if os.path.exists(temp_path):
+                os.remove(temp_path)
+            raise
+    return resolved_count
+
+
+def _reject_duplicate_keys(pairs: list[tuple[str, object]]) -> dict:
+    # `json` keeps only the last of repeated keys, while the streaming rewriter visits every one of them
+    node = dict(pairs)
+    if len(node) != len(pairs):
+        duplicate_keys = sorted(key for key, occurrences in Counter(key for key, _ in pairs).items() if occurrences > 1)
+        raise PbifFormatError(f"duplicate keys {duplicate_keys}; unable to tell which abstract process is meant")
+    return node
+
+
+def _collect_abstract_nodes(node, path: list[str], abstract_nodes: list[tuple[str, AbstractRequirement]]):
+    # Same traversal order as the streaming rewriter, so the n-th abstract address found is the n-th one rewritten
+    if isinstance(node, dict):
+        for key, child in node.items():
+            if key == _address_key and isinstance(child, str):
+                base = _parse_abstract_base(child)
+                if base is not False:
+                    abstract_nodes.append((".".join(path) or "<root>", _build_requirement(node, base)))
+            _collect_abstract_nodes(child, path + [key], abstract_nodes)
+    elif isinstance(node, list):
+        for index, child in enumerate(node):
+            _collect_abstract_nodes(child, path + [str(index)], abstract_nodes)
+
+
+def _parse_abstract_base(address: str) -> str | None | bool:
+    # The base named by an abstract address (`None` if it names none), or `False` for any other address
+    protocol, separator, base = address.strip().partition(":")
+    if separator == "" or protocol != ABSTRACT_PROTOCOL:
+        return False
+    return base.strip() or None
+
+
+def _build_requirement(node: dict, base: str | None) -> AbstractRequirement:
+    def keys_of(key: str) -> frozenset[str]:
+        value = node.get(key)
+        return frozenset(value) if isinstance(value, dict) else frozenset()
+    node_type = node.get(_type_key)
+    kinds = _kinds_by_node_type.get(node_type) if isinstance(node_type, str) else None
+    return AbstractRequirement(base, keys_of(_inputs_key), keys_of(_outputs_key), keys_of(_config_key),
+                               frozenset(kinds) if kinds is not None else None)
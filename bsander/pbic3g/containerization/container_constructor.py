@@ -1,50 +1,103 @@
+import io
+import json
 import os.path
 import re
+import tempfile
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable
 
-from bsander.bsandr_utils.input_types import ProgramArguments
-from bsander.pbic3g.containerization.container_file import get_generic_dockerfile_template, pull_substitution_keys_from_document
+from bsander.bsandr_utils.input_types import ProgramArguments, DockerfileTemplateMode
+from bsander.bsandr_utils.instrumentation import carry_context, count
+from bsander.bsandr_utils.pbif_stream import PbifFormatError, rewrite_pbif_addresses
+from bsander.pbic3g.containerization.container_file import get_dockerfile_template, get_pypi_section_template, \
+    get_conda_section_template, get_locked_pypi_section_template, get_locked_conda_section_template, \
+    get_apptainer_pypi_section_template, get_apptainer_conda_section_template, \
+    get_apptainer_locked_pypi_section_template, get_apptainer_locked_conda_section_template, \
+    pull_substitution_keys_from_document
+from bsander.pbic3g.dependency_resolution.lockfile import PYPI_LOCKFILE_NAME, CONDA_LOCKFILE_NAME
+from bsander.pbic3g.dependency_resolution.whitelist import WhitelistIndex, get_whitelist_index, \
+    merge_dependency_constraints, normalize_package_name
 
 def formulate_dockerfile_for_necessary_env(program_arguments: ProgramArguments) -> str:
-    docker_template: str = get_generic_dockerfile_template()
-    pb_document_str: str
-    with open(program_arguments.input_file_path, "r") as pb_document_file:
-        pb_document_str = pb_document_file.read()
-    pypi_deps, conda_deps, updated_document_str = determine_dependencies(pb_document_str, program_arguments.whitelist_entries)
-    if updated_document_str != pb_document_str: # we need to update file
-        with open(program_arguments.input_file_path, "w") as pb_document_file:
-            pb_document_file.write(updated_document_str)
+    pypi_deps, conda_deps = localize_document_dependencies(program_arguments.input_file_path,
+                                                           program_arguments.input_file_path,
+                                                           program_arguments.whitelist_entries)
+    return fill_dockerfile_template(get_dockerfile_template(program_arguments.template_mode), pypi_deps, conda_deps,
+                                    program_arguments.template_mode)
+
+
+def fill_dockerfile_template(docker_template: str, pypi_deps: list[str], conda_deps: list[str],
+                             template_mode: DockerfileTemplateMode = DockerfileTemplateMode.GENERIC,
+                             lockfile_names: set[str] | None = None) -> str:
+    # `lockfile_names` are lockfiles written next to the container file; sources they cover install from them
+    section_templates = {
+        "PYPI_DEPENDENCIES": (get_pypi_section_template(template_mode), get_locked_pypi_section_template(template_mode)),
+        "CONDA_FORGE_DEPENDENCIES": (get_conda_section_template(template_mode),
+                                     get_locked_conda_section_template(template_mode)),
+    }
+    return _fill_dependency_sections(docker_template, pypi_deps, conda_deps, template_mode, lockfile_names,
+                                     section_templates)
+
+
+def fill_apptainer_definition_template(definition_template: str, pypi_deps: list[str], conda_deps: list[str],
+                                       template_mode: DockerfileTemplateMode = DockerfileTemplateMode.GENERIC,
+                                       lockfile_names: set[str] | None = None) -> str:
+    # Same environment as `fill_dockerfile_template`, in Apptainer's definition format
+    lockfile_names = lockfile_names if lockfile_names is not None else set()
+    section_templates = {
+        "PYPI_DEPENDENCIES": (get_apptainer_pypi_section_template(), get_apptainer_locked_pypi_section_template()),
+        "CONDA_FORGE_DEPENDENCIES": (get_apptainer_conda_section_template(),
+                                     get_apptainer_locked_conda_section_template()),
+    }
+    filled_definition = _fill_dependency_sections(definition_template, pypi_deps, conda_deps, template_mode,
+                                                  lockfile_names, section_templates)
+    needed_files = [lockfile_name for lockfile_name in [CONDA_LOCKFILE_NAME, PYPI_LOCKFILE_NAME]
+                    if lockfile_name in lockfile_names
+                    and len(conda_deps if lockfile_name == CONDA_LOCKFILE_NAME else pypi_deps) != 0]
+    files_section = "%files\n" + "\n".join(f"{lockfile_name} /tmp/bsander/{lockfile_name}"
+                                            for lockfile_name in needed_files) if len(needed_files) != 0 else ""
+    filled_definition = filled_definition.replace("$${#FILES}", files_section)
+    return re.sub(r"\n{3,}", "\n\n", filled_definition)  # an empty `%files` leaves a gap behind
+
+
+def _fill_dependency_sections(template: str, pypi_deps: list[str], conda_deps: list[str],
+                              template_mode: DockerfileTemplateMode, lockfile_names: set[str] | None,
+                              section_templates: dict[str, tuple[str, str]]) -> str:
+    # `section_templates` maps each field to its (unlocked, locked) section template
+    lockfile_names = lockfile_names if lockfile_names is not None else set()
+    if template_mode == DockerfileTemplateMode.OPTIMIZED:
+        # Equivalent environments should produce identical (and so, cache-sharing) layers
+        pypi_deps, conda_deps = sorted(pypi_deps), sorted(conda_deps)
     for desired_field in generate_necessary_values():
         match_target: str = "$${#" + desired_field + "}"
+        if desired_field not in section_templates:
+            raise ValueError(f"unknown field in template dockerfile: {desired_field}")
+        section_template, locked_section_template = section_templates[desired_field]
         if "PYPI_DEPENDENCIES" == desired_field:
             if len(pypi_deps) == 0:
-                docker_template = docker_template.replace(match_target, "# No PyPI dependencies!")
+                template = template.replace(match_target, "# No PyPI dependencies!")
+                continue
+            if PYPI_LOCKFILE_NAME in lockfile_names:
+                template = template.replace(match_target,
+                                            locked_section_template.replace("$${#LOCKFILE}", PYPI_LOCKFILE_NAME))
                 continue
-            pypi_section = \
-"""
-RUN python3 -m pip install $${#DEPENDENCIES}
-""".strip()
             dependency_str = convert_dependencies_to_installation_string_representation(pypi_deps)
-            filled_section = pypi_section.replace("$${#DEPENDENCIES}", dependency_str)
-            docker_template = docker_template.replace(match_target, filled_section)
+            template = template.replace(match_target, section_template.replace("$${#DEPENDENCIES}", dependency_str))
         elif "CONDA_FORGE_DEPENDENCIES" == desired_field:
             if len(conda_deps) == 0:
-                docker_template = docker_template.replace(match_target, "# No conda dependencies!")
+                template = template.replace(match_target, "# No conda dependencies!")
                 continue
-            conda_section = \
-"""
-RUN mkdir /micromamba
-RUN curl -Ls https://micro.mamba.pm/api/micromamba/linux-64/latest | tar -xvj bin/micromamba
-RUN mv bin/micromamba /usr/local/bin/
-RUN micromamba create -y -p /opt/conda -c conda-forge $${#DEPENDENCIES} python=3.12
-ENV PATH=/opt/conda/bin:$PATH
-""".strip()
-            dependency_str = " ".join(conda_deps)
-            filled_section = conda_section.replace("$${#DEPENDENCIES}", dependency_str)
-            docker_template = docker_template.replace(match_target, filled_section)
-        else:
-            raise ValueError(f"unknown field in template dockerfile: {desired_field}")
+            if CONDA_LOCKFILE_NAME in lockfile_names:
+                template = template.replace(match_target,
+                                            locked_section_template.replace("$${#LOCKFILE}", CONDA_LOCKFILE_NAME))
+                continue
+            if template_mode == DockerfileTemplateMode.OPTIMIZED:
+                dependency_str = convert_dependencies_to_installation_string_representation(conda_deps)
+            else:
+                dependency_str = " ".join(conda_deps)
+            template = template.replace(match_target, section_template.replace("$${#DEPENDENCIES}", dependency_str))
 
-    return docker_template
+    return template
 
 
 def generate_necessary_values() -> list[str]:
@@ -54,54 +107,300 @@ def generate_necessary_values() -> list[str]:
 # in the same python environment, we need a solid address protocol to assume.
 # going with: `pypi:<package_name>[<version_statement>]@<python_module_path_to_class_def>`
 #         ex: "pypi:copasi-basico[~0.8]@basico.model_io.load_model" (if this was a class, and not a function)
-def determine_dependencies(string_to_search: str, whitelist_entries: list[str] = None) -> tuple[list[str],list[str], str]:
-    whitelist_mapping: dict[str, set[str]] | None
-    if whitelist_entries is not None:
-        whitelist_mapping = {}
-        for whitelist_entry in whitelist_entries:
-            entry = whitelist_entry.split(":")
-            if len(entry) != 2:
-                raise ValueError(f"invalid whitelist entry: {whitelist_entry}")
-            source, package = (entry[0],entry[1])
-            if source not in whitelist_mapping:
-                whitelist_mapping[source] = set()
-            whitelist_mapping[source].add(package)
-    else:
-        whitelist_mapping = None
-    source_name_legal_syntax = r"[\w\-]+"
-    package_name_legal_syntax = r"[\w\-._~:/?#[\]@!$&'()*+,;=%]+" # package or git-http repo name
-    version_string_legal_syntax = r"\[([\w><=~!*\-.]+)]" # hard brackets around alphanumeric plus standard python version constraint characters
-    import_name_legal_syntax = r"[A-Za-z_]\w*(\.[A-Za-z_]\w*)*" # stricter pattern of only legal python module names (letters and underscore first character, alphanumeric and underscore for remainder); must be at least 1 char long
-    known_sources = ["pypi", "conda"]
-    approved_dependencies: dict[str, list[str]] = { source : [] for source in known_sources }
-    regex_pattern = f"({source_name_legal_syntax}):({package_name_legal_syntax})({version_string_legal_syntax})?@({import_name_legal_syntax})"
-    adjusted_search_string = str(string_to_search)
-    matches = re.findall(regex_pattern, string_to_search)
-    if len(matches) == 0:
-        local_protocol_matches = re.findall(f"local:{import_name_legal_syntax}", string_to_search)
-        if len(local_protocol_matches) == 0:
-            raise ValueError(f"No dependencies found in document; unable to generate environment.")
-        raise ValueError("Document is using local protocols; unable to determine needed environment.")
-    for match in matches:
-        source_name = match[0]
-        package_name = match[1]
-        package_version = match[3]
-        if source_name not in known_sources:
+_source_name_legal_syntax = r"[\w\-]+"
+_package_name_legal_syntax = r"[\w\-._~:/?#[\]@!$&'()*+,;=%]+" # package or git-http repo name
+_version_string_legal_syntax = r"\[([\w><=~!*\-.]+)]" # hard brackets around alphanumeric plus standard python version constraint characters
+_import_name_legal_syntax = r"[A-Za-z_]\w*(?:\.[A-Za-z_]\w*)*" # stricter pattern of only legal python module names (letters and underscore first character, alphanumeric and underscore for remainder); must be at least 1 char long
+_address_start_legal_syntax = r"(?<![\w\-])" # a source may only begin where a word begins
+_known_sources = ["pypi", "conda"]
+# Compiled once; groups are: source, package, bracketed version, version, import path.
+# The lookbehind only lets a source start at the beginning of a word, so long runs of word characters
+# (descriptions, hashes, etc.) are not re-scanned from every offset.
+_dependency_address_pattern = re.compile(
+    f"{_address_start_legal_syntax}({_source_name_legal_syntax}):({_package_name_legal_syntax})({_version_string_legal_syntax})?@({_import_name_legal_syntax})")
+_local_address_pattern = re.compile(f"local:{_import_name_legal_syntax}")
+_address_key = "address"
+
+
+class _DependencyCollector:
+    def __init__(self, whitelist: list[str] | WhitelistIndex | None):
+        # Entries are compiled once per distinct whitelist (and cached on disk); callers creating many collectors
+        # pass the compiled index instead, so large whitelists aren't even hashed again
+        self.whitelist_index: WhitelistIndex | None = get_whitelist_index(whitelist)
+        self.requested_constraints: dict[str, list[tuple[str, str]]] = { source : [] for source in _known_sources }
+        # source -> normalized package -> the version ranges its whitelist rule allows it at (`None` for any version)
+        self.allowed_constraints: dict[str, dict[str, list[str] | None]] = { source : {} for source in _known_sources }
+        # source -> (package, constraint) -> documents requesting it; only filled when merging several documents
+        self.constraint_origins: dict[str, dict[tuple[str, str], list[str]]] = { source : {} for source in _known_sources }
+        self.accounted_dependencies: dict[str, set[str]] = { source : set() for source in _known_sources }
+        self.localized_count: int = 0
+        self.local_protocol_count: int = 0
+
+    def approve_and_localize(self, match: re.Match) -> str:
+        source_name, package_name, _, package_version, import_path = match.groups()
+        package_version = package_version or ""
+        if source_name not in self.accounted_dependencies:
             raise ValueError(f"Unknown source `{source_name}` used; can not determine dependencies")
         dependency_str = f"{package_name}{package_version}".strip()
-        if dependency_str in approved_dependencies[source_name]:
-            continue # We've already accounted for this dependency
-        if whitelist_mapping is not None:
-            # We need to validate against whitelist!
-            if source_name not in whitelist_mapping:
-                raise ValueError(f"Unapproved source `{source_name}` used; can not trust document")
-            if package_name not in whitelist_mapping[source_name]:
-                raise ValueError(f"`{package_name}` from `{source_name}` is not a trusted package; can not trust document")
-        approved_dependencies[source_name].append(dependency_str)
-        version_str = match[2] if package_version != "" else ""
-        complete_match = f"{source_name}:{package_name}{version_str}@{match[4]}"
-        adjusted_search_string = adjusted_search_string.replace(complete_match, f"local:{match[4]}")
-    return approved_dependencies['pypi'], approved_dependencies['conda'], adjusted_search_string.strip()
+        if dependency_str not in self.accounted_dependencies[source_name]:
+            if self.whitelist_index is not None:
+                # We need to validate against whitelist!
+                if not self.whitelist_index.has_source(source_name):
+                    raise ValueError(f"Unapproved source `{source_name}` used; can not trust document")
+                is_allowed, allowed_ranges = self.whitelist_index.lookup(source_name, package_name)
+                if not is_allowed:
+                    raise ValueError(f"`{package_name}` from `{source_name}` is not a trusted package; can not trust document")
+                self.allowed_constraints[source_name][normalize_package_name(source_name, package_name)] = \
+                    allowed_ranges
+            self.accounted_dependencies[source_name].add(dependency_str)
+            self.requested_constraints[source_name].append((package_name, package_version.strip()))
+        self.localized_count += 1
+        return f"local:{import_path}"
+
+    def localize_address(self, address: str) -> str:
+        match = _dependency_address_pattern.fullmatch(address.strip())
+        if match is not None:
+            return self.approve_and_localize(match)
+        if _local_address_pattern.fullmatch(address.strip()) is not None:
+            self.local_protocol_count += 1
+        return address
+
+    def resolve_dependencies(self) -> tuple[list[str], list[str]]:
+        # One dependency per package, with every constraint on it (and its whitelist allowance) merged
+        resolved_dependencies: dict[str, list[str]] = {}
+        for source_name in _known_sources:
+            resolved_dependencies[source_name] = merge_dependency_constraints(
+                source_name, self.requested_constraints[source_name], self.allowed_constraints[source_name],
+                self.constraint_origins[source_name])
+        return resolved_dependencies['pypi'], resolved_dependencies['conda']
+
+    def absorb(self, other: "_DependencyCollector", document_name: str):
+        # Folds in what another document's collector found, remembering which document asked for what
+        self.localized_count += other.localized_count
+        self.local_protocol_count += other.local_protocol_count
+        for source_name in _known_sources:
+            for requested_constraint in other.requested_constraints[source_name]:
+                origins = self.constraint_origins[source_name].setdefault(requested_constraint, [])
+                if len(origins) == 0:
+                    self.requested_constraints[source_name].append(requested_constraint)
+                origins.append(document_name)
+            self.allowed_constraints[source_name].update(other.allowed_constraints[source_name])
+
+    def raise_if_nothing_localized(self):
+        if self.localized_count != 0:
+            return
+        if self.local_protocol_count == 0:
+            raise ValueError(f"No dependencies found in document; unable to generate environment.")
+        raise ValueError("Document is using local protocols; unable to determine needed environment.")
+
+
+def determine_dependencies(string_to_search: str, whitelist_entries: list[str] | WhitelistIndex | None = None) \
+        -> tuple[list[str],list[str], str]:
+    collector = _DependencyCollector(whitelist_entries)
+    adjusted_search_string = _scan_and_localize_text(string_to_search, collector)
+    collector.raise_if_nothing_localized()
+    pypi_deps, conda_deps = collector.resolve_dependencies()
+    return pypi_deps, conda_deps, adjusted_search_string.strip()
+
+
+def localize_document_dependencies(source_path: str, destination_path: str,
+                                   whitelist_entries: list[str] | WhitelistIndex | None = None) \
+        -> tuple[list[str], list[str]]:
+    # Streams a PBIF document from `source_path` to `destination_path` (which may be the same file), rewriting only
+    # the `address` fields. Documents that aren't JSON (e.g. address listings) fall back to scanning the whole text.
+    collector = _localize_document_file(source_path, destination_path, whitelist_entries)
+    collector.raise_if_nothing_localized()
+    return collector.resolve_dependencies()
+
+
+def localize_document_text(pb_document_str: str,
+                           whitelist_entries: list[str] | WhitelistIndex | None = None) \
+        -> tuple[list[str], list[str], str]:
+    # In-memory counterpart of `localize_document_dependencies`, for documents read straight out of an archive
+    collector, localized_document_str = _localize_document_str(pb_document_str, whitelist_entries)
+    collector.raise_if_nothing_localized()
+    pypi_deps, conda_deps = collector.resolve_dependencies()
+    return pypi_deps, conda_deps, localized_document_str
+
+
+def localize_many_document_files(document_paths: list[str],
+                                 whitelist_entries: list[str] | WhitelistIndex | None = None,
+                                 max_workers: int | None = None, resolve_environment: bool = True,
+                                 source_paths: list[str] | None = None) -> tuple[list[str], list[str]]:
+    # Localizes every document in place (or from the matching `source_paths` into it), concurrently, and merges their
+    # dependencies into one environment; conflicting constraints between documents are reported together, naming the
+    # documents involved. Without `resolve_environment` (one environment per cluster), documents are only localized.
+    source_paths = source_paths if source_paths is not None else document_paths
+    whitelist_index = get_whitelist_index(whitelist_entries)
+    collectors = _map_concurrently(lambda paths: _localize_document_file(paths[0], paths[1], whitelist_index),
+                                   list(zip(source_paths, document_paths)), max_workers)
+    count("addresses_localized", sum(collector.localized_count for collector in collectors))
+    return _merge_document_collectors(collectors, [os.path.basename(path) for path in document_paths],
+                                      resolve_environment)
+
+
+def localize_many_document_texts(pb_documents: dict[str, str],
+                                 whitelist_entries: list[str] | WhitelistIndex | None = None,
+                                 max_workers: int | None = None,
+                                 resolve_environment: bool = True) -> tuple[list[str], list[str], dict[str, str]]:
+    # In-memory counterpart of `localize_many_document_files`; returns the localized text of every document too
+    whitelist_index = get_whitelist_index(whitelist_entries)
+    results = _map_concurrently(lambda document_str: _localize_document_str(document_str, whitelist_index),
+                                list(pb_documents.values()), max_workers)
+    count("addresses_localized", sum(collector.localized_count for collector, _ in results))
+    pypi_deps, conda_deps = _merge_document_collectors([collector for collector, _ in results], list(pb_documents),
+                                                       resolve_environment)
+    return pypi_deps, conda_deps, { name : localized for name, (_, localized) in zip(pb_documents, results) }
+
+
+def _merge_document_collectors(collectors: list[_DependencyCollector], document_names: list[str],
+                               resolve_environment: bool = True) -> tuple[list[str], list[str]]:
+    if len(collectors) == 1:
+        merged_collector = collectors[0]
+    else:
+        merged_collector = _DependencyCollector(None)  # every document was already checked against the whitelist
+        for collector, document_name in zip(collectors, document_names):
+            merged_collector.absorb(collector, document_name)
+    merged_collector.raise_if_nothing_localized()
+    if not resolve_environment:
+        return [], []
+    return merged_collector.resolve_dependencies()
+
+
+def get_address_localizer(whitelist_entries: list[str] | WhitelistIndex | None = None) -> Callable[[str], str]:
+    # Rewrites one address at a time to the `local` protocol, enforcing the whitelist as it goes
+    return _DependencyCollector(whitelist_entries).localize_address
+
+
+def resolve_address_dependencies(addresses: list[str],
+                                 whitelist_entries: list[str] | WhitelistIndex | None = None) \
+        -> tuple[list[str], list[str]]:
+    # The environment for a document known only by its addresses (in document order; repeats may be left out)
+    collector = _DependencyCollector(whitelist_entries)
+    for address in addresses:
+        collector.localize_address(address)
+    collector.raise_if_nothing_localized()
+    return collector.resolve_dependencies()
+
+
+def collect_process_requirements(pb_document_str: str,
+                                 whitelist_entries: list[str] | WhitelistIndex | None = None,
+                                 document_name: str | None = None) -> dict[str, _DependencyCollector]:
+    # Splits a (not yet localized) document's dependencies up by the process that needs them: process path -> the
+    # collector that approved its address. JSON documents use the path to the node holding `address`; anything else
+    # treats every address as its own process.
+    addresses: list[tuple[str, str]] = []
+    try:
+        pb_document = json.loads(pb_document_str)
+    except ValueError:
+        pb_document = None
+    if isinstance(pb_document, dict):
+        _collect_addresses(pb_document, [], addresses)
+    else:
+        addresses = [(f"address-{index}", match.group(0))
+                     for index, match in enumerate(_dependency_address_pattern.finditer(pb_document_str))]
+    whitelist_index = get_whitelist_index(whitelist_entries)
+    process_requirements: dict[str, _DependencyCollector] = {}
+    for process_path, address in addresses:
+        if document_name is not None:
+            process_path = f"{document_name}:{process_path}"
+        if process_path not in process_requirements:
+            process_requirements[process_path] = _DependencyCollector(whitelist_index)
+        process_requirements[process_path].localize_address(address)
+    return { process_path : collector for process_path, collector in process_requirements.items()
+             if collector.localized_count != 0 }
+
+
+def get_process_package_keys(collector: _DependencyCollector) -> set[tuple[str, str]]:
+    # `(source, normalized package)` for every package a process needs; processes sharing one can share an image
+    return { (source_name, normalize_package_name(source_name, package))
+             for source_name in _known_sources for package, _ in collector.requested_constraints[source_name] }
+
+
+def resolve_process_group_dependencies(process_collectors: dict[str, _DependencyCollector]) -> tuple[list[str], list[str]]:
+    # One environment for a group of processes; conflicts name the processes involved
+    return _merge_document_collectors(list(process_collectors.values()), list(process_collectors))
+
+
+def _collect_addresses(node, path: list[str], addresses: list[tuple[str, str]]):
+    if isinstance(node, dict):
+        if isinstance(node.get(_address_key), str):
+            addresses.append((".".join(path) or "<root>", node[_address_key]))
+        for key, child in node.items():
+            _collect_addresses(child, path + [key], addresses)
+    elif isinstance(node, list):
+        for index, child in enumerate(node):
+            _collect_addresses(child, path + [str(index)], addresses)
+
+
+def _map_concurrently(function, items: list, max_workers: int | None) -> list:
+    if len(items) <= 1:
+        return [function(item) for item in items]
+    max_workers = max_workers if max_workers is not None else (os.cpu_count() or 1)
+    with ThreadPoolExecutor(max_workers=min(max_workers, len(items))) as executor:
+        return list(executor.map(carry_context(function), items))
+
+
+def _localize_document_file(source_path: str, destination_path: str,
+                            whitelist_entries: list[str] | WhitelistIndex | None) -> _DependencyCollector:
+    collector = _DependencyCollector(whitelist_entries)
+    destination_dir = os.path.dirname(os.path.abspath(destination_path))
+    file_descriptor, temp_path = tempfile.mkstemp(dir=destination_dir, prefix=".bsander-", suffix=".pbif")
+    try:
+        with open(source_path, "r") as pb_document_file, os.fdopen(file_descriptor, "w") as temp_file:
+            # One pass scans and writes, so the destination is written even where nothing was rewritten; knowing that
+            # up front would take a second full read
+            rewritten_count = rewrite_pbif_addresses(pb_document_file, temp_file, collector.localize_address)
+        if rewritten_count != 0 or os.path.abspath(source_path) != os.path.abspath(destination_path):
+            os.replace(temp_path, destination_path)
+        return collector
+    except PbifFormatError:
+        pass
+    finally:
+        if os.path.exists(temp_path):
+            os.remove(temp_path)
+    pb_document_str: str
+    with open(source_path, "r") as pb_document_file:
+        pb_document_str = pb_document_file.read()
+    collector = _DependencyCollector(whitelist_entries)  # discard anything seen before the format error
+    updated_document_str = _scan_and_localize_text(pb_document_str, collector).strip()
+    if updated_document_str != pb_document_str or os.path.abspath(source_path) != os.path.abspath(destination_path):
+        _write_atomically(destination_path, updated_document_str)  # a failed write leaves the document as it was
+    return collector
+
+
+def _write_atomically(destination_path: str, contents: str):
+    file_descriptor, temp_path = tempfile.mkstemp(dir=os.path.dirname(os.path.abspath(destination_path)),
+                                                  prefix=".bsander-", suffix=".pbif")
+    try:
+        with os.fdopen(file_descriptor, "w") as temp_file:
+            temp_file.write(contents)
+        os.replace(temp_path, destination_path)
+    except BaseException:
+        if os.path.exists(temp_path):
+            os.remove(temp_path)
+        raise
+
+
+def _localize_document_str(pb_document_str: str,
+                           whitelist_entries: list[str] | WhitelistIndex | None) -> tuple[_DependencyCollector, str]:
+    collector = _DependencyCollector(whitelist_entries)
+    localized_document = io.StringIO()
+    try:
+        rewrite_pbif_addresses(io.StringIO(pb_document_str), localized_document, collector.localize_address)
+        return collector, localized_document.getvalue()
+    except PbifFormatError:
+        collector = _DependencyCollector(whitelist_entries)  # discard anything seen before the format error
+        return collector, _scan_and_localize_text(pb_document_str, collector).strip()
+
+
+def _scan_and_localize_text(string_to_search: str, collector: _DependencyCollector) -> str:
+    # A single pass both collects every dependency and rewrites its address to the `local` protocol
+    adjusted_search_string = _dependency_address_pattern.sub(collector.approve_and_localize, string_to_search)
+    if collector.localized_count == 0:
+        collector.local_protocol_count = len(_local_address_pattern.findall(string_to_search))
+    return adjusted_search_string
+
 
 def convert_dependencies_to_installation_string_representation(dependencies: list[str]) -> str:
     return "'"+ "' '".join(dependencies) + "'"
@@ -0,0 +1,59 @@
+### File that renders every engine's container build file from one in-memory description of the environment, so
+### no engine's output is derived by re-parsing another's.
+from dataclasses import dataclass, field
+from typing import Callable
+
+from bsander.bsandr_utils.input_types import ContainerizationEngine, DockerfileTemplateMode
+from bsander.pbic3g.containerization.container_constructor import fill_dockerfile_template, \
+    fill_apptainer_definition_template
+from bsander.pbic3g.containerization.container_file import get_dockerfile_template, \
+    get_apptainer_definition_template
+from bsander.pbic3g.containerization.output_cache import DOCKERFILE_NAME, APPTAINER_DEFINITION_NAME
+
+
+@dataclass
+class ContainerEnvironment:
+    pypi_deps: list[str]
+    conda_deps: list[str]
+    template_mode: DockerfileTemplateMode = DockerfileTemplateMode.GENERIC
+    lockfile_names: set[str] = field(default_factory=set)  # lockfiles placed next to the container build files
+
+
+def render_dockerfile(environment: ContainerEnvironment) -> str:
+    return fill_dockerfile_template(get_dockerfile_template(environment.template_mode), environment.pypi_deps,
+                                    environment.conda_deps, environment.template_mode, environment.lockfile_names)
+
+
+def render_apptainer_definition(environment: ContainerEnvironment) -> str:
+    return fill_apptainer_definition_template(get_apptainer_definition_template(), environment.pypi_deps,
+                                              environment.conda_deps, environment.template_mode,
+                                              environment.lockfile_names)
+
+
+_container_file_renderers: dict[str, Callable[[ContainerEnvironment], str]] = {
+    DOCKERFILE_NAME: render_dockerfile,
+    APPTAINER_DEFINITION_NAME: render_apptainer_definition,
+}
+
+
+def get_engine_container_file_names(engine: ContainerizationEngine) -> list[str]:
+    if engine == ContainerizationEngine.DOCKER:
+        return [DOCKERFILE_NAME]
+    if engine == ContainerizationEngine.APPTAINER:
+        return [APPTAINER_DEFINITION_NAME]
+    return [DOCKERFILE_NAME, APPTAINER_DEFINITION_NAME]
+
+
+def get_engine_templates(engine: ContainerizationEngine,
+                         template_mode: DockerfileTemplateMode = DockerfileTemplateMode.GENERIC) -> str:
+    # Everything the engine's files are rendered from; part of the output cache key
+    templates = { DOCKERFILE_NAME : get_dockerfile_template(template_mode),
+                  APPTAINER_DEFINITION_NAME : get_apptainer_definition_template() }
+    return "\n".join(templates[file_name] for file_name in get_engine_container_file_names(engine))
+
+
+def render_container_files(environment: ContainerEnvironment, engine: ContainerizationEngine) -> dict[str, str]:
+    # file name -> contents, for every file the engine builds from; each engine's file is rendered independently.
+    # Rendering is short, pure-Python string work, so threads would only add their start-up cost.
+    return { file_name : _container_file_renderers[file_name](environment)
+             for file_name in get_engine_container_file_names(engine) }
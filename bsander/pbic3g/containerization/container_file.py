@@ -1,5 +1,13 @@
 import re
 
+from bsander.bsandr_utils.input_types import DockerfileTemplateMode
+
+
+def get_dockerfile_template(template_mode: DockerfileTemplateMode = DockerfileTemplateMode.GENERIC) -> str:
+    if template_mode == DockerfileTemplateMode.OPTIMIZED:
+        return get_optimized_dockerfile_template()
+    return get_generic_dockerfile_template()
+
 def get_generic_dockerfile_template() -> str:
     return """
 FROM ghcr.io/astral-sh/uv:python3.12-bookworm
@@ -24,6 +32,236 @@ RUN python3 -m pip install -e /runtime
 ENTRYPOINT ["python3", "/runtime/main.py"]
 """.strip()
 
+# Requires BuildKit. Everything that rarely changes (system packages, the micromamba binary, conda, then PyPI
+# dependencies) comes before the runtime checkout, and package manager caches live in cache mounts instead of layers.
+def get_optimized_dockerfile_template() -> str:
+    return """
+# syntax=docker/dockerfile:1
+FROM ghcr.io/astral-sh/uv:python3.12-bookworm
+
+ENV UV_LINK_MODE=copy UV_COMPILE_BYTECODE=1 MAMBA_ROOT_PREFIX=/opt/micromamba
+
+RUN --mount=type=cache,target=/var/cache/apt,sharing=locked \\
+    --mount=type=cache,target=/var/lib/apt,sharing=locked \\
+    rm -f /etc/apt/apt.conf.d/docker-clean \\
+    && apt-get update \\
+    && apt-get upgrade -y \\
+    && apt-get install -y --no-install-recommends git ca-certificates
+
+## Dependency Installs
+### Conda
+$${#CONDA_FORGE_DEPENDENCIES}
+
+### PyPI
+$${#PYPI_DEPENDENCIES}
+
+##
+WORKDIR /runtime
+RUN git clone https://github.com/biosimulators/bsew.git /runtime
+RUN --mount=type=cache,target=/root/.cache/uv \\
+    uv pip install --system -e /runtime
+
+ENTRYPOINT ["python3", "/runtime/main.py"]
+""".strip()
+
+
+# MULTIPLE containerization: what every cluster shares (system packages and the runtime checkout) lives in one base
+# image, and each cluster's image starts `FROM base`, a named build context the orchestration file points at that image
+def get_base_dockerfile_template(template_mode: DockerfileTemplateMode = DockerfileTemplateMode.GENERIC) -> str:
+    if template_mode == DockerfileTemplateMode.OPTIMIZED:
+        return """
+# syntax=docker/dockerfile:1
+FROM ghcr.io/astral-sh/uv:python3.12-bookworm
+
+ENV UV_LINK_MODE=copy UV_COMPILE_BYTECODE=1 MAMBA_ROOT_PREFIX=/opt/micromamba
+
+RUN --mount=type=cache,target=/var/cache/apt,sharing=locked \\
+    --mount=type=cache,target=/var/lib/apt,sharing=locked \\
+    rm -f /etc/apt/apt.conf.d/docker-clean \\
+    && apt-get update \\
+    && apt-get upgrade -y \\
+    && apt-get install -y --no-install-recommends git ca-certificates
+
+WORKDIR /runtime
+RUN git clone https://github.com/biosimulators/bsew.git /runtime
+""".strip()
+    return """
+FROM ghcr.io/astral-sh/uv:python3.12-bookworm
+
+RUN apt update
+RUN apt upgrade -y
+RUN apt install -y git curl
+
+RUN mkdir /runtime
+WORKDIR /runtime
+RUN git clone https://github.com/biosimulators/bsew.git  /runtime
+""".strip()
+
+
+def get_cluster_dockerfile_template(template_mode: DockerfileTemplateMode = DockerfileTemplateMode.GENERIC) -> str:
+    if template_mode == DockerfileTemplateMode.OPTIMIZED:
+        return """
+# syntax=docker/dockerfile:1
+FROM base
+
+## Dependency Installs
+### Conda
+$${#CONDA_FORGE_DEPENDENCIES}
+
+### PyPI
+$${#PYPI_DEPENDENCIES}
+
+##
+RUN --mount=type=cache,target=/root/.cache/uv \\
+    uv pip install --system -e /runtime
+
+ENTRYPOINT ["python3", "/runtime/main.py"]
+""".strip()
+    return """
+FROM base
+
+## Dependency Installs
+### Conda
+$${#CONDA_FORGE_DEPENDENCIES}
+
+### PyPI
+$${#PYPI_DEPENDENCIES}
+
+##
+RUN python3 -m pip install -e /runtime
+
+ENTRYPOINT ["python3", "/runtime/main.py"]
+""".strip()
+
+
+def get_pypi_section_template(template_mode: DockerfileTemplateMode = DockerfileTemplateMode.GENERIC) -> str:
+    if template_mode == DockerfileTemplateMode.OPTIMIZED:
+        return """
+RUN --mount=type=cache,target=/root/.cache/uv \\
+    uv pip install --system $${#DEPENDENCIES}
+""".strip()
+    return """
+RUN python3 -m pip install $${#DEPENDENCIES}
+""".strip()
+
+
+def get_conda_section_template(template_mode: DockerfileTemplateMode = DockerfileTemplateMode.GENERIC) -> str:
+    if template_mode == DockerfileTemplateMode.OPTIMIZED:
+        # The micromamba image layer is cached by digest, so the binary isn't downloaded again on every build
+        return """
+COPY --from=mambaorg/micromamba:latest /bin/micromamba /usr/local/bin/micromamba
+RUN --mount=type=cache,target=/opt/micromamba/pkgs \\
+    micromamba create -y -p /opt/conda -c conda-forge $${#DEPENDENCIES} python=3.12
+ENV PATH=/opt/conda/bin:$PATH
+""".strip()
+    return """
+RUN mkdir /micromamba
+RUN curl -Ls https://micro.mamba.pm/api/micromamba/linux-64/latest | tar -xvj bin/micromamba
+RUN mv bin/micromamba /usr/local/bin/
+RUN micromamba create -y -p /opt/conda -c conda-forge $${#DEPENDENCIES} python=3.12
+ENV PATH=/opt/conda/bin:$PATH
+""".strip()
+
+# Locked sections install exactly what a lockfile (copied into the build context next to the container file) pins,
+# so the build never resolves anything; `$${#LOCKFILE}` is the lockfile's name.
+def get_locked_pypi_section_template(template_mode: DockerfileTemplateMode = DockerfileTemplateMode.GENERIC) -> str:
+    if template_mode == DockerfileTemplateMode.OPTIMIZED:
+        return """
+COPY $${#LOCKFILE} /tmp/bsander/$${#LOCKFILE}
+RUN --mount=type=cache,target=/root/.cache/uv \\
+    uv pip install --system --require-hashes --no-deps -r /tmp/bsander/$${#LOCKFILE}
+""".strip()
+    return """
+COPY $${#LOCKFILE} /tmp/bsander/$${#LOCKFILE}
+RUN python3 -m pip install --require-hashes --no-deps -r /tmp/bsander/$${#LOCKFILE}
+""".strip()
+
+
+def get_locked_conda_section_template(template_mode: DockerfileTemplateMode = DockerfileTemplateMode.GENERIC) -> str:
+    if template_mode == DockerfileTemplateMode.OPTIMIZED:
+        return """
+COPY --from=mambaorg/micromamba:latest /bin/micromamba /usr/local/bin/micromamba
+COPY $${#LOCKFILE} /tmp/bsander/$${#LOCKFILE}
+RUN --mount=type=cache,target=/opt/micromamba/pkgs \\
+    micromamba create -y -p /opt/conda --file /tmp/bsander/$${#LOCKFILE}
+ENV PATH=/opt/conda/bin:$PATH
+""".strip()
+    return """
+COPY $${#LOCKFILE} /tmp/bsander/$${#LOCKFILE}
+RUN mkdir /micromamba
+RUN curl -Ls https://micro.mamba.pm/api/micromamba/linux-64/latest | tar -xvj bin/micromamba
+RUN mv bin/micromamba /usr/local/bin/
+RUN micromamba create -y -p /opt/conda --file /tmp/bsander/$${#LOCKFILE}
+ENV PATH=/opt/conda/bin:$PATH
+""".strip()
+
+# Apptainer builds from one `%post` script (and a SIF has no layers to cache), so there is only one layout; files the
+# build needs (lockfiles) are listed in `$${#FILES}`, which holds a whole `%files` section or nothing.
+def get_apptainer_definition_template() -> str:
+    return """
+Bootstrap: docker
+From: ghcr.io/astral-sh/uv:python3.12-bookworm
+
+$${#FILES}
+
+%post
+apt update
+apt upgrade -y
+apt install -y git curl
+
+## Dependency Installs
+### Conda
+$${#CONDA_FORGE_DEPENDENCIES}
+
+### PyPI
+$${#PYPI_DEPENDENCIES}
+
+##
+mkdir -p /runtime
+cd /runtime
+git clone https://github.com/biosimulators/bsew.git /runtime
+python3 -m pip install -e /runtime
+
+%environment
+export PATH=/opt/conda/bin:$PATH
+
+%runscript
+cd /runtime
+exec python3 /runtime/main.py "$@"
+""".strip()
+
+
+def get_apptainer_pypi_section_template() -> str:
+    return """
+python3 -m pip install $${#DEPENDENCIES}
+""".strip()
+
+
+def get_apptainer_conda_section_template() -> str:
+    return """
+mkdir /micromamba
+curl -Ls https://micro.mamba.pm/api/micromamba/linux-64/latest | tar -xvj bin/micromamba
+mv bin/micromamba /usr/local/bin/
+micromamba create -y -p /opt/conda -c conda-forge $${#DEPENDENCIES} python=3.12
+export PATH=/opt/conda/bin:$PATH
+""".strip()
+
+
+def get_apptainer_locked_pypi_section_template() -> str:
+    return """
+python3 -m pip install --require-hashes --no-deps -r /tmp/bsander/$${#LOCKFILE}
+""".strip()
+
+
+def get_apptainer_locked_conda_section_template() -> str:
+    return """
+mkdir /micromamba
+curl -Ls https://micro.mamba.pm/api/micromamba/linux-64/latest | tar -xvj bin/micromamba
+mv bin/micromamba /usr/local/bin/
+micromamba create -y -p /opt/conda --file /tmp/bsander/$${#LOCKFILE}
+export PATH=/opt/conda/bin:$PATH
+""".strip()
+
 # Note the capture group; that's what re.findall will return!
 _sub_keys: set[str] = { match for match in re.findall(r"\$\${#(\w+)}", get_generic_dockerfile_template()) }
 def pull_substitution_keys_from_document():
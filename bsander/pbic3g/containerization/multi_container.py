@@ -0,0 +1,167 @@
+### File that splits a document's processes into clusters that can share one environment, and renders one image per
+### cluster (on top of a shared base image) plus the compose file that builds and runs them together.
+import json
+from dataclasses import dataclass
+
+from bsander.bsandr_utils.input_types import ContainerizationEngine, DockerfileTemplateMode
+from bsander.pbic3g.containerization.container_constructor import fill_dockerfile_template, \
+    collect_process_requirements, resolve_process_group_dependencies, get_process_package_keys
+from bsander.pbic3g.containerization.container_file import get_base_dockerfile_template, \
+    get_cluster_dockerfile_template
+from bsander.pbic3g.containerization.output_cache import DOCKERFILE_NAME, compute_environment_hash, \
+    get_environment_image_tag
+from bsander.pbic3g.dependency_resolution.whitelist import DependencyConflictError, WhitelistIndex, get_whitelist_index
+
+BASE_CONTEXT_NAME: str = "base"
+COMPOSE_FILE_NAME: str = "docker-compose.yml"
+CLUSTER_NAME_PREFIX: str = "cluster-"
+PROCESSES_ENVIRONMENT_VARIABLE: str = "BSANDER_PROCESSES"
+_network_name = "bsander"
+
+
+@dataclass
+class DependencyCluster:
+    name: str
+    process_paths: list[str]
+    pypi_deps: list[str]
+    conda_deps: list[str]
+
+
+def cluster_document_processes(pb_documents: dict[str, str],
+                               whitelist_entries: list[str] | WhitelistIndex | None = None) -> list[DependencyCluster]:
+    # `pb_documents` maps document names to their (not yet localized) text; with several documents, process paths
+    # are prefixed by the document they come from
+    whitelist_index = get_whitelist_index(whitelist_entries)
+    process_requirements: dict = {}
+    for document_name, pb_document_str in pb_documents.items():
+        process_requirements.update(collect_process_requirements(
+            pb_document_str, whitelist_index, document_name if len(pb_documents) > 1 else None))
+    if len(process_requirements) == 0:
+        raise ValueError("No dependencies found in document; unable to generate environments.")
+    return cluster_processes(process_requirements)
+
+
+def cluster_processes(process_requirements: dict) -> list[DependencyCluster]:
+    # `process_requirements` maps process paths to their collectors (see `collect_process_requirements`).
+    # Processes that share a package land in the same cluster, so that package is installed (and built) once;
+    # a group whose constraints can't be merged is split until every cluster resolves.
+    process_paths = list(process_requirements)
+    parents = list(range(len(process_paths)))
+
+    def find(index: int) -> int:
+        while parents[index] != index:
+            parents[index] = parents[parents[index]]
+            index = parents[index]
+        return index
+
+    first_owner: dict[tuple[str, str], int] = {}
+    for index, process_path in enumerate(process_paths):
+        for package_key in get_process_package_keys(process_requirements[process_path]):
+            owner = first_owner.setdefault(package_key, index)
+            parents[find(index)] = find(owner)
+
+    components: dict[int, list[str]] = {}
+    for index, process_path in enumerate(process_paths):
+        components.setdefault(find(index), []).append(process_path)
+
+    resolved_groups: list[tuple[list[str], tuple[list[str], list[str]]]] = []
+    for component in components.values():
+        resolved_groups.extend(_split_until_compatible(component, process_requirements))
+    return [DependencyCluster(f"{CLUSTER_NAME_PREFIX}{number}", group, pypi_deps, conda_deps)
+            for number, (group, (pypi_deps, conda_deps)) in enumerate(resolved_groups, start=1)]
+
+
+def _split_until_compatible(component: list[str],
+                            process_requirements: dict) -> list[tuple[list[str], tuple[list[str], list[str]]]]:
+    try:
+        return [(component, _resolve_group(component, process_requirements))]
+    except DependencyConflictError:
+        pass
+    # First fit: each process joins the first group it stays resolvable in, or starts a new one
+    groups: list[tuple[list[str], tuple[list[str], list[str]]]] = []
+    for process_path in component:
+        for group_index, (group, _) in enumerate(groups):
+            try:
+                groups[group_index] = (group + [process_path],
+                                       _resolve_group(group + [process_path], process_requirements))
+                break
+            except DependencyConflictError:
+                continue
+        else:
+            # A process that conflicts with itself can't be containerized at all; let its conflict surface
+            groups.append(([process_path], _resolve_group([process_path], process_requirements)))
+    return groups
+
+
+def _resolve_group(group: list[str], process_requirements: dict) -> tuple[list[str], list[str]]:
+    return resolve_process_group_dependencies({ process_path : process_requirements[process_path]
+                                                for process_path in group })
+
+
+def get_base_image_tag(template_mode: DockerfileTemplateMode, engine: ContainerizationEngine) -> str:
+    return get_environment_image_tag(compute_environment_hash(get_base_dockerfile_template(template_mode), [], [],
+                                                              engine))
+
+
+def get_cluster_image_tag(cluster: DependencyCluster, template_mode: DockerfileTemplateMode,
+                          engine: ContainerizationEngine, lockfiles: dict[str, str] | None = None) -> str:
+    # The base is part of the key: the same cluster on a different base is a different image
+    template = get_base_dockerfile_template(template_mode) + "\n" + get_cluster_dockerfile_template(template_mode)
+    return get_environment_image_tag(compute_environment_hash(template, cluster.pypi_deps, cluster.conda_deps,
+                                                              engine, lockfiles))
+
+
+def render_cluster_dockerfile(cluster: DependencyCluster,
+                              template_mode: DockerfileTemplateMode = DockerfileTemplateMode.GENERIC,
+                              lockfile_names: set[str] | None = None) -> str:
+    return fill_dockerfile_template(get_cluster_dockerfile_template(template_mode), cluster.pypi_deps,
+                                    cluster.conda_deps, template_mode, lockfile_names)
+
+
+def render_compose_file(clusters: list[DependencyCluster], base_image_tag: str, cluster_image_tags: dict[str, str]) -> str:
+    # Written by hand (every value JSON-quoted, which YAML accepts) to avoid a YAML dependency
+    lines = ["services:",
+             f"  {BASE_CONTEXT_NAME}:",
+             f"    image: {json.dumps(base_image_tag)}",
+             "    build:",
+             f"      context: {json.dumps(BASE_CONTEXT_NAME)}",
+             '    entrypoint: ["true"]',  # only built, so clusters can start from it
+             ]
+    for cluster in clusters:
+        lines += [f"  {cluster.name}:",
+                  f"    image: {json.dumps(cluster_image_tags[cluster.name])}",
+                  "    build:",
+                  f"      context: {json.dumps(cluster.name)}",
+                  "      additional_contexts:",
+                  f"        {BASE_CONTEXT_NAME}: {json.dumps('service:' + BASE_CONTEXT_NAME)}",
+                  "    depends_on:",
+                  f"      - {BASE_CONTEXT_NAME}",
+                  "    environment:",
+                  f"      {PROCESSES_ENVIRONMENT_VARIABLE}: {json.dumps(','.join(cluster.process_paths))}",
+                  "    networks:",
+                  f"      - {_network_name}",
+                  ]
+    lines += ["networks:",
+              f"  {_network_name}: {{}}"]
+    return "\n".join(lines) + "\n"
+
+
+def render_multi_container_files(clusters: list[DependencyCluster],
+                                 template_mode: DockerfileTemplateMode = DockerfileTemplateMode.GENERIC,
+                                 engine: ContainerizationEngine = ContainerizationEngine.DOCKER,
+                                 lockfiles_by_cluster: dict[str, dict[str, str]] | None = None) -> dict[str, str]:
+    # Returns relative path -> contents: `base/Dockerfile`, `<cluster>/Dockerfile` (plus its lockfiles), and the
+    # compose file. Every cluster image is built from its own directory, so each is cached independently.
+    lockfiles_by_cluster = lockfiles_by_cluster if lockfiles_by_cluster is not None else {}
+    container_files = {f"{BASE_CONTEXT_NAME}/{DOCKERFILE_NAME}": get_base_dockerfile_template(template_mode)}
+    cluster_image_tags: dict[str, str] = {}
+    for cluster in clusters:
+        lockfiles = lockfiles_by_cluster.get(cluster.name, {})
+        container_files[f"{cluster.name}/{DOCKERFILE_NAME}"] = render_cluster_dockerfile(cluster, template_mode,
+                                                                                        set(lockfiles))
+        for lockfile_name, lockfile_contents in lockfiles.items():
+            container_files[f"{cluster.name}/{lockfile_name}"] = lockfile_contents
+        cluster_image_tags[cluster.name] = get_cluster_image_tag(cluster, template_mode, engine, lockfiles)
+    container_files[COMPOSE_FILE_NAME] = render_compose_file(clusters, get_base_image_tag(template_mode, engine),
+                                                             cluster_image_tags)
+    return container_files
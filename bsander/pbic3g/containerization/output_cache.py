@@ -0,0 +1,74 @@
+### File that caches generated container build files by the environment they describe, so identical
+### environments are rendered (and converted) once, and can share one built image.
+import hashlib
+import json
+import os
+import shutil
+import tempfile
+
+from bsander.bsandr_utils.cache_directory import get_cache_file_path
+from bsander.bsandr_utils.input_types import ContainerizationEngine
+
+DOCKERFILE_NAME: str = "Dockerfile"
+APPTAINER_DEFINITION_NAME: str = "singularity.def"
+IMAGE_REPOSITORY_NAME: str = "bsander-env"
+_output_cache_dir_name = "containers"
+_image_tag_length = 16
+
+
+def compute_environment_hash(template: str, pypi_deps: list[str], conda_deps: list[str],
+                             engine: ContainerizationEngine, lockfiles: dict[str, str] | None = None) -> str:
+    # Dependency order does not change what gets installed, so it must not change the key either
+    environment = {
+        "template": template,
+        "pypi": sorted(pypi_deps),
+        "conda": sorted(conda_deps),
+        "engine": engine.name,
+    }
+    if lockfiles:  # pinned environments are only identical if they pin the same artifacts
+        environment["lockfiles"] = lockfiles
+    canonical_environment = json.dumps(environment, sort_keys=True, separators=(",", ":"))
+    return hashlib.sha256(canonical_environment.encode("utf-8")).hexdigest()
+
+
+def get_environment_image_tag(environment_hash: str) -> str:
+    return f"{IMAGE_REPOSITORY_NAME}:{environment_hash[:_image_tag_length]}"
+
+
+def get_default_output_cache_dir() -> str:
+    return get_cache_file_path(_output_cache_dir_name)
+
+
+def load_cached_container_files(environment_hash: str, cache_dir: str | None = None) -> dict[str, str] | None:
+    entry_dir = os.path.join(cache_dir if cache_dir is not None else get_default_output_cache_dir(), environment_hash)
+    if not os.path.isdir(entry_dir):
+        return None
+    container_files: dict[str, str] = {}
+    try:
+        for file_name in os.listdir(entry_dir):
+            with open(os.path.join(entry_dir, file_name), "r") as cached_file:
+                container_files[file_name] = cached_file.read()
+    except OSError:
+        return None  # A broken entry is treated as a miss, and overwritten by the next store
+    return container_files if len(container_files) != 0 else None
+
+
+def store_container_files(environment_hash: str, container_files: dict[str, str], cache_dir: str | None = None):
+    cache_dir = cache_dir if cache_dir is not None else get_default_output_cache_dir()
+    os.makedirs(cache_dir, exist_ok=True)
+    entry_dir = os.path.join(cache_dir, environment_hash)
+    # Populate a private directory, then rename it into place, so readers never see a partial entry
+    staging_dir = tempfile.mkdtemp(dir=cache_dir, prefix=f".{environment_hash[:_image_tag_length]}-")
+    try:
+        for file_name, contents in container_files.items():
+            with open(os.path.join(staging_dir, file_name), "w") as cached_file:
+                cached_file.write(contents)
+        if os.path.isdir(entry_dir):
+            shutil.rmtree(entry_dir, ignore_errors=True)
+        try:
+            os.rename(staging_dir, entry_dir)
+        except OSError:
+            pass  # Another run stored the same environment first; its files are identical
+    finally:
+        if os.path.isdir(staging_dir):
+            shutil.rmtree(staging_dir, ignore_errors=True)
@@ -0,0 +1,455 @@
+### This file pins dependency sets into lockfiles ahead of time, so container builds install exact artifacts rather
+### than re-resolving loose constraints. Resolution is done entirely offline, against a local directory of PyPI
+### artifacts (wheels / sdists, "find-links" style) and / or a local conda channel (`<subdir>/repodata.json`).
+import email.parser
+import fnmatch
+import hashlib
+import json
+import os
+import re
+import tarfile
+import zipfile
+from collections import deque
+from dataclasses import dataclass
+
+from packaging.requirements import Requirement, InvalidRequirement
+from packaging.specifiers import SpecifierSet
+from packaging.utils import canonicalize_name, parse_wheel_filename, parse_sdist_filename, InvalidWheelFilename, \
+    InvalidSdistFilename
+from packaging.version import Version
+
+PYPI_LOCKFILE_NAME: str = "requirements.lock"
+CONDA_LOCKFILE_NAME: str = "conda-explicit.txt"
+DEFAULT_CONDA_CHANNEL_URL: str = "https://conda.anaconda.org/conda-forge"
+CONDA_SUBDIRS: tuple[str, ...] = ("linux-64", "noarch")
+TARGET_PYTHON_VERSION: str = "3.12"  # matches the python used by the container templates
+
+# Markers are evaluated for the container we generate, not for the machine running bsander
+_target_marker_environment: dict[str, str] = {
+    "implementation_name": "cpython",
+    "implementation_version": f"{TARGET_PYTHON_VERSION}.0",
+    "os_name": "posix",
+    "platform_machine": "x86_64",
+    "platform_python_implementation": "CPython",
+    "platform_release": "",
+    "platform_system": "Linux",
+    "platform_version": "",
+    "python_full_version": f"{TARGET_PYTHON_VERSION}.0",
+    "python_version": TARGET_PYTHON_VERSION,
+    "sys_platform": "linux",
+}
+_compatible_interpreters: set[str] = {"py3", f"py{TARGET_PYTHON_VERSION.replace('.', '')}",
+                                      f"cp{TARGET_PYTHON_VERSION.replace('.', '')}"}
+_compatible_abis: set[str] = {"none", "abi3", f"cp{TARGET_PYTHON_VERSION.replace('.', '')}"}
+_max_resolution_rounds = 64
+_conda_version_key_length = 16
+_conda_spec_pattern = re.compile(r"^\s*([A-Za-z0-9_.\-]+)\s*(.*?)\s*$")
+
+
+class LockResolutionError(ValueError):
+    pass
+
+
+@dataclass(frozen=True)
+class LockedPypiPackage:
+    name: str
+    version: str
+    file_name: str  # the artifact whose metadata was resolved against
+    sha256_hashes: tuple[str, ...]  # every artifact of this version in the index, whichever one the build picks
+
+
+@dataclass(frozen=True)
+class LockedCondaPackage:
+    name: str
+    version: str
+    build: str
+    subdir: str
+    file_name: str
+    md5: str | None
+
+
+def generate_lockfiles(pypi_deps: list[str], conda_deps: list[str], pypi_index_dir: str | None = None,
+                       conda_channel_dir: str | None = None,
+                       conda_channel_url: str = DEFAULT_CONDA_CHANNEL_URL) -> dict[str, str]:
+    # Returns lockfile name -> contents, for whichever sources were both needed and given an index
+    lockfiles: dict[str, str] = {}
+    if pypi_index_dir is not None and len(pypi_deps) != 0:
+        lockfiles[PYPI_LOCKFILE_NAME] = render_pypi_lockfile(resolve_pypi_lock(pypi_deps, pypi_index_dir))
+    if conda_channel_dir is not None and len(conda_deps) != 0:
+        lockfiles[CONDA_LOCKFILE_NAME] = render_conda_lockfile(resolve_conda_lock(conda_deps, conda_channel_dir),
+                                                               conda_channel_url)
+    return lockfiles
+
+
+################################################################################
+# PyPI
+################################################################################
+@dataclass
+class _PypiArtifact:
+    version: Version
+    file_path: str
+    is_wheel: bool
+    is_installable: bool = True  # wheels for other platforms are never picked, but are hashed all the same
+
+
+def resolve_pypi_lock(pypi_deps: list[str], index_dir: str) -> list[LockedPypiPackage]:
+    root_requirements: list[Requirement] = []
+    for dependency in pypi_deps:
+        try:
+            root_requirements.append(Requirement(dependency))
+        except InvalidRequirement as e:
+            raise LockResolutionError(f"can not lock `{dependency}`: {e}") from e
+    index = _scan_pypi_index(index_dir)
+    metadata_cache: dict[str, list[str]] = {}
+    # Greedy resolution, restarted with whatever was learned whenever a round hits a conflict: either the pinned
+    # package must also satisfy the new requirement, or (when nothing can) the package asking for it must move
+    learned_constraints: dict[str, SpecifierSet] = {}
+    for _ in range(_max_resolution_rounds):
+        pins, learned = _attempt_pypi_resolution(root_requirements, index, learned_constraints, metadata_cache)
+        if learned is None:
+            return [LockedPypiPackage(name, str(artifact.version), os.path.basename(artifact.file_path),
+                                      _hash_pypi_version_artifacts(name, artifact.version, index))
+                    for name, artifact in sorted(pins.items())]
+        learned_name, learned_specifier = learned
+        learned_constraints[learned_name] = learned_constraints.get(learned_name, SpecifierSet()) & learned_specifier
+    raise LockResolutionError("dependency resolution did not settle; the constraints are too entangled to lock")
+
+
+def _attempt_pypi_resolution(root_requirements: list[Requirement], index: dict[str, list[_PypiArtifact]],
+                             learned_constraints: dict[str, SpecifierSet], metadata_cache: dict[str, list[str]]):
+    pins: dict[str, _PypiArtifact] = {}
+    requested: dict[str, SpecifierSet] = dict(learned_constraints)
+    extras_requested: dict[str, set[str]] = {}
+    # Each pending requirement remembers which pin asked for it (`None` for the document's own dependencies)
+    pending: deque[tuple[Requirement, str | None]] = deque((requirement, None) for requirement in root_requirements)
+    while pending:
+        requirement, parent_name = pending.popleft()
+        if requirement.marker is not None and not _evaluate_marker(requirement, set()):
+            continue
+        name = canonicalize_name(requirement.name)
+        requested[name] = requested.get(name, SpecifierSet()) & requirement.specifier
+        if name in pins:
+            if not requested[name].contains(pins[name].version, prereleases=True):
+                return pins, _learn_from_pypi_conflict(name, requirement.specifier, parent_name, pins, index)
+            new_extras = set(requirement.extras) - extras_requested[name]
+            if len(new_extras) != 0:
+                extras_requested[name] |= new_extras
+                pending.extend((extra_requirement, name) for extra_requirement in
+                               _read_artifact_requirements(pins[name], new_extras, metadata_cache, extras_only=True))
+            continue
+        try:
+            artifact = _select_pypi_artifact(name, requested[name], index)
+        except LockResolutionError:
+            if parent_name is None:
+                raise
+            return pins, (parent_name, SpecifierSet(f"!={pins[parent_name].version}"))
+        pins[name] = artifact
+        extras_requested[name] = set(requirement.extras)
+        pending.extend((child_requirement, name) for child_requirement in
+                       _read_artifact_requirements(artifact, extras_requested[name], metadata_cache))
+    return pins, None
+
+
+def _learn_from_pypi_conflict(name: str, new_specifier: SpecifierSet, parent_name: str | None,
+                              pins: dict[str, _PypiArtifact],
+                              index: dict[str, list[_PypiArtifact]]) -> tuple[str, SpecifierSet]:
+    # Honouring the newest requirement is preferred; whoever then can't be satisfied is blamed in a later round
+    installable_versions = [artifact.version for artifact in index.get(name, []) if artifact.is_installable]
+    if len(list(new_specifier.filter(installable_versions))) != 0:
+        return name, new_specifier
+    if parent_name is None:
+        raise LockResolutionError(f"no version of `{name}` satisfying `{new_specifier}` in the local index")
+    return parent_name, SpecifierSet(f"!={pins[parent_name].version}")
+
+
+def _scan_pypi_index(index_dir: str) -> dict[str, list[_PypiArtifact]]:
+    if not os.path.isdir(index_dir):
+        raise LockResolutionError(f"PyPI index directory `{index_dir}` does not exist")
+    index: dict[str, list[_PypiArtifact]] = {}
+    for directory, _subdirectories, file_names in os.walk(index_dir):
+        for file_name in file_names:
+            file_path = os.path.join(directory, file_name)
+            try:
+                if file_name.endswith(".whl"):
+                    name, version, _build, tags = parse_wheel_filename(file_name)
+                    index.setdefault(name, []).append(_PypiArtifact(version, file_path, True,
+                                                                    any(_is_tag_compatible(tag) for tag in tags)))
+                elif file_name.endswith((".tar.gz", ".zip")):
+                    name, version = parse_sdist_filename(file_name)
+                    index.setdefault(name, []).append(_PypiArtifact(version, file_path, False))
+            except (InvalidWheelFilename, InvalidSdistFilename):
+                continue
+    return index
+
+
+def _is_tag_compatible(tag) -> bool:
+    if tag.interpreter not in _compatible_interpreters or tag.abi not in _compatible_abis:
+        return False
+    return tag.platform == "any" or (tag.platform.startswith(("manylinux", "linux"))
+                                     and tag.platform.endswith("x86_64"))
+
+
+def _select_pypi_artifact(name: str, specifier: SpecifierSet, index: dict[str, list[_PypiArtifact]]) -> _PypiArtifact:
+    artifacts = [artifact for artifact in index.get(name, []) if artifact.is_installable]
+    allowed_versions = set(specifier.filter({artifact.version for artifact in artifacts}))
+    if len(allowed_versions) == 0:
+        available = ", ".join(sorted({str(artifact.version) for artifact in artifacts})) or "none"
+        raise LockResolutionError(f"no version of `{name}` satisfying `{specifier or 'any'}` in the local index "
+                                  f"(available: {available})")
+    best_version = max(allowed_versions)
+    # Wheels over sdists, so what we lock is what will actually be installed
+    return max((artifact for artifact in artifacts if artifact.version == best_version),
+               key=lambda artifact: (artifact.is_wheel, os.path.basename(artifact.file_path)))
+
+
+def _hash_pypi_version_artifacts(name: str, version: Version,
+                                 index: dict[str, list[_PypiArtifact]]) -> tuple[str, ...]:
+    # pip checks whichever wheel / sdist it picks for the build's platform against these, so all of them are listed
+    return tuple(sorted({_hash_file(artifact.file_path, "sha256") for artifact in index.get(name, [])
+                         if artifact.version == version}))
+
+
+def _read_artifact_requirements(artifact: _PypiArtifact, extras: set[str], metadata_cache: dict[str, list[str]],
+                                extras_only: bool = False) -> list[Requirement]:
+    if artifact.file_path not in metadata_cache:
+        metadata_cache[artifact.file_path] = _read_requires_dist(artifact)
+    requirements: list[Requirement] = []
+    for requires_dist in metadata_cache[artifact.file_path]:
+        try:
+            requirement = Requirement(requires_dist)
+        except InvalidRequirement:
+            continue  # not valid PEP 508, so installers ignore it as well
+        if requirement.marker is None:
+            if not extras_only:
+                requirements.append(requirement)
+            continue
+        applies_to_base = not extras_only and _evaluate_marker(requirement, set())
+        if applies_to_base or _evaluate_marker(requirement, extras):
+            requirement.marker = None  # already evaluated for the target
+            requirements.append(requirement)
+    return requirements
+
+
+def _evaluate_marker(requirement: Requirement, extras: set[str]) -> bool:
+    for extra in (extras or {""}):
+        if requirement.marker.evaluate(dict(_target_marker_environment, extra=extra)):
+            return True
+    return False
+
+
+def _read_requires_dist(artifact: _PypiArtifact) -> list[str]:
+    metadata_text: str | None = None
+    if artifact.is_wheel:
+        with zipfile.ZipFile(artifact.file_path) as wheel:
+            for member_name in wheel.namelist():
+                if member_name.count("/") == 1 and member_name.endswith(".dist-info/METADATA"):
+                    metadata_text = wheel.read(member_name).decode("utf-8")
+                    break
+    elif artifact.file_path.endswith(".zip"):
+        with zipfile.ZipFile(artifact.file_path) as sdist:
+            for member_name in sdist.namelist():
+                if member_name.count("/") == 1 and member_name.endswith("/PKG-INFO"):
+                    metadata_text = sdist.read(member_name).decode("utf-8")
+                    break
+    else:
+        with tarfile.open(artifact.file_path) as sdist:
+            for member in sdist.getmembers():
+                if member.name.count("/") == 1 and member.name.endswith("/PKG-INFO"):
+                    metadata_text = sdist.extractfile(member).read().decode("utf-8")
+                    break
+    if metadata_text is None:
+        raise LockResolutionError(f"`{os.path.basename(artifact.file_path)}` has no readable metadata")
+    # Only the headers matter, and they end at the first blank line
+    metadata = email.parser.HeaderParser().parsestr(metadata_text)
+    return metadata.get_all("Requires-Dist") or []
+
+
+def render_pypi_lockfile(locked_packages: list[LockedPypiPackage]) -> str:
+    lines = ["# Generated by bsander from a local index; install with `--require-hashes --no-deps`"]
+    for locked_package in locked_packages:
+        hash_options = [f"    --hash=sha256:{sha256}" for sha256 in locked_package.sha256_hashes]
+        lines.append(f"{locked_package.name}=={locked_package.version} \\")
+        lines.append(" \\\n".join(hash_options))
+    return "\n".join(lines) + "\n"
+
+
+################################################################################
+# Conda
+################################################################################
+def resolve_conda_lock(conda_deps: list[str], channel_dir: str) -> list[LockedCondaPackage]:
+    records = _scan_conda_channel(channel_dir)
+    # The environment is always created with a matching python, same as the unlocked templates
+    root_specs = [f"python {TARGET_PYTHON_VERSION}.*"] + list(conda_deps)
+    # Same strategy as PyPI: learned match specs for a package, and builds excluded because their dependencies
+    # could not be satisfied
+    learned_specs: dict[str, list[str]] = {}
+    excluded_files: set[str] = set()
+    for _ in range(_max_resolution_rounds):
+        pins, learned = _attempt_conda_resolution(root_specs, records, learned_specs, excluded_files)
+        if learned is None:
+            return [LockedCondaPackage(record["name"], record["version"], record["build"], record["subdir"],
+                                       record["fn"], record.get("md5"))
+                    for _, record in sorted(pins.items())]
+        learned_name, learned_spec = learned
+        if learned_spec is None:
+            excluded_files.add(pins[learned_name]["fn"])
+        else:
+            learned_specs.setdefault(learned_name, []).append(learned_spec)
+    raise LockResolutionError("dependency resolution did not settle; the constraints are too entangled to lock")
+
+
+def _attempt_conda_resolution(root_specs: list[str], records: dict[str, list[dict]],
+                              learned_specs: dict[str, list[str]], excluded_files: set[str]):
+    pins: dict[str, dict] = {}
+    requested: dict[str, list[str]] = {name: list(specs) for name, specs in learned_specs.items()}
+    pending: deque[tuple[str, str | None]] = deque((match_spec, None) for match_spec in root_specs)
+    while pending:
+        match_spec, parent_name = pending.popleft()
+        name, version_spec, build_spec = parse_conda_match_spec(match_spec)
+        if name.startswith("__"):
+            continue  # virtual packages (`__glibc`, `__unix`, ...) are provided by the host
+        requested.setdefault(name, []).append(match_spec)
+        if name in pins and _conda_record_matches(pins[name], version_spec, build_spec):
+            continue
+        try:
+            record = _select_conda_record(name, requested[name], records, excluded_files)
+        except LockResolutionError:
+            if parent_name is None:
+                raise
+            return pins, (parent_name, None)
+        if name in pins:
+            return pins, (name, match_spec)  # another build satisfies everyone; pin that one next round
+        pins[name] = record
+        pending.extend((dependency_spec, name) for dependency_spec in record.get("depends", []))
+    return pins, None
+
+
+def _scan_conda_channel(channel_dir: str) -> dict[str, list[dict]]:
+    records: dict[str, list[dict]] = {}
+    found_any_subdir = False
+    for subdir in CONDA_SUBDIRS:
+        repodata_path = os.path.join(channel_dir, subdir, "repodata.json")
+        if not os.path.isfile(repodata_path):
+            continue
+        found_any_subdir = True
+        with open(repodata_path, "r") as repodata_file:
+            repodata = json.load(repodata_file)
+        for package_key in ("packages", "packages.conda"):
+            for file_name, record in repodata.get(package_key, {}).items():
+                records.setdefault(record["name"], []).append(dict(record, fn=file_name, subdir=subdir))
+    if not found_any_subdir:
+        raise LockResolutionError(f"conda channel directory `{channel_dir}` has no "
+                                  f"{' or '.join(CONDA_SUBDIRS)} repodata.json")
+    return records
+
+
+def _select_conda_record(name: str, match_specs: list[str], records: dict[str, list[dict]],
+                         excluded_files: set[str]) -> dict:
+    candidates = [record for record in records.get(name, []) if record["fn"] not in excluded_files]
+    for match_spec in match_specs:
+        _, version_spec, build_spec = parse_conda_match_spec(match_spec)
+        candidates = [record for record in candidates if _conda_record_matches(record, version_spec, build_spec)]
+    if len(candidates) == 0:
+        raise LockResolutionError(f"no build of `{name}` satisfying `{', '.join(match_specs)}` in the local channel")
+    # `.conda` over `.tar.bz2` for the same build, since it's the smaller, faster download
+    return max(candidates, key=lambda record: (_conda_version_key(record["version"]), record.get("build_number", 0),
+                                               record["fn"].endswith(".conda")))
+
+
+def parse_conda_match_spec(match_spec: str) -> tuple[str, str | None, str | None]:
+    # Accepts `name`, `name >=1.2,<2`, `name 1.2.* py312*`, `name>=1.2`, and `name=1.2=build`
+    parts = match_spec.split()
+    if len(parts) >= 2:
+        return parts[0], parts[1], (parts[2] if len(parts) > 2 else None)
+    match = _conda_spec_pattern.match(match_spec)
+    if match is None:
+        raise LockResolutionError(f"invalid conda match spec: `{match_spec}`")
+    name, remainder = match.group(1), match.group(2)
+    if remainder == "":
+        return name, None, None
+    if remainder.startswith("=") and not remainder.startswith("==") and remainder.count("=") == 2:
+        _, version, build = remainder.split("=")
+        return name, f"={version}", build
+    return name, remainder, None
+
+
+def _conda_record_matches(record: dict, version_spec: str | None, build_spec: str | None) -> bool:
+    if build_spec is not None and not fnmatch.fnmatchcase(record["build"], build_spec):
+        return False
+    return version_spec is None or conda_version_matches(record["version"], version_spec)
+
+
+def conda_version_matches(version: str, version_spec: str) -> bool:
+    return any(all(_conda_version_clause_matches(version, clause.strip()) for clause in alternative.split(","))
+               for alternative in version_spec.split("|"))
+
+
+def _conda_version_clause_matches(version: str, clause: str) -> bool:
+    if clause in ("", "*"):
+        return True
+    for operator in (">=", "<=", "==", "!=", "~=", ">", "<", "="):
+        if not clause.startswith(operator):
+            continue
+        target = clause[len(operator):]
+        if operator in ("!=", "==") and target.endswith(".*"):
+            matches_prefix = _conda_version_startswith(version, target[:-2])
+            return matches_prefix if operator == "==" else not matches_prefix
+        if operator == "=":  # fuzzy: `=1.2` means `1.2.*`
+            return _conda_version_startswith(version, target.rstrip("*").rstrip("."))
+        if operator == "~=":
+            prefix = target.rsplit(".", 1)[0]
+            return _conda_version_key(version) >= _conda_version_key(target) \
+                and _conda_version_startswith(version, prefix)
+        version_key, target_key = _conda_version_key(version), _conda_version_key(target)
+        return {">=": version_key >= target_key, "<=": version_key <= target_key, "==": version_key == target_key,
+                "!=": version_key != target_key, ">": version_key > target_key, "<": version_key < target_key
+                }[operator]
+    if clause.endswith(".*") or clause.endswith("*"):
+        return _conda_version_startswith(version, clause.rstrip("*").rstrip("."))
+    return _conda_version_key(version) == _conda_version_key(clause)
+
+
+def _conda_version_startswith(version: str, prefix: str) -> bool:
+    prefix_key = _conda_version_key(prefix, padded=False)
+    version_key = _conda_version_key(version, padded=False)
+    padded_version_key = version_key + [(2, 0, "")] * max(0, len(prefix_key) - len(version_key))
+    return padded_version_key[:len(prefix_key)] == prefix_key
+
+
+def _conda_version_key(version: str, padded: bool = True) -> list[tuple[int, int, str]]:
+    # An approximation of conda's VersionOrder: numbers compare numerically, `dev` sorts before letters,
+    # letters sort before numbers, and `post` sorts after everything
+    key: list[tuple[int, int, str]] = []
+    for component in re.split(r"[._\-]", version.lower().split("+", 1)[0]):
+        for part in re.findall(r"\d+|[a-z]+", component):
+            if part.isdigit():
+                key.append((2, int(part), ""))
+            elif part == "dev":
+                key.append((0, 0, part))
+            elif part == "post":
+                key.append((3, 0, part))
+            else:
+                key.append((1, 0, part))
+    if padded:  # missing components count as zero, so `2.0 == 2.0.0` and `3.13.0a0 < 3.13`
+        key.extend([(2, 0, "")] * max(0, _conda_version_key_length - len(key)))
+    return key
+
+
+def render_conda_lockfile(locked_packages: list[LockedCondaPackage], channel_url: str) -> str:
+    lines = [
+        "# Generated by bsander from a local channel",
+        f"# platform: {CONDA_SUBDIRS[0]}",
+        "@EXPLICIT",
+    ]
+    for locked_package in locked_packages:
+        url = f"{channel_url.rstrip('/')}/{locked_package.subdir}/{locked_package.file_name}"
+        lines.append(url + (f"#{locked_package.md5}" if locked_package.md5 else ""))
+    return "\n".join(lines) + "\n"
+
+
+def _hash_file(file_path: str, algorithm: str) -> str:
+    file_hash = hashlib.new(algorithm)
+    with open(file_path, "rb") as hashed_file:
+        for block in iter(lambda: hashed_file.read(1 << 20), b""):
+            file_hash.update(block)
+    return file_hash.hexdigest()
@@ -1,2 +1,380 @@
-### This file will hold the complex code of version resolution and package allowances, once
-### there is a need for such levels of inspection
\ No newline at end of file
+### This file holds version resolution and package allowances: whitelist entries (optionally version-qualified, as in
+### `pypi:numpy[>=1.20,<3]`; repeated entries for a package add up, each allowing another range), and merging every
+### constraint a document places on a package into one, so conflicting constraints are reported here rather than by a
+### container build that fails tens of minutes in.
+###
+### Whitelists are compiled once into a `WhitelistIndex` (exact names, a prefix trie, and one combined glob pattern per
+### source), which is memoized in memory and cached on disk by content, so large whitelists cost one lookup per address.
+import fnmatch
+import hashlib
+import json
+import os
+import re
+import tempfile
+import threading
+from collections import OrderedDict
+from dataclasses import dataclass
+
+from packaging.specifiers import SpecifierSet, InvalidSpecifier
+from packaging.version import Version, InvalidVersion
+
+from bsander.bsandr_utils.cache_directory import get_cache_file_path
+
+# Bump this whenever the compiled layout changes; older compiled whitelists will simply be recompiled.
+WHITELIST_INDEX_FORMAT_VERSION = 2
+_whitelist_cache_dir_name = "whitelists"
+_whitelist_package_pattern = re.compile(r"^([^\[\]]+)(?:\[([^\[\]]*)])?$")
+_plain_package_name_pattern = re.compile(r"^[A-Za-z0-9._\-*?]+$")
+_trie_terminal_key = ""  # never a single character, so it can't collide with a child
+_glob_group_prefix = "bsander_glob_"  # `fnmatch.translate` names its own groups `g<N>` on some Pythons (3.10)
+# Most recently used last; bounded, since a long-lived daemon may be sent any number of distinct whitelists
+_compiled_whitelists: OrderedDict[str, "WhitelistIndex"] = OrderedDict()
+_compiled_whitelists_lock = threading.Lock()
+_max_compiled_whitelists = 32
+
+
+class DependencyConflictError(ValueError):
+    def __init__(self, conflicts: list[str]):
+        super().__init__("conflicting dependency constraints; " + "; ".join(conflicts))
+        self.conflicts = conflicts
+
+
+@dataclass(frozen=True)
+class WhitelistEntry:
+    source: str
+    # An exact name, a prefix ending in a single `*` (`git+https://github.com/biosimulators/*`), or a glob using `*`/`?`
+    package: str
+    version_constraint: str | None = None  # e.g. `>=1.20,<3`; `None` allows any version
+
+    @property
+    def rule_kind(self) -> str:
+        if "*" not in self.package and "?" not in self.package:
+            return "exact"
+        if self.package.endswith("*") and self.package.count("*") == 1 and "?" not in self.package:
+            return "prefix"
+        return "glob"
+
+
+def parse_whitelist_entry(whitelist_entry: str) -> WhitelistEntry:
+    # Only the first `:` separates the source, since packages may be URLs
+    entry = whitelist_entry.strip().split(":", 1)
+    if len(entry) != 2:
+        raise ValueError(f"invalid whitelist entry: {whitelist_entry}")
+    source, package = entry
+    match = _whitelist_package_pattern.match(package)
+    if match is None or source == "":
+        raise ValueError(f"invalid whitelist entry: {whitelist_entry}")
+    package_name, version_constraint = match.group(1), match.group(2)
+    if version_constraint is not None and not _is_constraint_parsable(version_constraint):
+        raise ValueError(f"invalid version constraint in whitelist entry: {whitelist_entry}")
+    return WhitelistEntry(source, package_name, version_constraint or None)
+
+
+class WhitelistIndex:
+    def __init__(self, sources: dict[str, dict]):
+        # source -> {"exact": {package: ranges}, "prefixes": trie, "globs": [[pattern, ranges], ...]}, where `ranges`
+        # are the version constraints allowed (any one of them will do), or `None` for any version
+        self.sources = sources
+        self._glob_matchers: dict[str, re.Pattern | None] = {
+            source: _compile_glob_matcher(rules["globs"]) for source, rules in sources.items()}
+
+    def has_source(self, source: str) -> bool:
+        return source in self.sources
+
+    def lookup(self, source: str, package: str) -> tuple[bool, list[str] | None]:
+        # Returns `(allowed, allowed_ranges)`; the most specific rule wins: exact, then longest prefix, then glob
+        rules = self.sources.get(source)
+        if rules is None:
+            return False, None
+        package_key = normalize_package_name(source, package)
+        if package_key in rules["exact"]:
+            return True, rules["exact"][package_key]
+        found_prefix, prefix_constraint = False, None
+        node = rules["prefixes"]
+        for character in package_key:
+            if _trie_terminal_key in node:
+                found_prefix, prefix_constraint = True, node[_trie_terminal_key]
+            node = node.get(character)
+            if node is None:
+                break
+        else:
+            if _trie_terminal_key in node:
+                found_prefix, prefix_constraint = True, node[_trie_terminal_key]
+        if found_prefix:
+            return True, prefix_constraint
+        glob_matcher = self._glob_matchers[source]
+        match = glob_matcher.match(package_key) if glob_matcher is not None else None
+        if match is not None:
+            return True, rules["globs"][int(match.lastgroup[len(_glob_group_prefix):])][1]
+        return False, None
+
+
+def compile_whitelist(whitelist_entries: list[str], use_disk_cache: bool = True,
+                      cache_dir: str | None = None) -> WhitelistIndex:
+    whitelist_hash = hashlib.sha256("\n".join(whitelist_entries).encode("utf-8")).hexdigest()
+    with _compiled_whitelists_lock:
+        if whitelist_hash in _compiled_whitelists:
+            _compiled_whitelists.move_to_end(whitelist_hash)
+            return _compiled_whitelists[whitelist_hash]
+    cache_dir = cache_dir if cache_dir is not None else get_cache_file_path(_whitelist_cache_dir_name)
+    cache_path = os.path.join(cache_dir, f"{whitelist_hash}.json")
+    sources = _load_compiled_whitelist(cache_path) if use_disk_cache else None
+    if sources is None:
+        sources = _compile_whitelist_sources(whitelist_entries)
+        if use_disk_cache:
+            _save_compiled_whitelist(sources, cache_path)
+    whitelist_index = WhitelistIndex(sources)
+    with _compiled_whitelists_lock:
+        _compiled_whitelists[whitelist_hash] = whitelist_index
+        while len(_compiled_whitelists) > _max_compiled_whitelists:
+            _compiled_whitelists.popitem(last=False)
+    return whitelist_index
+
+
+def get_whitelist_index(whitelist: "list[str] | WhitelistIndex | None") -> "WhitelistIndex | None":
+    # Entries are compiled (or found in the memo, which still hashes them all); an already compiled index is passed
+    # through, so a run that hands its index around pays for its whitelist once
+    if whitelist is None or isinstance(whitelist, WhitelistIndex):
+        return whitelist
+    return compile_whitelist(whitelist)
+
+
+def _compile_whitelist_sources(whitelist_entries: list[str]) -> dict[str, dict]:
+    sources: dict[str, dict] = {}
+    glob_positions: dict[tuple[str, str], int] = {}
+    for whitelist_entry in whitelist_entries:
+        entry = parse_whitelist_entry(whitelist_entry)
+        rules = sources.setdefault(entry.source, {"exact": {}, "prefixes": {}, "globs": []})
+        package_key = normalize_package_name(entry.source, entry.package)
+        if entry.rule_kind == "exact":
+            rules["exact"][package_key] = _combine_allowances(rules["exact"], package_key, entry.version_constraint)
+        elif entry.rule_kind == "prefix":
+            node = rules["prefixes"]
+            for character in package_key[:-1]:
+                node = node.setdefault(character, {})
+            node[_trie_terminal_key] = _combine_allowances(node, _trie_terminal_key, entry.version_constraint)
+        elif (entry.source, package_key) in glob_positions:
+            glob_rule = rules["globs"][glob_positions[(entry.source, package_key)]]
+            glob_rule[1] = _combine_allowances({package_key: glob_rule[1]}, package_key, entry.version_constraint)
+        else:
+            glob_positions[(entry.source, package_key)] = len(rules["globs"])
+            rules["globs"].append([package_key, _combine_allowances({}, package_key, entry.version_constraint)])
+    return sources
+
+
+def _combine_allowances(allowances: dict[str, list[str] | None], key: str,
+                        version_constraint: str | None) -> list[str] | None:
+    if key not in allowances:
+        return [version_constraint] if version_constraint is not None else None
+    if allowances[key] is None or version_constraint is None:
+        return None  # an unqualified entry allows every version
+    # Entries grant permission, so repeated qualified entries widen what's allowed: any one of the ranges will do
+    return allowances[key] + [version_constraint] if version_constraint not in allowances[key] else allowances[key]
+
+
+def _compile_glob_matcher(globs: list[list]) -> re.Pattern | None:
+    if len(globs) == 0:
+        return None
+    # One alternation for every glob (each anchored at its end by `translate`); the group name records which matched
+    return re.compile("|".join(f"(?P<{_glob_group_prefix}{index}>{fnmatch.translate(pattern)})"
+                               for index, (pattern, _) in enumerate(globs)))
+
+
+def normalize_package_name(source: str, package: str) -> str:
+    # Names compare the way their package manager compares them; URLs and paths are left exactly as written
+    if _plain_package_name_pattern.match(package) is None:
+        return package
+    if source == "pypi":
+        return re.sub(r"[-_.]+", "-", package).lower()  # `canonicalize_name`, but keeping glob characters
+    return package.lower()
+
+
+def _load_compiled_whitelist(cache_path: str) -> dict[str, dict] | None:
+    try:
+        with open(cache_path, "r") as cache_file:
+            raw_cache = json.load(cache_file)
+    except (OSError, ValueError):
+        return None
+    if not isinstance(raw_cache, dict) or raw_cache.get("format_version") != WHITELIST_INDEX_FORMAT_VERSION:
+        return None
+    return raw_cache.get("sources")
+
+
+def _save_compiled_whitelist(sources: dict[str, dict], cache_path: str):
+    cache_dir = os.path.dirname(os.path.abspath(cache_path))
+    os.makedirs(cache_dir, exist_ok=True)
+    # Write then rename, so a concurrent run never observes a half-written index
+    file_descriptor, temp_path = tempfile.mkstemp(dir=cache_dir, prefix=".whitelist-", suffix=".json")
+    try:
+        with os.fdopen(file_descriptor, "w") as temp_file:
+            json.dump({"format_version": WHITELIST_INDEX_FORMAT_VERSION, "sources": sources}, temp_file,
+                      separators=(",", ":"))
+        os.replace(temp_path, cache_path)
+    except BaseException:
+        if os.path.exists(temp_path):
+            os.remove(temp_path)
+        raise
+
+
+def merge_dependency_constraints(source: str, requested_constraints: list[tuple[str, str]],
+                                 allowed_constraints: dict[str, list[str] | None] | None = None,
+                                 constraint_origins: dict[tuple[str, str], list[str]] | None = None) -> list[str]:
+    # `requested_constraints` holds `(package, constraint)` pairs in document order (constraint may be ""), and
+    # `allowed_constraints` maps whitelisted packages (by `normalize_package_name`) to the version ranges they are
+    # allowed at, any one of which will do. Returns one dependency string per package, in order of first appearance;
+    # raises `DependencyConflictError` for every unsatisfiable one. `constraint_origins` optionally names the
+    # documents each pair came from, for the conflict report.
+    allowed_constraints = allowed_constraints if allowed_constraints is not None else {}
+    constraint_origins = constraint_origins if constraint_origins is not None else {}
+    constraints_by_package: dict[str, tuple[str, list[str]]] = {}
+    origins_by_package: dict[str, dict[str, list[str]]] = {}
+    for package, constraint in requested_constraints:
+        package_key = normalize_package_name(source, package)
+        _, constraints = constraints_by_package.setdefault(package_key, (package, []))
+        if constraint != "" and constraint not in constraints:
+            constraints.append(constraint)
+        origins = origins_by_package.setdefault(package_key, {}).setdefault(constraint, [])
+        origins.extend(origin for origin in constraint_origins.get((package, constraint), []) if origin not in origins)
+    merged_dependencies: list[str] = []
+    conflicts: list[str] = []
+    for package_key, (package, constraints) in constraints_by_package.items():
+        allowed_ranges = allowed_constraints.get(package_key)
+        specifiers = [_parse_constraint(constraint) for constraint in constraints]
+        if any(specifier is None for specifier in specifiers):
+            # Can't be reasoned about (e.g. conda fuzzy matches); let the package manager intersect them
+            if allowed_ranges is not None:
+                allowed_range = max(allowed_ranges, key=lambda allowed: _get_newest_version_key(SpecifierSet(allowed)))
+                constraints = constraints + [allowed_range] if allowed_range not in constraints else constraints
+            merged_dependencies.append(package + ",".join(constraints))
+            continue
+        requested_specifier = SpecifierSet()
+        for specifier in specifiers:
+            requested_specifier &= specifier
+        origins = origins_by_package[package_key]
+        described_constraints = ", ".join(_describe_constraint(constraint, origins.get(constraint))
+                                          for constraint in constraints)
+        if not is_specifier_set_satisfiable(requested_specifier):
+            conflicts.append(f"`{package}` from `{source}` can not satisfy all of {described_constraints}")
+            continue
+        if allowed_ranges is None:
+            if len(constraints) <= 1:  # nothing to merge; keep exactly what the document asked for
+                merged_dependencies.append(package + (constraints[0] if len(constraints) != 0 else ""))
+            else:
+                merged_dependencies.append(package + str(requested_specifier))
+            continue
+        # The request only has to fit one of the whitelisted ranges
+        candidates = [(allowed_range, requested_specifier & SpecifierSet(allowed_range))
+                      for allowed_range in allowed_ranges]
+        candidates = [(allowed_range, merged_specifier) for allowed_range, merged_specifier in candidates
+                      if is_specifier_set_satisfiable(merged_specifier)]
+        if len(candidates) == 0:
+            described_ranges = " or ".join(f"`{allowed_range}`" for allowed_range in allowed_ranges)
+            conflicts.append(f"`{package}` from `{source}` can not satisfy "
+                             f"{described_constraints or 'any version'} within the whitelist's {described_ranges}")
+            continue
+        # A single requirement can't express a union of ranges; an installer picks the newest version it may anyway
+        allowed_range, merged_specifier = max(candidates,
+                                              key=lambda candidate: _get_newest_version_key(candidate[1]))
+        if len(constraints) == 0 or constraints == [allowed_range]:
+            merged_dependencies.append(package + allowed_range)
+        else:
+            merged_dependencies.append(package + str(merged_specifier))
+    if len(conflicts) != 0:
+        raise DependencyConflictError(conflicts)
+    return merged_dependencies
+
+
+def _describe_constraint(constraint: str, origins: list[str] | None) -> str:
+    if origins:
+        return f"`{constraint}` (from {', '.join(origins)})"
+    return f"`{constraint}`"
+
+
+def is_specifier_set_satisfiable(specifier_set: SpecifierSet) -> bool:
+    # Works on intervals, not on any index of released versions: `>=2,<1.26` is rejected, `>=2.0.1,<2.0.2` is not
+    lower, upper, pins = _get_specifier_bounds(specifier_set)
+    if len(pins) != 0:
+        return any(specifier_set.contains(pin, prereleases=True) for pin in pins)
+    if lower is None or upper is None:
+        return True
+    if lower[0] != upper[0]:
+        return lower[0] < upper[0]
+    return lower[1] and upper[1] and specifier_set.contains(lower[0], prereleases=True)
+
+
+def _get_specifier_bounds(specifier_set: SpecifierSet) -> tuple[tuple[Version, bool] | None,
+                                                                tuple[Version, bool] | None, list[str]]:
+    # `(lower, upper, pins)`, bounds being `(version, inclusive)`
+    lower: tuple[Version, bool] | None = None
+    upper: tuple[Version, bool] | None = None
+    pins: list[str] = []
+    for specifier in specifier_set:
+        operator, version = specifier.operator, specifier.version
+        if operator == "===" or (operator == "==" and not version.endswith(".*")):
+            pins.append(version)
+        elif operator == "==":
+            prefix = Version(version[:-2])
+            lower = _tighter_bound(lower, (Version(f"{prefix.base_version}.dev0"), True), True)
+            upper = _tighter_bound(upper, (_next_release(prefix.release), False), False)
+        elif operator == "~=":
+            release = Version(version).release
+            lower = _tighter_bound(lower, (Version(version), True), True)
+            upper = _tighter_bound(upper, (_next_release(release[:-1]), False), False)
+        elif operator in (">=", ">"):
+            lower = _tighter_bound(lower, (Version(version), operator == ">="), True)
+        elif operator in ("<=", "<"):
+            upper = _tighter_bound(upper, (Version(version), operator == "<="), False)
+    return lower, upper, pins
+
+
+def _get_newest_version_key(specifier_set: SpecifierSet) -> tuple:
+    # Orders specifier sets by the newest version they allow; unbounded ones come last
+    _, upper, pins = _get_specifier_bounds(specifier_set)
+    pinned_versions = [Version(pin) for pin in pins if not _is_invalid_version(pin)]
+    if len(pinned_versions) != 0:
+        return False, max(pinned_versions), True
+    if upper is None:
+        return (True,)
+    return False, upper[0], upper[1]
+
+
+def _is_invalid_version(version: str) -> bool:
+    try:
+        Version(version)
+    except InvalidVersion:
+        return True
+    return False
+
+
+def _tighter_bound(current: tuple[Version, bool] | None, candidate: tuple[Version, bool],
+                   is_lower: bool) -> tuple[Version, bool]:
+    if current is None or candidate[0] != current[0]:
+        if current is None or (candidate[0] > current[0]) == is_lower:
+            return candidate
+        return current
+    return current if not current[1] else candidate  # same version: exclusive is tighter
+
+
+def _next_release(release: tuple[int, ...]) -> Version:
+    # `(1, 2)` -> `1.3.dev0`, the first version not starting with `1.2`
+    bumped = list(release[:-1]) + [release[-1] + 1]
+    return Version(".".join(str(part) for part in bumped) + ".dev0")
+
+
+def _parse_constraint(constraint: str) -> SpecifierSet | None:
+    try:
+        return SpecifierSet(constraint)
+    except InvalidSpecifier:
+        return None
+
+
+def _is_constraint_parsable(constraint: str) -> bool:
+    # Whitelist constraints must be understood here, or they couldn't be enforced
+    if _parse_constraint(constraint) is None:
+        return False
+    try:
+        is_specifier_set_satisfiable(SpecifierSet(constraint))
+    except InvalidVersion:
+        return False
+    return True
+
@@ -0,0 +1,281 @@
+### File that indexes what every installed distribution requires, from one pass over the `*.dist-info` (and
+### `*.egg-info`) directories on `sys.path` that reads only the metadata headers. Directories are cached by their
+### modification time (installing, upgrading, or removing a distribution changes it), so unchanged ones are never read
+### again. Queried in reverse: which distributions require `bsail`, and at which versions.
+import importlib.metadata
+import json
+import os
+import pathlib
+import re
+import sys
+import tempfile
+from dataclasses import dataclass, asdict, field
+
+from bsander.bsandr_utils.cache_directory import get_cache_file_path
+
+# Bump this whenever the layout of `IndexedDistribution` changes; older caches will simply be rebuilt.
+DISTRIBUTION_INDEX_FORMAT_VERSION = 1
+_default_distribution_index_cache_name = "distribution_index.json"
+_name_separator_pattern = re.compile(r"[-_.]+")
+
+
+@dataclass(frozen=True)
+class DistributionRequirement:
+    name: str  # normalized (PEP 503), e.g. `process-bigraph`
+    specifier: str  # e.g. `<1.0,>=0.1`; empty for any version
+    marker: str | None = None  # e.g. `extra == "sim"`, when the requirement is conditional
+
+    def is_active(self) -> bool:
+        # Whether a plain install (no extras) on this interpreter and platform pulls the requirement in
+        if self.marker is None:
+            return True
+        from packaging.markers import Marker
+        return Marker(self.marker).evaluate({"extra": ""})
+
+
+@dataclass(frozen=True)
+class DistributionDependent:
+    distribution_name: str
+    distribution_version: str
+    requirement: DistributionRequirement
+
+
+@dataclass
+class IndexedDistribution:
+    name: str
+    version: str
+    metadata_path: str  # the `.dist-info` / `.egg-info` it was read from
+    requirements: list[DistributionRequirement] = field(default_factory=list)
+
+    def load(self) -> importlib.metadata.Distribution:
+        return importlib.metadata.PathDistribution(pathlib.Path(self.metadata_path))
+
+
+class DistributionIndex:
+    def __init__(self, distributions: list[IndexedDistribution]):
+        # Earlier `sys.path` entries shadow later ones, as they do for imports
+        self.distributions: dict[str, IndexedDistribution] = {}
+        for distribution in distributions:
+            self.distributions.setdefault(normalize_distribution_name(distribution.name), distribution)
+        # required name -> every distribution requiring it
+        self.dependents: dict[str, list[DistributionDependent]] = {}
+        for distribution in self.distributions.values():
+            for requirement in distribution.requirements:
+                self.dependents.setdefault(requirement.name, []).append(
+                    DistributionDependent(distribution.name, distribution.version, requirement))
+
+    def get_distribution(self, name: str) -> IndexedDistribution | None:
+        return self.distributions.get(normalize_distribution_name(name))
+
+    def get_dependents(self, name: str) -> list[DistributionDependent]:
+        # Conditional requirements (extras, environment markers) count too; their marker says when they apply
+        return self.dependents.get(normalize_distribution_name(name), [])
+
+    def get_distributions_requiring(self, name: str) -> list[IndexedDistribution]:
+        # Only distributions that actually require it here: not behind an extra, nor a marker for another environment
+        distribution_names = dict.fromkeys(dependent.distribution_name for dependent in self.get_dependents(name)
+                                           if dependent.requirement.is_active())
+        return [self.distributions[normalize_distribution_name(distribution_name)]
+                for distribution_name in distribution_names]
+
+
+def normalize_distribution_name(name: str) -> str:
+    # PEP 503 (what `packaging.utils.canonicalize_name` does), without importing `packaging` on warm runs
+    return _name_separator_pattern.sub("-", name).lower()
+
+
+def parse_requirement(raw_requirement: str) -> DistributionRequirement | None:
+    # `None` for anything that isn't a valid PEP 508 requirement (which installers ignore as well)
+    from packaging.requirements import Requirement, InvalidRequirement
+    try:
+        requirement = Requirement(raw_requirement)
+    except InvalidRequirement:
+        return None
+    return DistributionRequirement(normalize_distribution_name(requirement.name), str(requirement.specifier),
+                                   str(requirement.marker) if requirement.marker is not None else None)
+
+
+def load_distribution_index(use_cache: bool = True, cache_path: str | None = None,
+                            search_paths: list[str] | None = None) -> DistributionIndex:
+    # Indexes every distribution installed on `search_paths` (by default, `sys.path`); only directories modified since
+    # they were cached are read
+    search_paths = search_paths if search_paths is not None else sys.path
+    cached_directories = load_distribution_index_cache(cache_path) if use_cache else {}
+    scanned_directories: dict[str, dict] = {}
+    distributions: list[IndexedDistribution] = []
+    is_cache_stale = False
+    for search_path in search_paths:
+        directory = os.path.abspath(search_path or os.curdir)
+        if directory in scanned_directories:
+            continue
+        try:
+            modified_time = os.stat(directory).st_mtime_ns
+        except OSError:
+            continue  # missing entries and zip archives hold no (indexable) distributions
+        cached_directory = cached_directories.get(directory)
+        if cached_directory is not None and cached_directory["mtime_ns"] == modified_time:
+            directory_distributions = cached_directory["distributions"]
+        else:
+            directory_distributions = scan_directory_distributions(directory)
+            is_cache_stale = True
+        scanned_directories[directory] = {"mtime_ns": modified_time, "distributions": directory_distributions}
+        distributions.extend(directory_distributions)
+    if use_cache and (is_cache_stale or scanned_directories.keys() != cached_directories.keys()):
+        save_distribution_index_cache(scanned_directories, cache_path)
+    return DistributionIndex(distributions)
+
+
+def scan_directory_distributions(directory: str) -> list[IndexedDistribution]:
+    distributions: list[IndexedDistribution] = []
+    try:
+        directory_entries = sorted(os.scandir(directory), key=lambda directory_entry: directory_entry.name)
+    except (NotADirectoryError, PermissionError, FileNotFoundError):
+        return distributions
+    for directory_entry in directory_entries:
+        distribution: IndexedDistribution | None = None
+        if directory_entry.name.endswith(".dist-info") and directory_entry.is_dir():
+            distribution = _read_distribution(directory_entry.path, os.path.join(directory_entry.path, "METADATA"))
+        elif directory_entry.name.endswith(".egg-info"):
+            if directory_entry.is_dir():  # requirements live in `requires.txt`, not the metadata
+                distribution = _read_distribution(directory_entry.path,
+                                                  os.path.join(directory_entry.path, "PKG-INFO"),
+                                                  os.path.join(directory_entry.path, "requires.txt"))
+            else:  # a bare PKG-INFO file, as very old setuptools installs left behind
+                distribution = _read_distribution(directory_entry.path, directory_entry.path)
+        if distribution is not None:
+            distributions.append(distribution)
+    return distributions
+
+
+def _read_distribution(metadata_path: str, metadata_file_path: str,
+                       requires_file_path: str | None = None) -> IndexedDistribution | None:
+    headers = _read_metadata_headers(metadata_file_path)
+    if headers is None or "name" not in headers:
+        return None
+    raw_requirements = headers.get("requires-dist", [])
+    if requires_file_path is not None:
+        raw_requirements = raw_requirements + _read_egg_requirements(requires_file_path)
+    requirements = [requirement for requirement in map(parse_requirement, raw_requirements)
+                    if requirement is not None]
+    return IndexedDistribution(headers["name"][0], headers.get("version", [""])[0], metadata_path, requirements)
+
+
+def _read_metadata_headers(metadata_file_path: str) -> dict[str, list[str]] | None:
+    # Field name (lower case) -> its values. Reading stops at the first blank line: what follows is the (often long)
+    # description, which never holds a header.
+    headers: dict[str, list[str]] = {}
+    try:
+        with open(metadata_file_path, "r", encoding="utf-8", errors="replace") as metadata_file:
+            field_name: str | None = None
+            for line in metadata_file:
+                if line.strip() == "":
+                    break
+                if line[0] in " \t":  # a folded continuation of the previous field
+                    if field_name is not None:
+                        headers[field_name][-1] += " " + line.strip()
+                    continue
+                raw_field_name, separator, value = line.partition(":")
+                if separator == "":
+                    field_name = None
+                    continue
+                field_name = raw_field_name.strip().lower()
+                headers.setdefault(field_name, []).append(value.strip())
+    except OSError:
+        return None
+    return headers
+
+
+def _read_egg_requirements(requires_file_path: str) -> list[str]:
+    # `requires.txt` lists unconditional requirements first, then `[extra:marker]` sections; the section's condition
+    # becomes the requirement's marker
+    raw_requirements: list[str] = []
+    try:
+        with open(requires_file_path, "r", encoding="utf-8", errors="replace") as requires_file:
+            lines = requires_file.read().splitlines()
+    except OSError:
+        return raw_requirements
+    section_marker: str | None = None
+    for line in lines:
+        line = line.strip()
+        if line == "" or line.startswith("#"):
+            continue
+        if line.startswith("[") and line.endswith("]"):
+            extra, _, marker = line[1:-1].partition(":")
+            conditions = ([f'extra == "{extra}"'] if extra != "" else []) + ([f"({marker})"] if marker != "" else [])
+            section_marker = " and ".join(conditions) if len(conditions) != 0 else None
+            continue
+        raw_requirements.append(f"{line}; {section_marker}" if section_marker is not None else line)
+    return raw_requirements
+
+
+def get_default_distribution_index_cache_path() -> str:
+    return get_cache_file_path(_default_distribution_index_cache_name)
+
+
+def load_distribution_index_cache(cache_path: str | None = None) -> dict[str, dict]:
+    # directory -> {"mtime_ns": ..., "distributions": [IndexedDistribution, ...]}
+    cache_path = cache_path if cache_path is not None else get_default_distribution_index_cache_path()
+    if not os.path.exists(cache_path):
+        return {}
+    try:
+        with open(cache_path, "r") as cache_file:
+            raw_cache = json.load(cache_file)
+    except (OSError, ValueError):
+        return {}  # A broken cache is never fatal; we'll just rescan everything
+    if not isinstance(raw_cache, dict) or raw_cache.get("format_version") != DISTRIBUTION_INDEX_FORMAT_VERSION:
+        return {}
+    cached_directories: dict[str, dict] = {}
+    for directory, raw_directory in raw_cache.get("directories", {}).items():
+        try:
+            distributions = [IndexedDistribution(raw_distribution["name"], raw_distribution["version"],
+                                                 raw_distribution["metadata_path"],
+                                                 [DistributionRequirement(**raw_requirement)
+                                                  for raw_requirement in raw_distribution["requirements"]])
+                             for raw_distribution in raw_directory["distributions"]]
+            cached_directories[directory] = {"mtime_ns": raw_directory["mtime_ns"], "distributions": distributions}
+        except (KeyError, TypeError):
+            continue
+    return cached_directories
+
+
+def save_distribution_index_cache(directories: dict[str, dict], cache_path: str | None = None):
+    cache_path = cache_path if cache_path is not None else get_default_distribution_index_cache_path()
+    raw_cache = {
+        "format_version": DISTRIBUTION_INDEX_FORMAT_VERSION,
+        "directories": {
+            directory: {
+                "mtime_ns": scanned_directory["mtime_ns"],
+                "distributions": [asdict(distribution) for distribution in scanned_directory["distributions"]],
+            } for directory, scanned_directory in directories.items()
+        }
+    }
+    # Write then rename, so a concurrent run never observes a half-written cache
+    cache_dir = os.path.dirname(os.path.abspath(cache_path))
+    os.makedirs(cache_dir, exist_ok=True)
+    file_descriptor, temp_path = tempfile.mkstemp(dir=cache_dir, prefix=".distribution-index-", suffix=".json")
+    try:
+        with os.fdopen(file_descriptor, "w") as temp_file:
+            temp_file.write(json.dumps(raw_cache))
+        os.replace(temp_path, cache_path)
+    except BaseException:
+        if os.path.exists(temp_path):
+            os.remove(temp_path)
+        raise
+
+
+def main():
+    import argparse
+    parser = argparse.ArgumentParser(description="list the installed distributions that require a distribution, and "
+                                                 "at which versions")
+    parser.add_argument("name", nargs="?", default="bsail")
+    parser.add_argument("--no-cache", action="store_true", help="ignore (and don't update) the on-disk index cache")
+    args = parser.parse_args()
+    for dependent in load_distribution_index(use_cache=not args.no_cache).get_dependents(args.name):
+        requirement = dependent.requirement
+        print(f"{dependent.distribution_name} {dependent.distribution_version}: "
+              f"{args.name}{requirement.specifier or ' (any version)'}"
+              + (f"; {requirement.marker}" if requirement.marker is not None else ""))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,216 @@
+### File that lets an edited document be re-localized in time proportional to the edit. A manifest stored next to the
+### output remembers a checkpoint after every address of the last run; the next run finds the span of the document
+### that changed, re-walks only the addresses around it, and splices the previous output back around the result.
+import hashlib
+import io
+import json
+import os
+import tempfile
+from bisect import bisect_left, bisect_right
+from dataclasses import dataclass, field
+from typing import Callable
+
+from bsander.bsandr_utils.pbif_stream import AddressCheckpoint, PbifFormatError, rewrite_pbif_addresses
+
+MANIFEST_FORMAT_VERSION: int = 1
+MANIFEST_SUFFIX: str = ".bsander-manifest.json"
+_comparison_block_size = 1 << 16
+
+
+@dataclass
+class IncrementalManifest:
+    settings_fingerprint: str  # anything besides the document that the outputs depend on
+    input_hash: str
+    output_hash: str
+    checkpoints: list[AddressCheckpoint]
+    # What the container build files were generated from: relative path -> content hash
+    output_files: dict[str, str] = field(default_factory=dict)
+    image_tag: str | None = None
+
+
+@dataclass
+class IncrementalLocalization:
+    localized_document: str
+    checkpoints: list[AddressCheckpoint]
+    addresses_changed: bool  # whether any address was added, removed, or edited since the manifest was written
+    walked_address_count: int  # how many addresses had to be re-walked (all of them, without a usable manifest)
+
+
+def get_manifest_path(output_document_path: str) -> str:
+    return output_document_path + MANIFEST_SUFFIX
+
+
+def hash_text(text: str) -> str:
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+
+def compute_settings_fingerprint(*settings) -> str:
+    return hash_text(json.dumps(settings, default=str))
+
+
+def load_manifest(manifest_path: str, settings_fingerprint: str) -> IncrementalManifest | None:
+    # Anything missing, broken, or made with other settings just means a full run
+    if not os.path.exists(manifest_path):
+        return None
+    try:
+        with open(manifest_path, "r") as manifest_file:
+            raw_manifest = json.load(manifest_file)
+        if raw_manifest.get("format_version") != MANIFEST_FORMAT_VERSION \
+                or raw_manifest.get("settings_fingerprint") != settings_fingerprint:
+            return None
+        raw_checkpoints = raw_manifest["checkpoints"]
+        checkpoints = [AddressCheckpoint(*columns) for columns in
+                       zip(raw_checkpoints["input_ends"], raw_checkpoints["output_ends"],
+                           raw_checkpoints["container_stacks"], raw_checkpoints["input_tokens"],
+                           raw_checkpoints["output_tokens"])]
+        return IncrementalManifest(settings_fingerprint, raw_manifest["input_hash"], raw_manifest["output_hash"],
+                                   checkpoints, raw_manifest["output_files"], raw_manifest["image_tag"])
+    except (OSError, ValueError, KeyError, TypeError, AttributeError):
+        return None
+
+
+def save_manifest(manifest_path: str, manifest: IncrementalManifest):
+    checkpoints = manifest.checkpoints
+    raw_manifest = {
+        "format_version": MANIFEST_FORMAT_VERSION,
+        "settings_fingerprint": manifest.settings_fingerprint,
+        "input_hash": manifest.input_hash,
+        "output_hash": manifest.output_hash,
+        "output_files": manifest.output_files,
+        "image_tag": manifest.image_tag,
+        # Stored column by column; far smaller (and faster to load) than one object per address
+        "checkpoints": {
+            "input_ends": [checkpoint.input_end for checkpoint in checkpoints],
+            "output_ends": [checkpoint.output_end for checkpoint in checkpoints],
+            "container_stacks": [checkpoint.container_stack for checkpoint in checkpoints],
+            "input_tokens": [checkpoint.input_token for checkpoint in checkpoints],
+            "output_tokens": [checkpoint.output_token for checkpoint in checkpoints],
+        },
+    }
+    manifest_dir = os.path.dirname(os.path.abspath(manifest_path))
+    file_descriptor, temp_path = tempfile.mkstemp(dir=manifest_dir, prefix=".bsander-manifest-", suffix=".json")
+    try:
+        with os.fdopen(file_descriptor, "w") as temp_file:
+            temp_file.write(json.dumps(raw_manifest))  # `json.dump` would stream through the (slower) pure-python encoder
+        os.replace(temp_path, manifest_path)
+    except BaseException:
+        if os.path.exists(temp_path):
+            os.remove(temp_path)
+        raise
+
+
+def localize_document_fully(pb_document_str: str, rewrite_address: Callable[[str], str]) -> IncrementalLocalization:
+    # Raises `PbifFormatError` for documents that aren't JSON; those can't be checkpointed
+    checkpoints: list[AddressCheckpoint] = []
+    localized_document = io.StringIO()
+    rewrite_pbif_addresses(io.StringIO(pb_document_str), localized_document, rewrite_address,
+                           address_checkpoints=checkpoints)
+    return IncrementalLocalization(localized_document.getvalue(), checkpoints, True, len(checkpoints))
+
+
+def localize_document_incrementally(pb_document_str: str, previous_output: str, manifest: IncrementalManifest,
+                                    rewrite_address: Callable[[str], str]) -> IncrementalLocalization | None:
+    # Returns `None` when the previous run can't be built on (the output was touched, or the edit changed how the
+    # rest of the document reads); the caller then localizes the whole document
+    if hash_text(previous_output) != manifest.output_hash:
+        return None
+    checkpoints = manifest.checkpoints
+    previous_input = _reconstruct_input(previous_output, checkpoints)
+    if hash_text(previous_input) != manifest.input_hash:
+        return None
+    if previous_input == pb_document_str:
+        return IncrementalLocalization(previous_output, checkpoints, False, 0)
+
+    prefix_length = _common_prefix_length(previous_input, pb_document_str)
+    suffix_length = _common_suffix_length(previous_input, pb_document_str,
+                                          min(len(previous_input), len(pb_document_str)) - prefix_length)
+    # Re-walk from the last checkpoint before the edit to the first one after it
+    input_ends = [checkpoint.input_end for checkpoint in checkpoints]
+    first_walked = bisect_right(input_ends, prefix_length)
+    last_walked = bisect_left(input_ends, len(previous_input) - suffix_length, lo=first_walked)
+    resume_checkpoint = checkpoints[first_walked - 1] if first_walked != 0 else None
+    reaches_end = last_walked == len(checkpoints)
+    input_shift = len(pb_document_str) - len(previous_input)
+    window_input_start = resume_checkpoint.input_end if resume_checkpoint is not None else 0
+    window_output_start = resume_checkpoint.output_end if resume_checkpoint is not None else 0
+    window_input_end = len(pb_document_str) if reaches_end else checkpoints[last_walked].input_end + input_shift
+    window_output_end = len(previous_output) if reaches_end else checkpoints[last_walked].output_end
+
+    window_checkpoints: list[AddressCheckpoint] = []
+    window_output = io.StringIO()
+    try:
+        rewrite_pbif_addresses(io.StringIO(pb_document_str[window_input_start:window_input_end]), window_output,
+                               rewrite_address, address_checkpoints=window_checkpoints,
+                               resume_container_stack=resume_checkpoint.container_stack
+                               if resume_checkpoint is not None else None,
+                               require_complete=reaches_end)
+    except PbifFormatError:
+        return None
+    if not reaches_end:
+        # The walk must land on the old checkpoint in the same state, or the unchanged tail reads differently now
+        window_end = window_checkpoints[-1] if len(window_checkpoints) != 0 else None
+        if window_end is None or window_end.input_end != window_input_end - window_input_start \
+                or window_end.container_stack != checkpoints[last_walked].container_stack:
+            return None
+    window_output_str = window_output.getvalue()
+    localized_document = previous_output[:window_output_start] + window_output_str + previous_output[window_output_end:]
+
+    output_shift = len(localized_document) - len(previous_output)
+    new_checkpoints = checkpoints[:first_walked]
+    new_checkpoints += [_shift_checkpoint(checkpoint, window_input_start, window_output_start)
+                        for checkpoint in window_checkpoints]
+    new_checkpoints += [_shift_checkpoint(checkpoint, input_shift, output_shift)
+                        for checkpoint in checkpoints[last_walked + 1:]]
+    previous_window_tokens = [checkpoint.input_token for checkpoint in checkpoints[first_walked:last_walked + 1]]
+    addresses_changed = previous_window_tokens != [checkpoint.input_token for checkpoint in window_checkpoints]
+    return IncrementalLocalization(localized_document, new_checkpoints, addresses_changed, len(window_checkpoints))
+
+
+def collect_distinct_addresses(checkpoints: list[AddressCheckpoint]) -> list[str]:
+    # In order of first appearance, which is all dependency resolution needs (repeats add nothing)
+    return [json.loads(input_token) for input_token in dict.fromkeys(checkpoint.input_token
+                                                                     for checkpoint in checkpoints)]
+
+
+def _reconstruct_input(previous_output: str, checkpoints: list[AddressCheckpoint]) -> str:
+    # Outputs differ from their inputs only in rewritten address tokens, so the manifest doesn't keep a second copy
+    pieces: list[str] = []
+    previous_output_end = 0
+    for checkpoint in checkpoints:
+        pieces.append(previous_output[previous_output_end:checkpoint.output_end - len(checkpoint.output_token)])
+        pieces.append(checkpoint.input_token)
+        previous_output_end = checkpoint.output_end
+    pieces.append(previous_output[previous_output_end:])
+    return "".join(pieces)
+
+
+def _shift_checkpoint(checkpoint: AddressCheckpoint, input_shift: int, output_shift: int) -> AddressCheckpoint:
+    return AddressCheckpoint(checkpoint.input_end + input_shift, checkpoint.output_end + output_shift,
+                             checkpoint.container_stack, checkpoint.input_token, checkpoint.output_token)
+
+
+def _common_prefix_length(first: str, second: str) -> int:
+    # Whole blocks are compared first, so the cost follows where the edit is, not how long the document is
+    limit = min(len(first), len(second))
+    start = 0
+    while start < limit and first[start:start + _comparison_block_size] == second[start:start + _comparison_block_size]:
+        start += _comparison_block_size
+    end = min(start + _comparison_block_size, limit)
+    while start < end and first[start] == second[start]:
+        start += 1
+    return min(start, limit)
+
+
+def _common_suffix_length(first: str, second: str, limit: int) -> int:
+    length = 0
+    while length < limit:
+        block = min(_comparison_block_size, limit - length)
+        if first[len(first) - length - block:len(first) - length] != \
+                second[len(second) - length - block:len(second) - length]:
+            break
+        length += block
+    else:
+        return limit
+    while length < limit and first[len(first) - length - 1] == second[len(second) - length - 1]:
+        length += 1
+    return length
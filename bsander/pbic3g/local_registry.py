@@ -2,28 +2,132 @@
 import importlib.metadata
 import pkgutil
 import inspect
-import re
+import sys
 
-from process_bigraph import Process, Step, Composite
+from bsander.bsandr_utils.instrumentation import span, count
+from bsander.pbic3g.distribution_index import load_distribution_index, parse_requirement
+from bsander.pbic3g.registry_cache import RegistryEntry, CachedDistribution, describe_distribution, \
+    load_registry_cache, save_registry_cache
+from bsander.pbic3g.registry_workers import ImportRequest, ImportResult, scan_distributions_in_workers, \
+    DEFAULT_IMPORT_TIMEOUT_SECONDS, DEFAULT_MEMORY_LIMIT_BYTES
+from bsander.pbic3g.static_discovery import discover_distribution_statically
 
+_bsail_distribution_name = "bsail"
 
-def load_local_modules():
+
+def load_local_modules(use_cache: bool = True, cache_path: str | None = None, use_static_discovery: bool = True,
+                       isolate_imports: bool = True, max_workers: int | None = None,
+                       import_timeout: float | None = DEFAULT_IMPORT_TIMEOUT_SECONDS,
+                       memory_limit: int | None = DEFAULT_MEMORY_LIMIT_BYTES,
+                       distribution_index_cache_path: str | None = None) -> dict[str, list[RegistryEntry]]:
     print("Loading local registry...")
-    for package in importlib.metadata.distributions():
-        if not does_package_require_bsail(package): continue
-        # If a package requires BSail, it probably has abstractions for us; worth importing.
-        recursive_dynamic_import(package.name)
+    registry_cache: dict[str, CachedDistribution] = load_registry_cache(cache_path) if use_cache else {}
+    updated_cache: dict[str, CachedDistribution] = {}
+    import_requests: list[ImportRequest] = []
+    rescanned_distributions: list[str] = []
+    with span("discover_distributions"):
+        # One (cached) pass over installed metadata finds every distribution requiring BSail
+        distribution_index = load_distribution_index(use_cache=use_cache, cache_path=distribution_index_cache_path)
+        for indexed_distribution in distribution_index.get_distributions_requiring(_bsail_distribution_name):
+            package = indexed_distribution.load()
+            distribution_name = indexed_distribution.name
+            current_description = describe_distribution(package, distribution_name, indexed_distribution.version)
+            cached_description = registry_cache.get(distribution_name)
+            if cached_description is not None and cached_description.matches(current_description):
+                updated_cache[distribution_name] = cached_description
+                continue
+            # If a package requires BSail, it probably has abstractions for us; worth scanning.
+            static_results = discover_distribution_statically(package) if use_static_discovery else None
+            if static_results is None:
+                import_requests.append(ImportRequest(distribution_name))
+            else:
+                current_description.entries = list(static_results.entries)
+                if len(static_results.unresolved_modules) != 0:
+                    # Only the modules that could not be understood from source alone are actually imported
+                    import_requests.append(ImportRequest(distribution_name, static_results.unresolved_modules))
+            updated_cache[distribution_name] = current_description
+            rescanned_distributions.append(distribution_name)
+
+    import_results: list[ImportResult]
+    with span("import_distributions", distributions=len(import_requests)):
+        if isolate_imports:
+            import_results = scan_distributions_in_workers(import_requests, max_workers, import_timeout, memory_limit)
+        else:
+            import_results = [ImportResult(request.distribution_name, perform_import_request(request))
+                              for request in import_requests]
+    count("distributions_rescanned", len(rescanned_distributions))
+    count("distributions_imported", len(import_requests))
+    failed_distributions: set[str] = set()
+    for import_result in import_results:
+        if import_result.entries is None:
+            print(f"Warning: unable to scan `{import_result.distribution_name}` ({import_result.error}); skipping",
+                  file=sys.stderr)
+            failed_distributions.add(import_result.distribution_name)
+            continue
+        description = updated_cache[import_result.distribution_name]
+        known_addresses: set[str] = {entry.address for entry in description.entries}
+        for entry in import_result.entries:
+            if entry.address in known_addresses:
+                continue
+            known_addresses.add(entry.address)
+            description.entries.append(entry)
+
+    registry: dict[str, list[RegistryEntry]] = {name: description.entries for name, description in updated_cache.items()
+                                                if name not in failed_distributions}
+    if use_cache and (len(rescanned_distributions) != 0 or updated_cache.keys() != registry_cache.keys()):
+        # Failed scans are left out, so they are retried on the next run
+        save_registry_cache({name: updated_cache[name] for name in registry}, cache_path)
+    print(f"Local registry loaded ({len(registry)} distribution(s), {len(rescanned_distributions)} rescanned)")
+    return registry
 
 
 def does_package_require_bsail(package: importlib.metadata.Distribution) -> bool:
-    for key in package.metadata:
-        if key != "Requires-Dist": continue
-        if not re.match("bsail \([=><\d.]+,?[=><\d.]+\)", package.metadata[key]): continue
-        return True
+    # For a single distribution; `load_local_modules` queries the distribution index instead
+    for raw_requirement in package.requires or []:
+        requirement = parse_requirement(raw_requirement)
+        if requirement is not None and requirement.name == _bsail_distribution_name:
+            return True
     return False
 
 
-def recursive_dynamic_import(package_name: str):
+def perform_import_request(import_request: ImportRequest) -> list[RegistryEntry]:
+    if import_request.module_names is None:
+        return [convert_class_to_registry_entry(clazz)
+                for _, clazz in recursive_dynamic_import(import_request.distribution_name)]
+    return [convert_class_to_registry_entry(clazz)
+            for module_name in import_request.module_names
+            for _, clazz in collect_classes_from_module(importlib.import_module(module_name))]
+
+
+def convert_class_to_registry_entry(clazz: type) -> RegistryEntry:
+    from process_bigraph import Step, Composite  # only needed when distributions are actually imported; slow to load
+    kind: str
+    if issubclass(clazz, Composite):
+        kind = "Composite"
+    elif issubclass(clazz, Step):
+        kind = "Step"
+    else:
+        kind = "Process"
+    bases = tuple(f"{base.__module__}.{base.__qualname__}" for base in clazz.__mro__[1:] if base is not object)
+    return RegistryEntry(clazz.__module__, clazz.__name__, kind, bases, _declared_names(clazz, "inputs"),
+                         _declared_names(clazz, "outputs"), _declared_names(clazz, "config_schema"))
+
+
+def _declared_names(clazz: type, member_name: str) -> tuple[str, ...] | None:
+    # Ports are declared by methods that usually just return a literal, so calling them on a bare (uninitialized)
+    # instance is enough; anything that needs a configured instance is reported as unknown
+    try:
+        declaration = getattr(clazz, member_name)
+        if callable(declaration):
+            declaration = declaration(clazz.__new__(clazz))
+    except Exception:
+        return None
+    if not isinstance(declaration, dict) or not all(isinstance(name, str) for name in declaration):
+        return None
+    return tuple(declaration)
+
+
+def recursive_dynamic_import(package_name: str) -> list[tuple[str, type]]:
     classes_to_import = []
     adjusted_package_name = package_name.replace("-", "_")
     try:
@@ -35,15 +139,24 @@ def recursive_dynamic_import(package_name: str):
         # find correct module name
         # return recursive_dynamic_import(correct_module_name)
         raise ModuleNotFoundError(f"module {adjusted_package_name} not found")
-    # class_members = inspect.getmembers(module, inspect.isclass)
-    # for class_name, clazz in class_members:
-    #     if not (issubclass(clazz, Process) or issubclass(clazz, Step)) or (clazz in [Process, Step, Composite]):
-    #         continue
-    #     classes_to_import.append((class_name, clazz))
+    classes_to_import += collect_classes_from_module(module)
 
     modules_to_check = pkgutil.iter_modules(module.__path__) if hasattr(module, '__path__') else []
     for _module_loader, subname, isPkg in modules_to_check:
         # if not isPkg: continue
         classes_to_import += recursive_dynamic_import(f"{adjusted_package_name}.{subname}")
 
-    return classes_to_import
\ No newline at end of file
+    return classes_to_import
+
+
+def collect_classes_from_module(module) -> list[tuple[str, type]]:
+    from process_bigraph import Process, Step, Composite
+    collected_classes = []
+    class_members = inspect.getmembers(module, inspect.isclass)
+    for class_name, clazz in class_members:
+        if clazz.__module__ != module.__name__:
+            continue  # Imported from elsewhere; it will be collected from the module that defines it
+        if not (issubclass(clazz, Process) or issubclass(clazz, Step)) or (clazz in [Process, Step, Composite]):
+            continue
+        collected_classes.append((class_name, clazz))
+    return collected_classes
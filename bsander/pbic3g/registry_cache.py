@@ -0,0 +1,112 @@
+### File that persists the local registry between runs, so only changed distributions need to be rescanned
+import hashlib
+import importlib.metadata
+import json
+import os
+import tempfile
+from dataclasses import dataclass, asdict, field
+
+from bsander.bsandr_utils.cache_directory import get_cache_file_path
+
+# Bump this whenever the layout of `RegistryEntry` changes; older caches will simply be rebuilt.
+REGISTRY_CACHE_FORMAT_VERSION = 2
+_default_registry_cache_name = "registry.json"
+
+
+@dataclass(frozen=True)
+class RegistryEntry:
+    module_name: str
+    class_name: str
+    kind: str  # one of "Process", "Step", or "Composite"
+    # What abstract resolution matches on; an entry's identity is still just its class. Qualified names of every
+    # ancestor class (nearest first), then the declared port and config names: `None` when they can't be known
+    # without instantiating the class.
+    bases: tuple[str, ...] = field(default=(), compare=False)
+    inputs: tuple[str, ...] | None = field(default=None, compare=False)
+    outputs: tuple[str, ...] | None = field(default=None, compare=False)
+    config_keys: tuple[str, ...] | None = field(default=None, compare=False)
+
+    @property
+    def address(self) -> str:
+        return f"{self.module_name}.{self.class_name}"
+
+
+def registry_entry_from_json(raw_entry: dict) -> RegistryEntry:
+    # JSON has no tuples; sequences come back as lists
+    return RegistryEntry(**{ key : (tuple(value) if isinstance(value, list) else value)
+                             for key, value in raw_entry.items() })
+
+
+@dataclass
+class CachedDistribution:
+    name: str
+    version: str
+    record_hash: str
+    entries: list[RegistryEntry]
+
+    def matches(self, other: "CachedDistribution") -> bool:
+        return self.name == other.name and self.version == other.version and self.record_hash == other.record_hash
+
+
+def describe_distribution(package: importlib.metadata.Distribution, name: str | None = None,
+                          version: str | None = None) -> CachedDistribution:
+    # `name` / `version`, when already known (e.g. from the distribution index), spare parsing the metadata again
+    # RECORD lists every installed file alongside its own hash, so any reinstall / upgrade / editable change shows up
+    record_contents = package.read_text("RECORD")
+    if record_contents is None:  # legacy (egg-info) installs have no RECORD; fall back to the file listing we do have
+        record_contents = package.read_text("SOURCES.txt") or ""
+    record_hash = hashlib.sha256(record_contents.encode("utf-8")).hexdigest()
+    return CachedDistribution(name if name is not None else package.name,
+                              version if version is not None else package.version, record_hash, [])
+
+
+def get_default_registry_cache_path() -> str:
+    return get_cache_file_path(_default_registry_cache_name)
+
+
+def load_registry_cache(cache_path: str | None = None) -> dict[str, CachedDistribution]:
+    cache_path = cache_path if cache_path is not None else get_default_registry_cache_path()
+    if not os.path.exists(cache_path):
+        return {}
+    try:
+        with open(cache_path, "r") as cache_file:
+            raw_cache = json.load(cache_file)
+    except (OSError, ValueError):
+        return {}  # A broken cache is never fatal; we'll just rescan everything
+    if not isinstance(raw_cache, dict) or raw_cache.get("format_version") != REGISTRY_CACHE_FORMAT_VERSION:
+        return {}
+    registry_cache: dict[str, CachedDistribution] = {}
+    for name, raw_distribution in raw_cache.get("distributions", {}).items():
+        try:
+            entries = [registry_entry_from_json(raw_entry) for raw_entry in raw_distribution["entries"]]
+            registry_cache[name] = CachedDistribution(name, raw_distribution["version"],
+                                                      raw_distribution["record_hash"], entries)
+        except (KeyError, TypeError):
+            continue
+    return registry_cache
+
+
+def save_registry_cache(registry_cache: dict[str, CachedDistribution], cache_path: str | None = None):
+    cache_path = cache_path if cache_path is not None else get_default_registry_cache_path()
+    raw_cache = {
+        "format_version": REGISTRY_CACHE_FORMAT_VERSION,
+        "distributions": {
+            name: {
+                "version": distribution.version,
+                "record_hash": distribution.record_hash,
+                "entries": [asdict(entry) for entry in distribution.entries],
+            } for name, distribution in sorted(registry_cache.items())
+        }
+    }
+    # Write then rename, so a concurrent run never observes a half-written cache
+    cache_dir = os.path.dirname(os.path.abspath(cache_path))
+    os.makedirs(cache_dir, exist_ok=True)
+    file_descriptor, temp_path = tempfile.mkstemp(dir=cache_dir, prefix=".registry-", suffix=".json")
+    try:
+        with os.fdopen(file_descriptor, "w") as temp_file:
+            json.dump(raw_cache, temp_file, indent=1)
+        os.replace(temp_path, cache_path)
+    except BaseException:
+        if os.path.exists(temp_path):
+            os.remove(temp_path)
+        raise
@@ -0,0 +1,96 @@
+### File that imports distributions for the local registry inside isolated worker processes
+import json
+import os
+import subprocess
+import sys
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass, asdict
+
+from bsander.pbic3g.registry_cache import RegistryEntry, registry_entry_from_json
+
+DEFAULT_IMPORT_TIMEOUT_SECONDS: float = 120.0
+DEFAULT_MEMORY_LIMIT_BYTES: int = 8 * 1024 ** 3
+
+
+@dataclass
+class ImportRequest:
+    distribution_name: str
+    # `None` means "import the whole distribution recursively"; otherwise only these modules are imported
+    module_names: list[str] | None = None
+
+
+@dataclass
+class ImportResult:
+    distribution_name: str
+    entries: list[RegistryEntry] | None  # `None` when the worker failed
+    error: str | None = None
+
+
+def scan_distributions_in_workers(import_requests: list[ImportRequest], max_workers: int | None = None,
+                                  timeout: float | None = DEFAULT_IMPORT_TIMEOUT_SECONDS,
+                                  memory_limit: int | None = DEFAULT_MEMORY_LIMIT_BYTES) -> list[ImportResult]:
+    if len(import_requests) == 0:
+        return []
+    max_workers = max_workers if max_workers is not None else (os.cpu_count() or 1)
+    worker_environment = _build_worker_environment()
+    # Each request gets its own interpreter, so the threads here only wait on subprocesses
+    with ThreadPoolExecutor(max_workers=min(max_workers, len(import_requests))) as executor:
+        return list(executor.map(lambda request: _run_worker(request, worker_environment, timeout, memory_limit),
+                                 import_requests))
+
+
+def _build_worker_environment() -> dict[str, str]:
+    # Workers must see exactly what we see, including any entries added to `sys.path` at runtime
+    worker_environment = dict(os.environ)
+    search_paths = [path for path in sys.path if path != ""]
+    worker_environment["PYTHONPATH"] = os.pathsep.join(search_paths)
+    return worker_environment
+
+
+def _run_worker(import_request: ImportRequest, worker_environment: dict[str, str], timeout: float | None,
+                memory_limit: int | None) -> ImportResult:
+    name = import_request.distribution_name
+    # The memory cap is applied by the worker itself; `preexec_fn` is unsafe with several threads spawning at once
+    worker_arguments = [sys.executable, "-m", __name__] + ([str(memory_limit)] if memory_limit is not None else [])
+    try:
+        completed_worker = subprocess.run(worker_arguments, input=json.dumps(asdict(import_request)),
+                                          capture_output=True, text=True, timeout=timeout, env=worker_environment)
+    except subprocess.TimeoutExpired:
+        return ImportResult(name, None, f"timed out after {timeout} seconds")
+    if completed_worker.returncode != 0:
+        error_lines = completed_worker.stderr.strip().splitlines()
+        error_summary = error_lines[-1] if len(error_lines) != 0 else "no error output"
+        return ImportResult(name, None, f"worker exited with code {completed_worker.returncode}: {error_summary}")
+    try:
+        raw_entries = json.loads(completed_worker.stdout)
+        entries = [registry_entry_from_json(raw_entry) for raw_entry in raw_entries]
+    except (ValueError, TypeError) as e:
+        return ImportResult(name, None, f"worker returned malformed results: {e}")
+    return ImportResult(name, entries)
+
+
+def _limit_worker_memory(memory_limit: int):
+    if os.name != "posix":
+        return
+    import resource
+    _, hard_limit = resource.getrlimit(resource.RLIMIT_AS)
+    if hard_limit != resource.RLIM_INFINITY:
+        memory_limit = min(memory_limit, hard_limit)
+    resource.setrlimit(resource.RLIMIT_AS, (memory_limit, hard_limit))
+
+
+def _worker_main():
+    if len(sys.argv) > 1:
+        _limit_worker_memory(int(sys.argv[1]))
+    import_request = ImportRequest(**json.load(sys.stdin))
+    # Imported packages may print freely; keep our stdout clean for the results
+    results_stream = sys.stdout
+    sys.stdout = sys.stderr
+    from bsander.pbic3g.local_registry import perform_import_request
+    entries = perform_import_request(import_request)
+    results_stream.write(json.dumps([asdict(entry) for entry in entries]))
+    results_stream.flush()
+
+
+if __name__ == "__main__":
+    _worker_main()
@@ -0,0 +1,319 @@
+### File that discovers Process / Step / Composite implementations by reading package sources, without importing them
+import ast
+import importlib.metadata
+import importlib.util
+import os
+import sys
+from dataclasses import dataclass, field
+
+from bsander.pbic3g.registry_cache import RegistryEntry
+
+_root_package_name = "process_bigraph"
+_root_class_kinds = ["Composite", "Step", "Process"]  # in order of precedence when a class has several of them as bases
+_unresolved = "?"
+_declared_members = {"inputs": "inputs", "outputs": "outputs", "config_schema": "config_keys"}  # -> entry field
+
+
+@dataclass
+class _ModuleSummary:
+    module_name: str
+    aliases: dict[str, str] = field(default_factory=dict)  # local name -> fully qualified name
+    class_bases: dict[str, list[str | None]] = field(default_factory=dict)  # class name -> qualified bases
+    # class name -> member (`inputs`, ...) -> declared names (`None` if not a literal); absent members are inherited
+    class_declarations: dict[str, dict[str, tuple[str, ...] | None]] = field(default_factory=dict)
+
+
+@dataclass
+class StaticDiscoveryResult:
+    entries: list[RegistryEntry]
+    # Modules holding classes whose ancestry could not be determined from source alone; these need a real import
+    unresolved_modules: list[str]
+
+
+def discover_distribution_statically(package: importlib.metadata.Distribution) -> StaticDiscoveryResult | None:
+    source_files = find_distribution_source_files(package)
+    if len(source_files) == 0:
+        return None  # Nothing to read (compiled-only or unusual install); caller should fall back to importing
+    return discover_modules_statically(source_files)
+
+
+def discover_modules_statically(source_files: dict[str, str]) -> StaticDiscoveryResult:
+    summaries: dict[str, _ModuleSummary] = {}
+    unresolved_modules: set[str] = set()
+    for module_name, file_path in source_files.items():
+        try:
+            with open(file_path, "rb") as source_file:
+                tree = ast.parse(source_file.read(), filename=file_path)
+        except (OSError, SyntaxError, ValueError):
+            unresolved_modules.add(module_name)
+            continue
+        summaries[module_name] = _summarize_module(module_name, file_path.endswith("__init__.py"), tree)
+
+    resolver = _KindResolver(summaries)
+    entries: list[RegistryEntry] = []
+    for module_name, summary in summaries.items():
+        for class_name in summary.class_bases:
+            kind = resolver.resolve_class(f"{module_name}.{class_name}")
+            if kind == _unresolved:
+                unresolved_modules.add(module_name)
+            elif kind is not None:
+                qualified_name = f"{module_name}.{class_name}"
+                declarations = { entry_field : resolver.resolve_declaration(qualified_name, member_name)
+                                 for member_name, entry_field in _declared_members.items() }
+                entries.append(RegistryEntry(module_name, class_name, kind, resolver.resolve_ancestry(qualified_name),
+                                             **declarations))
+    return StaticDiscoveryResult(entries, sorted(unresolved_modules))
+
+
+def find_distribution_source_files(package: importlib.metadata.Distribution) -> dict[str, str]:
+    source_files: dict[str, str] = {}
+    for package_path in package.files or []:
+        if package_path.suffix != ".py" or ".." in package_path.parts or package_path.parts[0].endswith("-info"):
+            continue
+        module_name = _convert_relative_path_to_module_name(package_path.parts)
+        if module_name is not None:
+            source_files[module_name] = str(package.locate_file(package_path))
+    if len(source_files) != 0:
+        return source_files
+
+    # Editable / path-based installs only list a `.pth` (or finder) in RECORD; locate the top-level packages instead.
+    # `find_spec` on a top-level name only locates it; nothing is executed.
+    top_level_contents = package.read_text("top_level.txt")
+    top_level_names = top_level_contents.split() if top_level_contents else [package.name.replace("-", "_")]
+    for top_level_name in top_level_names:
+        try:
+            spec = importlib.util.find_spec(top_level_name)
+        except (ImportError, ValueError):
+            continue
+        if spec is None or spec.origin is None:
+            continue
+        if spec.submodule_search_locations is None:
+            if spec.origin.endswith(".py"):
+                source_files[top_level_name] = spec.origin
+            continue
+        for search_location in spec.submodule_search_locations:
+            for directory, _subdirectories, file_names in os.walk(search_location):
+                relative_parts = os.path.relpath(directory, search_location).split(os.sep)
+                relative_parts = [part for part in relative_parts if part != "."]
+                for file_name in file_names:
+                    if not file_name.endswith(".py"):
+                        continue
+                    module_name = _convert_relative_path_to_module_name([top_level_name, *relative_parts, file_name])
+                    if module_name is not None:
+                        source_files[module_name] = os.path.join(directory, file_name)
+    return source_files
+
+
+def _convert_relative_path_to_module_name(path_parts) -> str | None:
+    parts = list(path_parts)
+    parts[-1] = parts[-1][:-len(".py")]
+    if parts[-1] == "__init__":
+        parts = parts[:-1]
+    if len(parts) == 0 or not all(part.isidentifier() for part in parts):
+        return None
+    return ".".join(parts)
+
+
+def _summarize_module(module_name: str, is_package: bool, tree: ast.Module) -> _ModuleSummary:
+    summary = _ModuleSummary(module_name)
+    package_name = module_name if is_package else module_name.rpartition(".")[0]
+    # Only module-level statements matter here; anything nested in functions is invisible to the registry anyway
+    for statement in _iterate_module_level_statements(tree.body):
+        if isinstance(statement, ast.Import):
+            for alias in statement.names:
+                if alias.asname is not None:
+                    summary.aliases[alias.asname] = alias.name
+                else:
+                    top_level_name = alias.name.split(".")[0]
+                    summary.aliases[top_level_name] = top_level_name
+        elif isinstance(statement, ast.ImportFrom):
+            source_module = _resolve_import_from(package_name, statement)
+            if source_module is None:
+                continue
+            for alias in statement.names:
+                if alias.name == "*":
+                    continue
+                summary.aliases[alias.asname or alias.name] = f"{source_module}.{alias.name}"
+        elif isinstance(statement, ast.ClassDef):
+            summary.class_bases[statement.name] = [_convert_expression_to_dotted_name(base) for base in statement.bases]
+            summary.class_declarations[statement.name] = _summarize_class_declarations(statement)
+            summary.aliases.pop(statement.name, None)  # a local definition shadows any earlier import
+    return summary
+
+
+def _summarize_class_declarations(class_definition: ast.ClassDef) -> dict[str, tuple[str, ...] | None]:
+    # `config_schema = {...}` and `def inputs(self): return {...}` are read straight from their dict literals
+    declarations: dict[str, tuple[str, ...] | None] = {}
+    for statement in class_definition.body:
+        if isinstance(statement, (ast.Assign, ast.AnnAssign)):
+            targets = statement.targets if isinstance(statement, ast.Assign) else [statement.target]
+            for target in targets:
+                if isinstance(target, ast.Name) and target.id in _declared_members:
+                    declarations[target.id] = _convert_dict_literal_to_keys(statement.value)
+        elif isinstance(statement, (ast.FunctionDef, ast.AsyncFunctionDef)) and statement.name in _declared_members:
+            body = [inner for inner in statement.body
+                    if not (isinstance(inner, ast.Expr) and isinstance(inner.value, ast.Constant))]  # docstrings
+            is_single_return = len(body) == 1 and isinstance(body[0], ast.Return)
+            declarations[statement.name] = _convert_dict_literal_to_keys(body[0].value) if is_single_return else None
+    return declarations
+
+
+def _convert_dict_literal_to_keys(expression: ast.expr | None) -> tuple[str, ...] | None:
+    if not isinstance(expression, ast.Dict):
+        return None
+    if not all(isinstance(key, ast.Constant) and isinstance(key.value, str) for key in expression.keys):
+        return None  # `**spread` (a `None` key) or computed keys
+    return tuple(key.value for key in expression.keys)
+
+
+def _iterate_module_level_statements(statements: list[ast.stmt]):
+    for statement in statements:
+        if isinstance(statement, ast.If):  # e.g. `if TYPE_CHECKING:` or version guards
+            yield from _iterate_module_level_statements(statement.body)
+            yield from _iterate_module_level_statements(statement.orelse)
+        elif isinstance(statement, ast.Try):
+            yield from _iterate_module_level_statements(statement.body)
+            for handler in statement.handlers:
+                yield from _iterate_module_level_statements(handler.body)
+        else:
+            yield statement
+
+
+def _resolve_import_from(package_name: str, statement: ast.ImportFrom) -> str | None:
+    if statement.level == 0:
+        return statement.module
+    package_parts = package_name.split(".") if package_name else []
+    if statement.level - 1 > len(package_parts):
+        return None
+    base_parts = package_parts[:len(package_parts) - (statement.level - 1)]
+    if statement.module is not None:
+        base_parts.append(statement.module)
+    return ".".join(base_parts) if len(base_parts) != 0 else None
+
+
+def _convert_expression_to_dotted_name(expression: ast.expr) -> str | None:
+    if isinstance(expression, ast.Subscript):  # e.g. `Generic[T]`, `SomeProcess[Config]`
+        expression = expression.value
+    if isinstance(expression, ast.Call):  # e.g. `with_metaclass(Meta, Base)`; can't be known without running it
+        return None
+    parts: list[str] = []
+    while isinstance(expression, ast.Attribute):
+        parts.append(expression.attr)
+        expression = expression.value
+    if not isinstance(expression, ast.Name):
+        return None
+    parts.append(expression.id)
+    return ".".join(reversed(parts))
+
+
+class _KindResolver:
+    def __init__(self, summaries: dict[str, _ModuleSummary]):
+        self.summaries = summaries
+        self.known_kinds: dict[str, str | None] = {}
+
+    def resolve_class(self, qualified_name: str) -> str | None:
+        if qualified_name in self.known_kinds:
+            return self.known_kinds[qualified_name]
+        self.known_kinds[qualified_name] = _unresolved  # guards against cyclic definitions
+        module_name, _, class_name = qualified_name.rpartition(".")
+        summary = self.summaries[module_name]
+        kinds: list[str | None] = [self._resolve_base(summary, base) for base in summary.class_bases[class_name]]
+        kind: str | None = None
+        for root_kind in _root_class_kinds:
+            if root_kind in kinds:
+                kind = root_kind
+                break
+        if kind is None and _unresolved in kinds:
+            kind = _unresolved
+        self.known_kinds[qualified_name] = kind
+        return kind
+
+    def resolve_ancestry(self, qualified_name: str) -> tuple[str, ...]:
+        # Every ancestor that can be named from source, nearest first; ancestry outside these modules stops at the name
+        ancestry: list[str] = []
+        pending: list[str] = [qualified_name]
+        while len(pending) != 0:
+            module_name, _, class_name = pending.pop(0).rpartition(".")
+            for base in self.summaries[module_name].class_bases[class_name]:
+                qualified_base = self._qualify_base(self.summaries[module_name], base)
+                if qualified_base is None or qualified_base in ancestry or qualified_base == qualified_name:
+                    continue
+                ancestry.append(qualified_base)
+                if self._is_known_class(qualified_base):
+                    pending.append(qualified_base)
+        return tuple(ancestry)
+
+    def resolve_declaration(self, qualified_name: str, member_name: str, depth: int = 0) -> tuple[str, ...] | None:
+        # Undeclared members come from the first base that declares them, as attribute lookup would find them
+        module_name, _, class_name = qualified_name.rpartition(".")
+        summary = self.summaries[module_name]
+        declarations = summary.class_declarations.get(class_name, {})
+        if member_name in declarations:
+            return declarations[member_name]
+        if depth > 16:
+            return None
+        for base in summary.class_bases[class_name]:
+            qualified_base = self._qualify_base(summary, base)
+            if qualified_base is None:
+                return None
+            if qualified_base.split(".")[0] == _root_package_name:
+                continue  # the root classes declare no ports and no config
+            if not self._is_known_class(qualified_base):
+                return None  # defined in another distribution; can't be read from here
+            declaration = self.resolve_declaration(qualified_base, member_name, depth + 1)
+            if declaration != ():
+                return declaration
+        return ()
+
+    def _qualify_base(self, summary: _ModuleSummary, base: str | None) -> str | None:
+        # Where a base class is actually defined, following imports and re-exports as far as these modules go
+        if base is None:
+            return None
+        first_part, _, remainder = base.partition(".")
+        if first_part in summary.class_bases and remainder == "":
+            return f"{summary.module_name}.{first_part}"
+        if first_part not in summary.aliases:
+            return None  # a builtin such as `object` or `Exception`
+        qualified_base = summary.aliases[first_part] + ("." + remainder if remainder else "")
+        for _ in range(16):
+            module_name, _, class_name = qualified_base.rpartition(".")
+            module_summary = self.summaries.get(module_name)
+            if module_summary is None or class_name in module_summary.class_bases \
+                    or class_name not in module_summary.aliases:
+                break
+            qualified_base = module_summary.aliases[class_name]
+        return qualified_base
+
+    def _is_known_class(self, qualified_name: str) -> bool:
+        module_name, _, class_name = qualified_name.rpartition(".")
+        return module_name in self.summaries and class_name in self.summaries[module_name].class_bases
+
+    def _resolve_base(self, summary: _ModuleSummary, base: str | None) -> str | None:
+        if base is None:
+            return _unresolved
+        first_part, _, remainder = base.partition(".")
+        if first_part in summary.class_bases and remainder == "":
+            return self.resolve_class(f"{summary.module_name}.{first_part}")
+        if first_part not in summary.aliases:
+            return None  # a builtin such as `object` or `Exception`
+        qualified_base = summary.aliases[first_part] + ("." + remainder if remainder else "")
+        return self._resolve_qualified_name(qualified_base, depth=0)
+
+    def _resolve_qualified_name(self, qualified_name: str, depth: int) -> str | None:
+        if depth > 16:
+            return _unresolved
+        top_level_name = qualified_name.split(".")[0]
+        if top_level_name == _root_package_name:
+            class_name = qualified_name.rpartition(".")[2]
+            return class_name if class_name in _root_class_kinds else _unresolved
+        module_name, _, class_name = qualified_name.rpartition(".")
+        summary = self.summaries.get(module_name)
+        if summary is not None:
+            if class_name in summary.class_bases:
+                return self.resolve_class(qualified_name)
+            if class_name in summary.aliases:  # re-exported, e.g. through a package `__init__`
+                return self._resolve_qualified_name(summary.aliases[class_name], depth + 1)
+            return _unresolved
+        if top_level_name in sys.stdlib_module_names:
+            return None
+        return _unresolved  # Defined in another distribution; only a real import can tell us
@@ -2,26 +2,69 @@ import argparse
 import os
 import sys
 
-from bsander.bsandr_utils.input_types import ContainerizationTypes, ContainerizationEngine, ProgramArguments
-from bsander.execution import execute_bsander
+from bsander.bsandr_utils.input_types import ContainerizationTypes, ContainerizationEngine, ProgramArguments, \
+    DockerfileTemplateMode, ArchiveMode
+from bsander.bsandr_utils.instrumentation import profile_to_file
 
+# Everything else (the registry, containerization, lockfiles) is imported in `main`, once arguments are valid;
+# `--help` and argument errors shouldn't pay for it.
 
-def get_program_arguments() -> ProgramArguments:
+
+def get_program_arguments() -> tuple[ProgramArguments, str | None]:
     parser: argparse.ArgumentParser = argparse.ArgumentParser(
         prog='BioSimulators Tool, Abstraction, Node, & Dependency Resolver (BStandr)',
         description='''BioSimulators project designed to help users resolve any abstract or missing components, 
             and/or creating a containerized environment to repeatedly run the provided experiment''')
     parser.add_argument('input_file_path', type=str)  # positional argument
+    parser.add_argument('-b', '--batch', action="store_true",
+                        help="treat `input_file_path` as a directory, glob pattern, or manifest file (one input per line) "
+                             "and process every input found, loading the local registry only once.")
+    parser.add_argument('-j', '--jobs', type=int,
+                        help="in batch mode, how many inputs to process concurrently (defaults to the CPU count)")
     parser.add_argument('-c', '--containerize', choices=['single', 'multiple'],
                         help="specifies if a containerized runtime should be initialized. "
                              "`single` mode will reject a configuration that results in multiple containers needing to be coordinated together."
                              "`multiple` mode will accept a result that is a coordination of multiple containers.")
     parser.add_argument('-t', '--target-containerization', choices=['docker', 'apptainer', "singularity", 'both'],
                         help="if containerization is specified, selects whether to containerize with `docker` or `apptainer` (formerly Singularity CE)")
+    parser.add_argument('--dockerfile-template', choices=['generic', 'optimized'], default='generic',
+                        help="`optimized` merges layers, orders stable dependencies before volatile ones, and uses "
+                             "BuildKit cache mounts for apt, uv, and micromamba (requires BuildKit to build)")
+    parser.add_argument('--archive-mode', choices=['extract', 'stream'], default='extract',
+                        help="for ZIP/OMEX inputs, `stream` reads only the PBIF members (found through the OMEX manifest) "
+                             "and rewrites the archive by copying every other member's compressed bytes, instead of "
+                             "extracting and re-compressing the whole archive")
+    parser.add_argument('--lock-pypi-index', type=str,
+                        help="directory of wheels / sdists to pin PyPI dependencies against; the build then installs "
+                             "from a hash-checked `requirements.lock` instead of resolving")
+    parser.add_argument('--lock-conda-channel', type=str,
+                        help="local conda channel directory (containing `linux-64` / `noarch` repodata.json) to pin "
+                             "conda dependencies against; the build then installs from an explicit spec")
+    parser.add_argument('--lock-conda-channel-url', type=str, default="https://conda.anaconda.org/conda-forge",
+                        help="URL the locked conda packages are downloaded from at build time")
     parser.add_argument('-o', '--output_directory', nargs='?', const='.',
                         help="specifies output directory; if not provided, no output file will be generated, but validation (and containerization if requested) will occur.")
     parser.add_argument("-w", "--whitelist", type=str,
                         help="path to a whitelist file that if specified, will declare valid packages to create an environment with. ")
+    parser.add_argument('--no-cache', action="store_true",
+                        help="ignore (and don't update) the on-disk registry and container build file caches")
+    parser.add_argument('--incremental', action="store_true",
+                        help="keep a manifest next to the output document, so the next run into the same output "
+                             "directory only re-resolves the addresses around what was edited, and only regenerates "
+                             "container build files if an address changed (JSON/PBIF inputs only)")
+    parser.add_argument('--zero-copy', action="store_true",
+                        help="for JSON/PBIF inputs, read the input where it is and write only the resolved document "
+                             "into the output directory (atomically), instead of copying the input there first. "
+                             "A document nothing rewrites is copied once, unless an identical copy is already there; "
+                             "localization still writes the whole document, since it writes as it scans")
+    parser.add_argument('--daemon', nargs='?', const='', metavar='SOCKET',
+                        help="forward this run to a bsander daemon (started with `python -m bsander.daemon`) that keeps "
+                             "the registry loaded between runs; optionally, the daemon's socket path")
+    parser.add_argument('--profile', nargs='?', const='', metavar='REPORT_PATH',
+                        help="time every pipeline stage and count the work done (addresses localized, bytes read and "
+                             "written, modules imported, peak memory), writing a Chrome trace report (viewable in "
+                             "`chrome://tracing` or Perfetto) to REPORT_PATH, or to `bsander_profile.json` in the "
+                             "output directory")
     parser.add_argument('-v', '--verbose', action="store_true")
     args = parser.parse_args()
     if args.target_containerization is not None and args.containerize is None:
@@ -31,13 +74,23 @@ def get_program_arguments() -> ProgramArguments:
     if args.target_containerization is None and args.containerize is not None:
         args.target_containerization = "docker"  # docker default, because apptainer is only linux
 
-    args.input_file_path = os.path.abspath(os.path.expanduser(args.input_file_path))
-    if not os.path.exists(args.input_file_path) or not os.path.isfile(args.input_file_path) or not (
-            args.input_file_path.endswith(".json") or args.input_file_path.endswith(".pbif")
-            or args.input_file_path.endswith(".zip") or args.input_file_path.endswith(".omex")):
+    if args.jobs is not None and (not args.batch or args.jobs < 1):
         parser.print_help()
-        print("error: `input_file_path` must be either JSON/PBIF file, or ZIP/OMEX that exists!", file=sys.stderr)
-        sys.exit(11)
+        print("Error: --jobs requires --batch, and must be at least 1", file=sys.stderr)
+        sys.exit(16)
+
+    if args.batch:
+        args.input_file_path = os.path.expanduser(args.input_file_path)
+        if os.path.exists(args.input_file_path):  # otherwise, it's a glob pattern
+            args.input_file_path = os.path.abspath(args.input_file_path)
+    else:
+        args.input_file_path = os.path.abspath(os.path.expanduser(args.input_file_path))
+        if not os.path.exists(args.input_file_path) or not os.path.isfile(args.input_file_path) or not (
+                args.input_file_path.endswith(".json") or args.input_file_path.endswith(".pbif")
+                or args.input_file_path.endswith(".zip") or args.input_file_path.endswith(".omex")):
+            parser.print_help()
+            print("error: `input_file_path` must be either JSON/PBIF file, or ZIP/OMEX that exists!", file=sys.stderr)
+            sys.exit(11)
     if args.output_directory is not None:
         args.output_directory = os.path.abspath(os.path.expanduser(args.output_directory))
         if not os.path.exists(args.output_directory) or not (
@@ -45,8 +98,10 @@ def get_program_arguments() -> ProgramArguments:
             parser.print_help()
             print("`output_directory` must be a directory that exists!", file=sys.stderr)
             sys.exit(12)
+    elif args.batch:
+        args.output_directory = os.getcwd()
     else:
-        args.output_directory = args.input_file_path.parent
+        args.output_directory = os.path.dirname(args.input_file_path)
 
     if args.whitelist is not None:
         args.whitelist = os.path.abspath(os.path.expanduser(args.whitelist))
@@ -55,10 +110,19 @@ def get_program_arguments() -> ProgramArguments:
             parser.print_help()
             print("`whitelist` must be a file that exists!", file=sys.stderr)
             sys.exit(13)
-        with args.whitelist.open() as f:
+        with open(args.whitelist) as f:
             whitelist_contents = f.read().strip().split("\n")
     else:
         whitelist_contents = None
+    for lock_source_arg in ("lock_pypi_index", "lock_conda_channel"):
+        lock_source = getattr(args, lock_source_arg)
+        if lock_source is not None:
+            lock_source = os.path.abspath(os.path.expanduser(lock_source))
+            if not os.path.isdir(lock_source):
+                parser.print_help()
+                print(f"`{lock_source_arg.replace('_', '-')}` must be a directory that exists!", file=sys.stderr)
+                sys.exit(17)
+            setattr(args, lock_source_arg, lock_source)
     containerization_type: ContainerizationTypes = ContainerizationTypes.NONE
     containerization_engine: ContainerizationEngine = ContainerizationEngine.NONE
     if args.containerize is not None:
@@ -82,18 +146,73 @@ def get_program_arguments() -> ProgramArguments:
             print("error: `target-containerization` must be `docker`, `apptainer`, or `both.", file=sys.stderr)
             sys.exit(15)
 
+    profile_path: str | None = None
+    if args.profile is not None:
+        profile_path = os.path.abspath(os.path.expanduser(args.profile)) if args.profile != "" \
+            else os.path.join(args.output_directory, "bsander_profile.json")
+
+    daemon_socket_path: str | None = None
+    if args.daemon is not None:  # "" is the daemon's default socket
+        daemon_socket_path = os.path.abspath(os.path.expanduser(args.daemon)) if args.daemon != "" else ""
+
     return ProgramArguments(input_file_path=args.input_file_path,
                             output_dir=args.output_directory,
                             whitelist_entries=whitelist_contents,
                             containerization_type=containerization_type,
-                            containerization_engine=containerization_engine)
+                            containerization_engine=containerization_engine,
+                            use_cache=not args.no_cache,
+                            template_mode=DockerfileTemplateMode.OPTIMIZED if args.dockerfile_template == 'optimized'
+                            else DockerfileTemplateMode.GENERIC,
+                            archive_mode=ArchiveMode.STREAMING if args.archive_mode == 'stream' else ArchiveMode.EXTRACT,
+                            batch_mode=args.batch,
+                            batch_workers=args.jobs,
+                            pypi_lock_index=args.lock_pypi_index,
+                            conda_lock_channel=args.lock_conda_channel,
+                            conda_lock_channel_url=args.lock_conda_channel_url,
+                            incremental=args.incremental,
+                            profile_path=profile_path,
+                            zero_copy=args.zero_copy), daemon_socket_path
 
 def main():
-    prog_args = get_program_arguments()
+    prog_args, daemon_socket_path = get_program_arguments()
+    if daemon_socket_path is not None:
+        run_through_daemon(prog_args, daemon_socket_path)
+        return
+    with profile_to_file(prog_args.profile_path):
+        run_locally(prog_args)
+
+def run_locally(prog_args: ProgramArguments):
+    if prog_args.batch_mode:
+        from bsander.batch import collect_batch_inputs, execute_bsander_batch
+        try:
+            input_file_paths = collect_batch_inputs(prog_args.input_file_path)
+        except ValueError as e:
+            print(e, file=sys.stderr)
+            sys.exit(11)
+        results = execute_bsander_batch(input_file_paths, prog_args, prog_args.batch_workers)
+        if not all(result.succeeded for result in results):
+            sys.exit(1)
+        return
+    from bsander.execution import execute_bsander
     try:
         execute_bsander(prog_args)
     except Exception as e:
         print(e, file=sys.stderr)
+        sys.exit(11)
+
+def run_through_daemon(prog_args: ProgramArguments, daemon_socket_path: str):
+    from bsander.daemon import forward_to_daemon
+    try:
+        response = forward_to_daemon(prog_args, daemon_socket_path if daemon_socket_path != "" else None)
+    except OSError as e:
+        print(f"error: unable to reach the bsander daemon ({e}); is `python -m bsander.daemon` running?",
+              file=sys.stderr)
+        sys.exit(18)
+    print(response.get("output", ""), end="")
+    if response.get("error") is not None:
+        print(response["error"], file=sys.stderr)
+    if not response.get("ok", False):  # the same exit codes as a local run
+        sys.exit(1 if prog_args.batch_mode else 11)
 
 if __name__ == "__main__":
     main()
@@ -0,0 +1,91 @@
+import json
+import os
+import zipfile
+
+import pytest
+
+from bsander.bsandr_utils.experiment_archive import *
+
+_manifest = """<?xml version="1.0" encoding="UTF-8"?>
+<omexManifest xmlns="http://identifiers.org/combine.specifications/omex-manifest">
+  <content location="." format="http://identifiers.org/combine.specifications/omex"/>
+  <content location="./manifest.xml" format="http://identifiers.org/combine.specifications/omex-manifest"/>
+  <content location="./simulation/experiment.pbif" format="http://purl.org/NET/mediatypes/application/json"/>
+  <content location="./data/results.json" format="http://purl.org/NET/mediatypes/application/x-hdf5"/>
+</omexManifest>
+"""
+_document = json.dumps({"state": {"sim": {"address": "pypi:numpy[>=2.0.0]@numpy.random.rand"}}})
+
+
+@pytest.fixture
+def omex_archive(tmp_path):
+    archive_path = tmp_path / "experiment.omex"
+    with zipfile.ZipFile(archive_path, "w") as archive:
+        archive.writestr("mimetype", "application/zip", compress_type=zipfile.ZIP_STORED)
+        archive.writestr("manifest.xml", _manifest, compress_type=zipfile.ZIP_DEFLATED)
+        archive.writestr("data/model.bin", os.urandom(1 << 20), compress_type=zipfile.ZIP_STORED)
+        archive.writestr("data/results.json", "[" + "1.0, " * 200000 + "1.0]", compress_type=zipfile.ZIP_DEFLATED)
+        archive.writestr("simulation/experiment.pbif", _document, compress_type=zipfile.ZIP_DEFLATED)
+    return archive_path
+
+
+def test_read_archive_pbif_documents_follows_the_manifest(omex_archive):
+    # `data/results.json` is only a JSON file by name; the manifest says it's results, so it is never read
+    assert read_archive_pbif_documents(str(omex_archive)) == {"simulation/experiment.pbif": _document}
+
+
+def test_read_archive_pbif_documents_without_a_manifest(tmp_path):
+    archive_path = tmp_path / "experiment.zip"
+    with zipfile.ZipFile(archive_path, "w") as archive:
+        archive.writestr("__MACOSX/._experiment.pbif", "resource fork")
+        archive.writestr("experiment.pbif", _document)
+    assert list(read_archive_pbif_documents(str(archive_path))) == ["experiment.pbif"]
+
+
+def test_write_archive_with_replacements_copies_other_members_raw(omex_archive, tmp_path, monkeypatch):
+    read_members: list[str] = []
+    original_open = zipfile.ZipFile.open
+    def recording_open(archive, name, mode="r", *args, **kwargs):
+        if mode == "r":
+            read_members.append(name.filename if isinstance(name, zipfile.ZipInfo) else name)
+        return original_open(archive, name, mode, *args, **kwargs)
+    monkeypatch.setattr(zipfile.ZipFile, "open", recording_open)
+
+    destination_path = tmp_path / "rewritten.omex"
+    write_archive_with_replacements(str(omex_archive), str(destination_path),
+                                    {"simulation/experiment.pbif": "{\"rewritten\": true}"})
+    assert read_members == []  # nothing was decompressed (or recompressed) along the way
+    monkeypatch.setattr(zipfile.ZipFile, "open", original_open)
+
+    with zipfile.ZipFile(omex_archive) as source_archive, zipfile.ZipFile(destination_path) as destination_archive:
+        assert destination_archive.testzip() is None
+        assert destination_archive.namelist() == source_archive.namelist()
+        assert destination_archive.read("simulation/experiment.pbif") == b"{\"rewritten\": true}"
+        for name in ["mimetype", "manifest.xml", "data/model.bin", "data/results.json"]:
+            source_info, destination_info = source_archive.getinfo(name), destination_archive.getinfo(name)
+            assert (destination_info.compress_type, destination_info.compress_size, destination_info.CRC) == \
+                   (source_info.compress_type, source_info.compress_size, source_info.CRC)
+            assert destination_archive.read(name) == source_archive.read(name)
+
+
+def test_write_archive_with_replacements_in_place(omex_archive):
+    write_archive_with_replacements(str(omex_archive), str(omex_archive), {"simulation/experiment.pbif": "{}"})
+    with zipfile.ZipFile(omex_archive) as archive:
+        assert archive.read("simulation/experiment.pbif") == b"{}"
+        assert len(archive.read("data/model.bin")) == 1 << 20
+    assert [name for name in os.listdir(os.path.dirname(omex_archive)) if name.startswith(".bsander-")] == []
+
+
+def test_write_archive_with_replacements_without_raw_copy_support(omex_archive, tmp_path, monkeypatch):
+    # Should a Python's `zipfile` lack what raw copies rely on, members are recompressed instead
+    import bsander.bsandr_utils.experiment_archive as experiment_archive_module
+    monkeypatch.setattr(experiment_archive_module, "_can_copy_raw_members", lambda destination_archive: False)
+    destination_path = tmp_path / "rewritten.omex"
+    write_archive_with_replacements(str(omex_archive), str(destination_path), {"simulation/experiment.pbif": "{}"})
+    with zipfile.ZipFile(omex_archive) as source_archive, zipfile.ZipFile(destination_path) as destination_archive:
+        assert destination_archive.testzip() is None
+        assert destination_archive.namelist() == source_archive.namelist()
+        assert destination_archive.read("simulation/experiment.pbif") == b"{}"
+        for name in ["mimetype", "manifest.xml", "data/model.bin", "data/results.json"]:
+            assert destination_archive.getinfo(name).compress_type == source_archive.getinfo(name).compress_type
+            assert destination_archive.read(name) == source_archive.read(name)
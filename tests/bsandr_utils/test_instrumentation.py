@@ -0,0 +1,64 @@
+import json
+import os
+import tempfile
+from concurrent.futures import ThreadPoolExecutor
+
+from bsander.bsandr_utils.instrumentation import *
+
+
+def test_nothing_is_recorded_without_a_profiler():
+    with span("stage") as attributes:
+        attributes["ignored"] = True
+    count("addresses_localized", 3)
+    with profiling() as profiler:
+        pass
+    assert profiler.spans == [] and profiler.counters == {}
+
+
+def test_spans_nest_and_counters_add_up_across_threads():
+    def work(index: int):
+        with span("work", index=index):
+            count("items", index)
+
+    with profiling() as profiler:
+        with span("outer") as attributes:
+            with ThreadPoolExecutor(max_workers=2) as executor:
+                list(executor.map(carry_context(work), range(4)))
+            attributes["done"] = True
+    report = profiler.report()
+    assert [span_record.name for span_record in report.spans] == ["outer", "work", "work", "work", "work"]
+    assert report.spans[0].depth == 0 and report.spans[0].attributes == {"done": True}
+    assert all(span_record.depth == 1 for span_record in report.spans[1:])
+    assert report.counters["items"] == 6
+    assert report.get_stage_durations()["outer"] >= report.spans[1].duration_seconds
+
+
+def test_hooks_see_every_span():
+    seen: list[str] = []
+    remove_hook = add_span_hook(lambda span_record: seen.append(span_record.name))
+    try:
+        with span("unprofiled"):
+            pass
+    finally:
+        remove_hook()
+    with span("after removal"):
+        pass
+    assert seen == ["unprofiled"]
+
+
+def test_profile_report_is_a_chrome_trace():
+    with tempfile.TemporaryDirectory() as tmpdir:
+        report_path = os.path.join(tmpdir, "profile.json")
+        try:
+            with profile_to_file(report_path):
+                with span("stage"):
+                    count("bytes_read", 10)
+                raise RuntimeError("the report is written anyway")
+        except RuntimeError:
+            pass
+        with open(report_path, "r") as report_file:
+            report = json.load(report_file)
+    assert [event["ph"] for event in report["traceEvents"]] == ["X", "C"]
+    assert report["traceEvents"][0]["name"] == "stage"
+    assert report["bsander"]["counters"]["bytes_read"] == 10
+    assert "stage" in report["bsander"]["stage_durations_seconds"]
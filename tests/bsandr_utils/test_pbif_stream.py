@@ -0,0 +1,78 @@
+import io
+import json
+
+import pytest
+
+from bsander.bsandr_utils.pbif_stream import *
+
+fake_pbif = json.dumps({
+    "state": {
+        "actin": {
+            "_type": "process",
+            "address": "pypi:readdy[>=2.0]@readdy.ActinProcess",
+            "config": {"description": "wraps pypi:numpy@numpy.random.rand for noise", "rates": [1.0, 2e-3, -4]},
+            "inputs": {},
+            "outputs": {"species": ["species_store"]},
+        },
+        "emitter": {"_type": "step", "address": "local:ram-emitter", "config": {"emit": {"time": "float"}}},
+        "flags": [True, False, None, {"address": "ignored-nested-because-rewrite-is-callers-choice"}],
+    }
+}, indent=2)
+
+
+def test_rewrite_pbif_addresses_only_touches_address_fields():
+    seen_addresses = []
+
+    def fake_rewrite(address: str) -> str:
+        seen_addresses.append(address)
+        return address.upper() if address.startswith("pypi:") else address
+
+    destination = io.StringIO()
+    rewritten_count = rewrite_pbif_addresses(io.StringIO(fake_pbif), destination, fake_rewrite, chunk_size=7)
+    assert rewritten_count == 1
+    assert seen_addresses == ["pypi:readdy[>=2.0]@readdy.ActinProcess", "local:ram-emitter",
+                              "ignored-nested-because-rewrite-is-callers-choice"]
+    correct_answer = json.loads(fake_pbif)
+    correct_answer["state"]["actin"]["address"] = "PYPI:READDY[>=2.0]@READDY.ACTINPROCESS"
+    assert json.loads(destination.getvalue()) == correct_answer
+    # Everything else is echoed byte for byte
+    assert destination.getvalue() == fake_pbif.replace("pypi:readdy[>=2.0]@readdy.ActinProcess",
+                                                       "PYPI:READDY[>=2.0]@READDY.ACTINPROCESS")
+
+
+@pytest.mark.parametrize("malformed_document", [
+    '"pypi:numpy[>=2.0.0]@numpy.random.rand"\n"pypi:process-bigraph[<1.0]@process_bigraph.processes.ParameterScan"',
+    '{"address": "local:x",}',
+    '{"address" "local:x"}',
+    '"pypi:numpy[>=2.0.0]@numpy.random.rand"',
+    '[{"address": "local:x"}]',
+    '{"address": tru}',
+    '',
+])
+def test_rewrite_pbif_addresses_rejects_malformed_documents(malformed_document: str):
+    with pytest.raises(PbifFormatError):
+        rewrite_pbif_addresses(io.StringIO(malformed_document), None, lambda address: address)
+
+
+def test_iterate_json_tokens_handles_tokens_spanning_chunks():
+    document = '{"key": "' + "a\\\"b" * 50 + '", "n": 12345.5e-3}'
+    tokens = list(iterate_json_tokens(io.StringIO(document), chunk_size=3))
+    assert "".join(whitespace + raw_token for _, whitespace, raw_token in tokens) == document
+    assert [token_type for token_type, _, _ in tokens] == [
+        PUNCTUATION, STRING, PUNCTUATION, STRING, PUNCTUATION, STRING, PUNCTUATION, LITERAL, PUNCTUATION]
+
+
+def test_rewrite_pbif_addresses_resumes_from_checkpoints():
+    checkpoints = []
+    destination = io.StringIO()
+    rewrite_pbif_addresses(io.StringIO(fake_pbif), destination, str.upper, address_checkpoints=checkpoints)
+    rewritten_document = destination.getvalue()
+    assert [checkpoint.container_stack for checkpoint in checkpoints] == ["{{{", "{{{", "{{[{"]
+    for checkpoint in checkpoints:
+        assert fake_pbif[:checkpoint.input_end].endswith(checkpoint.input_token)
+        assert rewritten_document[:checkpoint.output_end].endswith(checkpoint.output_token)
+    # Picking the walk back up after the first address reproduces the rest of the rewritten document exactly
+    resumed_destination = io.StringIO()
+    rewrite_pbif_addresses(io.StringIO(fake_pbif[checkpoints[0].input_end:]), resumed_destination, str.upper,
+                           resume_container_stack=checkpoints[0].container_stack)
+    assert resumed_destination.getvalue() == rewritten_document[checkpoints[0].output_end:]
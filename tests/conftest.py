@@ -0,0 +1,7 @@
+import pytest
+
+
+@pytest.fixture(autouse=True)
+def isolated_bsander_cache(tmp_path, monkeypatch):
+    # Keep the registry / container file caches of test runs out of the user's real cache directory
+    monkeypatch.setenv("BSANDER_CACHE_DIR", str(tmp_path / "bsander_cache"))
@@ -1,7 +1,12 @@
+import json
+import os
 import tempfile
 
-from bsander.bsandr_utils.input_types import ContainerizationTypes, ContainerizationEngine
+import pytest
+
+from bsander.bsandr_utils.input_types import ContainerizationTypes, ContainerizationEngine, DockerfileTemplateMode
 from bsander.pbic3g.containerization.container_constructor import *
+from bsander.pbic3g.containerization.container_file import get_dockerfile_template
 
 
 def test_generate_necessary_values() -> None:
@@ -33,6 +38,66 @@ def test_determine_dependencies():
     results = determine_dependencies(mock_list)
     assert results == correct_answer
 
+def test_determine_dependencies_rewrites_every_repeated_address():
+    mock_list = """
+`pypi:numpy[>=2.0.0]@numpy.random.rand`
+`pypi:numpy[>=2.0.0]@numpy.linalg.norm`
+`pypi:numpy[>=2.0.0]@numpy.random.rand`
+    """.strip()
+    correct_answer = (['numpy>=2.0.0'], [], """
+`local:numpy.random.rand`
+`local:numpy.linalg.norm`
+`local:numpy.random.rand`
+""".strip())
+    results = determine_dependencies(mock_list)
+    assert results == correct_answer
+
+def test_localize_document_dependencies_only_rewrites_addresses():
+    fake_input_file = json.dumps({
+        "actin": {"_type": "process", "address": "pypi:numpy[>=2.0.0]@numpy.random.rand",
+                  "config": {"note": "could also use conda:readdy@readdy.ReactionDiffusionSystem"}},
+        "scan": {"_type": "step", "address": "pypi:process-bigraph[<1.0]@process_bigraph.processes.ParameterScan"},
+    }, indent=1)
+    with tempfile.TemporaryDirectory() as tmpdir:
+        source_path = os.path.join(tmpdir, "input.pbif")
+        destination_path = os.path.join(tmpdir, "output.pbif")
+        with open(source_path, "w") as source_file:
+            source_file.write(fake_input_file)
+        results = localize_document_dependencies(source_path, destination_path)
+        with open(destination_path, "r") as destination_file:
+            rewritten_document = json.load(destination_file)
+    assert results == (['numpy>=2.0.0', 'process-bigraph<1.0'], [])
+    assert rewritten_document["actin"]["address"] == "local:numpy.random.rand"
+    assert rewritten_document["actin"]["config"]["note"] == "could also use conda:readdy@readdy.ReactionDiffusionSystem"
+    assert rewritten_document["scan"]["address"] == "local:process_bigraph.processes.ParameterScan"
+
+def test_localize_document_dependencies_scans_non_object_documents_as_text():
+    with tempfile.TemporaryDirectory() as tmpdir:
+        source_path = os.path.join(tmpdir, "input.pbif")
+        with open(source_path, "w") as source_file:
+            source_file.write('"pypi:numpy[>=2.0.0]@numpy.random.rand"')
+        results = localize_document_dependencies(source_path, source_path)
+        with open(source_path, "r") as source_file:
+            assert source_file.read() == '"local:numpy.random.rand"'
+    assert results == (['numpy>=2.0.0'], [])
+
+def test_localize_document_dependencies_keeps_a_non_object_document_if_writing_fails(monkeypatch):
+    with tempfile.TemporaryDirectory() as tmpdir:
+        source_path = os.path.join(tmpdir, "input.pbif")
+        with open(source_path, "w") as source_file:
+            source_file.write('"pypi:numpy[>=2.0.0]@numpy.random.rand"')
+
+        def fail_replace(source: str, destination: str):
+            raise OSError("disk full")
+
+        monkeypatch.setattr(os, "replace", fail_replace)
+        with pytest.raises(OSError):
+            localize_document_dependencies(source_path, source_path)
+        with open(source_path, "r") as source_file:
+            assert source_file.read() == '"pypi:numpy[>=2.0.0]@numpy.random.rand"'
+        assert os.listdir(tmpdir) == ["input.pbif"]  # no temporary file left behind
+
+
 def test_convert_dependencies_to_installation_string_representation():
     dependencies = [
         'numpy>=2.0.0',
@@ -154,3 +219,74 @@ ENTRYPOINT ["python3", "/runtime/main.py"]
 """.strip()
     _build_dockerfile_for_necessary_env_exec(correct_answer, fake_input_file)
 
+
+
+def test_fill_dockerfile_template_optimized() -> None:
+    correct_answer = \
+"""
+# syntax=docker/dockerfile:1
+FROM ghcr.io/astral-sh/uv:python3.12-bookworm
+
+ENV UV_LINK_MODE=copy UV_COMPILE_BYTECODE=1 MAMBA_ROOT_PREFIX=/opt/micromamba
+
+RUN --mount=type=cache,target=/var/cache/apt,sharing=locked \\
+    --mount=type=cache,target=/var/lib/apt,sharing=locked \\
+    rm -f /etc/apt/apt.conf.d/docker-clean \\
+    && apt-get update \\
+    && apt-get upgrade -y \\
+    && apt-get install -y --no-install-recommends git ca-certificates
+
+## Dependency Installs
+### Conda
+COPY --from=mambaorg/micromamba:latest /bin/micromamba /usr/local/bin/micromamba
+RUN --mount=type=cache,target=/opt/micromamba/pkgs \\
+    micromamba create -y -p /opt/conda -c conda-forge 'readdy' python=3.12
+ENV PATH=/opt/conda/bin:$PATH
+
+### PyPI
+RUN --mount=type=cache,target=/root/.cache/uv \\
+    uv pip install --system 'numpy>=2.0.0' 'process-bigraph<1.0'
+
+##
+WORKDIR /runtime
+RUN git clone https://github.com/biosimulators/bsew.git /runtime
+RUN --mount=type=cache,target=/root/.cache/uv \\
+    uv pip install --system -e /runtime
+
+ENTRYPOINT ["python3", "/runtime/main.py"]
+""".strip()
+    results = fill_dockerfile_template(get_dockerfile_template(DockerfileTemplateMode.OPTIMIZED),
+                                       ['process-bigraph<1.0', 'numpy>=2.0.0'], ['readdy'],
+                                       DockerfileTemplateMode.OPTIMIZED)
+    assert results == correct_answer
+
+
+def test_fill_dockerfile_template_installs_from_lockfiles() -> None:
+    results = fill_dockerfile_template(get_dockerfile_template(), ['numpy>=2.0.0'], ['readdy'],
+                                       lockfile_names={"requirements.lock"})
+    assert "COPY requirements.lock /tmp/bsander/requirements.lock\n" \
+           "RUN python3 -m pip install --require-hashes --no-deps -r /tmp/bsander/requirements.lock" in results
+    assert "micromamba create -y -p /opt/conda -c conda-forge readdy python=3.12" in results  # conda wasn't locked
+
+
+def test_localize_many_document_texts_merges_into_one_environment() -> None:
+    pb_documents = {
+        "first.pbif": json.dumps({"a": {"address": "pypi:numpy[>=2.0]@numpy.random.rand"}}),
+        "second.pbif": json.dumps({"b": {"address": "pypi:numpy[<3]@numpy.linalg.solve"},
+                                   "c": {"address": "conda:readdy@readdy.Simulation"}}),
+        "third.pbif": json.dumps({"d": {"address": "local:numpy.random.rand"}}),
+    }
+    pypi_deps, conda_deps, localized = localize_many_document_texts(pb_documents)
+    assert (pypi_deps, conda_deps) == (["numpy<3,>=2.0"], ["readdy"])
+    assert "local:numpy.linalg.solve" in localized["second.pbif"]
+    assert localized["third.pbif"] == pb_documents["third.pbif"]
+
+
+def test_localize_many_document_files_names_conflicting_documents(tmp_path) -> None:
+    document_paths = []
+    for name, constraint in [("new.pbif", ">=2.0"), ("old.pbif", "<1.26")]:
+        document_path = tmp_path / name
+        document_path.write_text(json.dumps({"sim": {"address": f"pypi:numpy[{constraint}]@numpy.random.rand"}}))
+        document_paths.append(str(document_path))
+    with pytest.raises(ValueError, match=r"`>=2.0` \(from new.pbif\), `<1.26` \(from old.pbif\)"):
+        localize_many_document_files(document_paths)
@@ -0,0 +1,29 @@
+import sys
+
+from bsander.bsandr_utils.input_types import ContainerizationEngine, DockerfileTemplateMode
+from bsander.pbic3g.containerization.container_environment import *
+
+
+def test_render_apptainer_definition():
+    environment = ContainerEnvironment(['numpy>=2.0.0'], ['readdy'])
+    definition = render_apptainer_definition(environment)
+    assert definition.startswith("Bootstrap: docker\nFrom: ghcr.io/astral-sh/uv:python3.12-bookworm\n\n%post\n")
+    assert "python3 -m pip install 'numpy>=2.0.0'\n" in definition
+    assert "micromamba create -y -p /opt/conda -c conda-forge readdy python=3.12\n" in definition
+    assert "%files" not in definition and "$${#" not in definition
+
+
+def test_render_apptainer_definition_copies_lockfiles_in():
+    environment = ContainerEnvironment(['numpy'], [], lockfile_names={"requirements.lock"})
+    definition = render_apptainer_definition(environment)
+    assert "%files\nrequirements.lock /tmp/bsander/requirements.lock\n\n%post" in definition
+    assert "pip install --require-hashes --no-deps -r /tmp/bsander/requirements.lock" in definition
+
+
+def test_render_container_files_renders_every_engine_natively():
+    environment = ContainerEnvironment(['numpy'], [], DockerfileTemplateMode.OPTIMIZED)
+    container_files = render_container_files(environment, ContainerizationEngine.BOTH)
+    assert list(container_files) == get_engine_container_file_names(ContainerizationEngine.BOTH)
+    assert "--mount=type=cache" in container_files["Dockerfile"]  # the Dockerfile keeps its BuildKit features
+    assert container_files["singularity.def"] == render_apptainer_definition(environment)
+    assert "spython" not in sys.modules
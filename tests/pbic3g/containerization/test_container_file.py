@@ -0,0 +1,24 @@
+import re
+
+from bsander.bsandr_utils.input_types import DockerfileTemplateMode
+from bsander.pbic3g.containerization.container_file import *
+
+
+def test_templates_share_substitution_keys():
+    for template_mode in DockerfileTemplateMode:
+        template_keys = set(re.findall(r"\$\${#(\w+)}", get_dockerfile_template(template_mode)))
+        assert template_keys == set(pull_substitution_keys_from_document())
+
+
+def test_optimized_template_merges_layers_and_uses_cache_mounts():
+    optimized_template = get_optimized_dockerfile_template()
+    assert optimized_template.startswith("# syntax=docker/dockerfile:1")
+    assert len(re.findall(r"^RUN apt", optimized_template, flags=re.MULTILINE)) == 0
+    assert optimized_template.count("--mount=type=cache") == 3
+    # The volatile runtime checkout comes after every dependency install
+    assert optimized_template.index("git clone") > optimized_template.index("$${#PYPI_DEPENDENCIES}") \
+        > optimized_template.index("$${#CONDA_FORGE_DEPENDENCIES}")
+    for template_mode in DockerfileTemplateMode:
+        assert "$${#DEPENDENCIES}" in get_pypi_section_template(template_mode)
+        assert "$${#DEPENDENCIES}" in get_conda_section_template(template_mode)
+    assert "curl" not in get_conda_section_template(DockerfileTemplateMode.OPTIMIZED)
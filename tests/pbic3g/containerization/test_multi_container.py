@@ -0,0 +1,67 @@
+import json
+
+import pytest
+
+import bsander.pbic3g.dependency_resolution.whitelist as whitelist_module
+from bsander.bsandr_utils.input_types import ContainerizationEngine, DockerfileTemplateMode
+from bsander.pbic3g.containerization.container_constructor import collect_process_requirements
+from bsander.pbic3g.containerization.multi_container import *
+
+_document = json.dumps({"state": {
+    "simulate": {"address": "pypi:numpy[>=2.0]@numpy.random.rand"},
+    "analyze": {"address": "pypi:numpy[<3]@numpy.linalg.solve"},
+    "legacy": {"address": "pypi:NumPy[<1.26]@numpy.polynomial.Polynomial"},
+    "diffuse": {"address": "conda:readdy@readdy.Simulation"},
+    "emit": {"address": "local:ram-emitter"},
+}})
+
+
+def test_collect_process_requirements_is_keyed_by_process_path():
+    process_requirements = collect_process_requirements(_document, document_name="experiment.pbif")
+    assert list(process_requirements) == ["experiment.pbif:state.simulate", "experiment.pbif:state.analyze",
+                                          "experiment.pbif:state.legacy", "experiment.pbif:state.diffuse"]
+
+
+def test_cluster_processes_splits_conflicts_and_unrelated_packages():
+    clusters = cluster_processes(collect_process_requirements(_document))
+    assert [(cluster.name, cluster.process_paths, cluster.pypi_deps, cluster.conda_deps) for cluster in clusters] == [
+        ("cluster-1", ["state.simulate", "state.analyze"], ["numpy<3,>=2.0"], []),
+        ("cluster-2", ["state.legacy"], ["NumPy<1.26"], []),
+        ("cluster-3", ["state.diffuse"], [], ["readdy"]),
+    ]
+
+
+def test_cluster_processes_respects_the_whitelist():
+    with pytest.raises(ValueError):
+        cluster_document_processes({"experiment.pbif": _document}, ["pypi:numpy"])
+
+
+def test_cluster_document_processes_compiles_the_whitelist_once(monkeypatch):
+    compiled_whitelists = []
+    real_compile_whitelist = whitelist_module.compile_whitelist
+
+    def counting_compile_whitelist(whitelist_entries):
+        compiled_whitelists.append(whitelist_entries)
+        return real_compile_whitelist(whitelist_entries)
+
+    monkeypatch.setattr(whitelist_module, "compile_whitelist", counting_compile_whitelist)
+    clusters = cluster_document_processes({"first.pbif": _document, "second.pbif": _document},
+                                          ["pypi:numpy", "pypi:NumPy", "conda:readdy"])
+    assert len(clusters) == 3
+    assert len(compiled_whitelists) == 1  # not once per document, process or address
+
+
+def test_render_multi_container_files():
+    clusters = cluster_processes(collect_process_requirements(_document))
+    container_files = render_multi_container_files(clusters, DockerfileTemplateMode.OPTIMIZED,
+                                                   ContainerizationEngine.DOCKER,
+                                                   {"cluster-2": {"requirements.lock": "numpy==1.25.2\n"}})
+    assert sorted(container_files) == ["base/Dockerfile", "cluster-1/Dockerfile", "cluster-2/Dockerfile",
+                                       "cluster-2/requirements.lock", "cluster-3/Dockerfile", COMPOSE_FILE_NAME]
+    assert "FROM base\n" in container_files["cluster-1/Dockerfile"]
+    assert "'numpy<3,>=2.0'" in container_files["cluster-1/Dockerfile"]
+    assert "--require-hashes" in container_files["cluster-2/Dockerfile"]
+    compose_file = container_files[COMPOSE_FILE_NAME]
+    assert compose_file.count('base: "service:base"') == 3
+    assert f'{PROCESSES_ENVIRONMENT_VARIABLE}: "state.simulate,state.analyze"' in compose_file
+
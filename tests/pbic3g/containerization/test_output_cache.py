@@ -0,0 +1,31 @@
+import os
+import tempfile
+
+from bsander.bsandr_utils.input_types import ContainerizationEngine
+from bsander.pbic3g.containerization.container_file import get_generic_dockerfile_template
+from bsander.pbic3g.containerization.output_cache import *
+
+
+def test_compute_environment_hash_ignores_dependency_order():
+    template = get_generic_dockerfile_template()
+    first_hash = compute_environment_hash(template, ['numpy>=2.0.0', 'process-bigraph<1.0'], ['readdy'],
+                                          ContainerizationEngine.DOCKER)
+    reordered_hash = compute_environment_hash(template, ['process-bigraph<1.0', 'numpy>=2.0.0'], ['readdy'],
+                                              ContainerizationEngine.DOCKER)
+    assert first_hash == reordered_hash
+    assert first_hash != compute_environment_hash(template, ['numpy>=2.0.0', 'process-bigraph<1.0'], ['readdy'],
+                                                  ContainerizationEngine.BOTH)
+    assert first_hash != compute_environment_hash(template, ['numpy>=2.0.0'], ['readdy'],
+                                                  ContainerizationEngine.DOCKER)
+    assert get_environment_image_tag(first_hash) == f"bsander-env:{first_hash[:16]}"
+
+
+def test_container_files_round_trip():
+    container_files = {DOCKERFILE_NAME: "FROM scratch", APPTAINER_DEFINITION_NAME: "Bootstrap: docker"}
+    with tempfile.TemporaryDirectory() as tmpdir:
+        assert load_cached_container_files("abc123", tmpdir) is None
+        store_container_files("abc123", container_files, tmpdir)
+        assert load_cached_container_files("abc123", tmpdir) == container_files
+        store_container_files("abc123", {DOCKERFILE_NAME: "FROM busybox"}, tmpdir)
+        assert load_cached_container_files("abc123", tmpdir) == {DOCKERFILE_NAME: "FROM busybox"}
+        assert os.listdir(tmpdir) == ["abc123"]
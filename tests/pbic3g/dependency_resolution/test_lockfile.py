@@ -0,0 +1,155 @@
+import hashlib
+import io
+import json
+import tarfile
+import zipfile
+
+import pytest
+
+from bsander.pbic3g.dependency_resolution.lockfile import *
+
+
+def _write_wheel(index_dir, name, version, requires_dist=(), tag="py3-none-any"):
+    metadata = f"Metadata-Version: 2.1\nName: {name}\nVersion: {version}\n"
+    metadata += "".join(f"Requires-Dist: {requirement}\n" for requirement in requires_dist)
+    wheel_path = index_dir / f"{name.replace('-', '_')}-{version}-{tag}.whl"
+    with zipfile.ZipFile(wheel_path, "w") as wheel:
+        wheel.writestr(f"{name.replace('-', '_')}-{version}.dist-info/METADATA", metadata)
+    return wheel_path
+
+
+def _write_sdist(index_dir, name, version, requires_dist=()):
+    metadata = f"Metadata-Version: 2.2\nName: {name}\nVersion: {version}\n"
+    metadata += "".join(f"Requires-Dist: {requirement}\n" for requirement in requires_dist)
+    sdist_path = index_dir / f"{name}-{version}.tar.gz"
+    with tarfile.open(sdist_path, "w:gz") as sdist:
+        contents = metadata.encode("utf-8")
+        member = tarfile.TarInfo(f"{name}-{version}/PKG-INFO")
+        member.size = len(contents)
+        sdist.addfile(member, io.BytesIO(contents))
+    return sdist_path
+
+
+@pytest.fixture
+def pypi_index(tmp_path):
+    index_dir = tmp_path / "wheels"
+    index_dir.mkdir()
+    _write_wheel(index_dir, "copasi-basico", "0.84", ["numpy>=1.20", "pandas; extra == 'tables'"])
+    _write_wheel(index_dir, "copasi-basico", "0.90", ["numpy>=2"])
+    _write_wheel(index_dir, "numpy", "1.26.4", tag="cp312-cp312-manylinux_2_17_x86_64")
+    _write_wheel(index_dir, "numpy", "2.1.0", tag="cp312-cp312-manylinux_2_17_x86_64")
+    _write_wheel(index_dir, "numpy", "2.2.0", tag="cp312-cp312-win_amd64")  # never installable in the container
+    _write_wheel(index_dir, "numpy", "3.0.0rc1", tag="cp312-cp312-manylinux_2_17_x86_64")
+    _write_sdist(index_dir, "pandas", "2.2.0", ["numpy<2", "pywin32; sys_platform == 'win32'"])
+    return index_dir
+
+
+def test_resolve_pypi_lock_pins_transitive_dependencies(pypi_index):
+    locked = {package.name: package for package in resolve_pypi_lock(["copasi-basico"], str(pypi_index))}
+    assert {name: package.version for name, package in locked.items()} == {"copasi-basico": "0.90", "numpy": "2.1.0"}
+    assert locked["numpy"].file_name.endswith("manylinux_2_17_x86_64.whl")
+    assert [len(sha256) for sha256 in locked["numpy"].sha256_hashes] == [64]
+
+
+def test_resolve_pypi_lock_hashes_every_artifact_of_the_pinned_version(tmp_path):
+    # pip may pick any of these in the build (depending on its platform and python), so each must pass `--require-hashes`
+    index_dir = tmp_path / "wheels"
+    index_dir.mkdir()
+    artifact_paths = [_write_wheel(index_dir, "numpy", "2.1.0", tag="cp312-cp312-manylinux_2_17_x86_64"),
+                      _write_wheel(index_dir, "numpy", "2.1.0", tag="cp312-cp312-manylinux_2_17_aarch64"),
+                      _write_sdist(index_dir, "numpy", "2.1.0")]
+    with zipfile.ZipFile(artifact_paths[1], "a") as aarch64_wheel:  # real wheels for different platforms differ
+        aarch64_wheel.writestr("numpy/_core.so", b"aarch64")
+    _write_wheel(index_dir, "numpy", "2.0.0")
+    locked_numpy, = resolve_pypi_lock(["numpy"], str(index_dir))
+    assert locked_numpy.file_name.endswith("manylinux_2_17_x86_64.whl")
+    assert set(locked_numpy.sha256_hashes) == {hashlib.sha256(artifact_path.read_bytes()).hexdigest()
+                                               for artifact_path in artifact_paths}
+    rendered = render_pypi_lockfile([locked_numpy])
+    assert rendered.count("--hash=sha256:") == 3
+
+
+def test_resolve_pypi_lock_backtracks_on_conflicting_constraints(pypi_index):
+    # pandas (only reachable through the extra) caps numpy below 2, which rules out the newest copasi-basico
+    locked = resolve_pypi_lock(["copasi-basico[tables]<1", "pandas"], str(pypi_index))
+    assert {package.name: package.version for package in locked} == {
+        "copasi-basico": "0.84", "numpy": "1.26.4", "pandas": "2.2.0"}
+
+
+def test_resolve_pypi_lock_skips_malformed_requirements(tmp_path):
+    index_dir = tmp_path / "wheels"
+    index_dir.mkdir()
+    _write_wheel(index_dir, "fake-sim", "1.0", ["numpy (>=", "numpy>=2"])
+    _write_wheel(index_dir, "numpy", "2.1.0")
+    locked = resolve_pypi_lock(["fake-sim"], str(index_dir))
+    assert {package.name: package.version for package in locked} == {"fake-sim": "1.0", "numpy": "2.1.0"}
+
+
+def test_resolve_pypi_lock_reports_unsatisfiable_requirements(pypi_index):
+    with pytest.raises(LockResolutionError, match="numpy"):
+        resolve_pypi_lock(["numpy>=4"], str(pypi_index))
+
+
+def test_render_pypi_lockfile():
+    rendered = render_pypi_lockfile([LockedPypiPackage("numpy", "2.1.0", "numpy.whl", ("ab" * 32, "cd" * 32))])
+    assert f"numpy==2.1.0 \\\n    --hash=sha256:{'ab' * 32} \\\n    --hash=sha256:{'cd' * 32}\n" in rendered
+
+
+def _record(name, version, build="0", build_number=0, depends=()):
+    return {"name": name, "version": version, "build": build, "build_number": build_number,
+            "depends": list(depends), "md5": f"md5-{name}-{version}-{build}"}
+
+
+@pytest.fixture
+def conda_channel(tmp_path):
+    channel_dir = tmp_path / "channel"
+    (channel_dir / "linux-64").mkdir(parents=True)
+    (channel_dir / "noarch").mkdir()
+    linux_packages = {
+        "python-3.11.9-0.conda": _record("python", "3.11.9"),
+        "python-3.12.4-0.conda": _record("python", "3.12.4", depends=["__glibc >=2.17", "libzlib >=1.2.13"]),
+        "python-3.13.0-0.conda": _record("python", "3.13.0"),
+        "libzlib-1.3.1-0.conda": _record("libzlib", "1.3.1"),
+        "readdy-2.0.11-py312_0.conda": _record("readdy", "2.0.11", "py312_0", depends=["python >=3.12,<3.13.0a0"]),
+        "readdy-2.0.12-py312_1.conda": _record("readdy", "2.0.12", "py312_1", 1, depends=["python >=3.12,<3.13.0a0"]),
+        "readdy-2.0.12-py313_0.conda": _record("readdy", "2.0.12", "py313_0", depends=["python >=3.13,<3.14.0a0"]),
+    }
+    (channel_dir / "linux-64" / "repodata.json").write_text(json.dumps({"packages.conda": linux_packages}))
+    noarch_packages = {"tqdm-4.66.4-pyhd8ed1ab_0.tar.bz2": _record("tqdm", "4.66.4", "pyhd8ed1ab_0",
+                                                                   depends=["python >=3.7"])}
+    (channel_dir / "noarch" / "repodata.json").write_text(json.dumps({"packages": noarch_packages}))
+    return channel_dir
+
+
+def test_resolve_conda_lock(conda_channel):
+    locked = {package.name: package for package in resolve_conda_lock(["readdy>=2", "tqdm"], str(conda_channel))}
+    assert {name: (package.version, package.build) for name, package in locked.items()} == {
+        "python": ("3.12.4", "0"), "libzlib": ("1.3.1", "0"), "readdy": ("2.0.12", "py312_1"),
+        "tqdm": ("4.66.4", "pyhd8ed1ab_0")}
+    assert locked["tqdm"].subdir == "noarch"
+
+
+def test_render_conda_lockfile(conda_channel):
+    rendered = render_conda_lockfile(resolve_conda_lock(["readdy"], str(conda_channel)), "https://example.org/forge/")
+    assert "@EXPLICIT\n" in rendered
+    assert "https://example.org/forge/linux-64/readdy-2.0.12-py312_1.conda#md5-readdy-2.0.12-py312_1\n" in rendered
+
+
+@pytest.mark.parametrize("version, version_spec, expected", [
+    ("3.12.4", "3.12.*", True),
+    ("3.13.0", "3.12.*", False),
+    ("3.12.4", ">=3.12,<3.13.0a0", True),
+    ("3.13.0", ">=3.12,<3.13.0a0", False),
+    ("1.1.1w", ">=1.1.1a", True),
+    ("2.0", "2.0.0", True),
+    ("1.5", "<1.4|>=1.5", True),
+    ("1.21.6", "=1.21", True),
+])
+def test_conda_version_matches(version, version_spec, expected):
+    assert conda_version_matches(version, version_spec) == expected
+
+
+def test_generate_lockfiles_only_locks_sources_with_an_index(pypi_index):
+    lockfiles = generate_lockfiles(["numpy<2"], ["readdy"], pypi_index_dir=str(pypi_index))
+    assert list(lockfiles) == [PYPI_LOCKFILE_NAME]
+    assert "numpy==1.26.4" in lockfiles[PYPI_LOCKFILE_NAME]
@@ -1,10 +1,14 @@
 import os
 import tempfile
 import zipfile
+from collections import OrderedDict
+
 import pytest
 
 from bsander.bsandr_utils.input_types import ContainerizationTypes, ContainerizationEngine, ProgramArguments
 from bsander.execution import execute_bsander as run_bsander
+from bsander.pbic3g.containerization.container_constructor import determine_dependencies
+from bsander.pbic3g.dependency_resolution.whitelist import *
 
 fake_input_file = \
 """
@@ -44,6 +48,114 @@ pypi:process-bigraph
 """.strip()
     _perform_execution_with_whitelist(fake_input_file, valid_whitelist)
 
+def test_parse_whitelist_entry():
+    assert parse_whitelist_entry("pypi:numpy") == WhitelistEntry("pypi", "numpy")
+    assert parse_whitelist_entry("pypi:numpy[>=1.20,<3]") == WhitelistEntry("pypi", "numpy", ">=1.20,<3")
+    for invalid_entry in ["numpy", "pypi:numpy[>=1.20", "pypi:numpy[not a version]"]:
+        with pytest.raises(ValueError):
+            parse_whitelist_entry(invalid_entry)
+
+def test_whitelist_index_lookup_precedence():
+    whitelist_index = compile_whitelist([
+        "pypi:Copasi_Basico[>=0.80]",
+        "pypi:git+https://github.com/biosimulators/*",
+        "pypi:git+https://github.com/biosimulators/bsew*[<2]",
+        "pypi:process-*-tools",
+        "pypi:sim?-engine[>=1]",
+        "conda:readdy",
+    ], use_disk_cache=False)
+    assert whitelist_index.lookup("pypi", "copasi-basico") == (True, [">=0.80"])
+    assert whitelist_index.lookup("pypi", "git+https://github.com/biosimulators/bsew.git") == (True, ["<2"])
+    assert whitelist_index.lookup("pypi", "git+https://github.com/biosimulators/bsander") == (True, None)
+    assert whitelist_index.lookup("pypi", "git+https://github.com/elsewhere/bsander") == (False, None)
+    assert whitelist_index.lookup("pypi", "process-tools") == (False, None)
+    assert whitelist_index.lookup("pypi", "process-viz-tools") == (True, None)
+    assert whitelist_index.lookup("pypi", "sim1-engine") == (True, [">=1"])
+    assert whitelist_index.lookup("conda", "ReaDDy") == (True, None)
+    assert not whitelist_index.has_source("secret_protocol")
+
+def test_compile_whitelist_reuses_the_disk_cache(tmp_path, monkeypatch):
+    whitelist_entries = [f"pypi:package-{number}" for number in range(1000)] + ["pypi:org-*"]
+    compile_whitelist(whitelist_entries, cache_dir=str(tmp_path))
+    assert len(list(tmp_path.glob("*.json"))) == 1
+    import bsander.pbic3g.dependency_resolution.whitelist as whitelist_module
+    monkeypatch.setattr(whitelist_module, "_compiled_whitelists", OrderedDict())
+    monkeypatch.setattr(whitelist_module, "_compile_whitelist_sources", lambda entries: pytest.fail("recompiled"))
+    whitelist_index = compile_whitelist(whitelist_entries, cache_dir=str(tmp_path))
+    assert whitelist_index.lookup("pypi", "package_999") == (True, None)
+    assert whitelist_index.lookup("pypi", "org-tools") == (True, None)
+
+def test_whitelist_globs_with_interior_stars():
+    # On Python 3.10, `fnmatch.translate` emits its own `g<N>` groups for these, which must not clash with ours
+    whitelist_index = compile_whitelist(["pypi:x*y*z[<2]", "pypi:a*b*c"], use_disk_cache=False)
+    assert whitelist_index.lookup("pypi", "x-long-y-long-z") == (True, ["<2"])
+    assert whitelist_index.lookup("pypi", "a-b-c") == (True, None)
+    assert whitelist_index.lookup("pypi", "x-y") == (False, None)
+
+def test_compiled_whitelists_are_bounded(monkeypatch):
+    import bsander.pbic3g.dependency_resolution.whitelist as whitelist_module
+    monkeypatch.setattr(whitelist_module, "_compiled_whitelists", OrderedDict())
+    monkeypatch.setattr(whitelist_module, "_max_compiled_whitelists", 2)
+    first_index = compile_whitelist(["pypi:first"], use_disk_cache=False)
+    compile_whitelist(["pypi:second"], use_disk_cache=False)
+    assert compile_whitelist(["pypi:first"], use_disk_cache=False) is first_index  # now the most recently used
+    third_index = compile_whitelist(["pypi:third"], use_disk_cache=False)
+    assert list(whitelist_module._compiled_whitelists.values()) == [first_index, third_index]
+
+def test_merge_dependency_constraints_intersects_per_package():
+    requested = [("numpy", ">=2.0"), ("process-bigraph", ""), ("NumPy", "<3"), ("numpy", ">=2.0")]
+    assert merge_dependency_constraints("pypi", requested) == ["numpy<3,>=2.0", "process-bigraph"]
+
+def test_merge_dependency_constraints_reports_every_conflict():
+    requested = [("numpy", ">=2.0"), ("numpy", "<1.26"), ("scipy", "==1.11.*"), ("scipy", "~=1.12.0")]
+    with pytest.raises(DependencyConflictError) as conflict:
+        merge_dependency_constraints("pypi", requested)
+    assert len(conflict.value.conflicts) == 2
+
+def test_merge_dependency_constraints_applies_whitelist_allowances():
+    assert merge_dependency_constraints("pypi", [("numpy", "")], {"numpy": [">=1.20,<2"]}) == ["numpy>=1.20,<2"]
+    with pytest.raises(DependencyConflictError, match="whitelist"):
+        merge_dependency_constraints("pypi", [("numpy", ">=2.0")], {"numpy": ["<2"]})
+
+def test_repeated_whitelist_entries_allow_any_of_their_ranges():
+    whitelist_index = compile_whitelist(["pypi:numpy[>=1.20,<2]", "pypi:numpy[>=2.1]"], use_disk_cache=False)
+    is_allowed, allowed_ranges = whitelist_index.lookup("pypi", "numpy")
+    assert is_allowed and allowed_ranges == [">=1.20,<2", ">=2.1"]
+    assert merge_dependency_constraints("pypi", [("numpy", "<1.26")], {"numpy": allowed_ranges}) \
+           == ["numpy<1.26,<2,>=1.20"]
+    assert merge_dependency_constraints("pypi", [("numpy", ">=2")], {"numpy": allowed_ranges}) == ["numpy>=2,>=2.1"]
+    assert merge_dependency_constraints("pypi", [("numpy", "")], {"numpy": allowed_ranges}) == ["numpy>=2.1"]
+    with pytest.raises(DependencyConflictError, match="whitelist"):
+        merge_dependency_constraints("pypi", [("numpy", "==2.0.5")], {"numpy": allowed_ranges})
+
+def test_whitelist_allowances_apply_to_every_spelling_of_a_package():
+    requested = [("Process_Bigraph", ""), ("process-bigraph", ">=0.0.30")]
+    assert merge_dependency_constraints("pypi", requested, {"process-bigraph": ["<1.0"]}) \
+           == ["Process_Bigraph<1.0,>=0.0.30"]
+    document = "\"pypi:Process_Bigraph@process_bigraph.Composite\""
+    assert determine_dependencies(document, ["pypi:process-bigraph[<1.0]"])[0] == ["Process_Bigraph<1.0"]
+
+@pytest.mark.parametrize("specifier, expected", [
+    (">=2.0,<1.26", False),
+    (">=2.0.1,<2.0.2", True),
+    (">=2.0,<=2.0", True),
+    (">=2.0,<2.0", False),
+    (">=2.0,<=2.0,!=2.0", False),
+    ("==1.5,>=2", False),
+    ("==1.*,>=1.9", True),
+    ("~=1.4,>=2", False),
+])
+def test_is_specifier_set_satisfiable(specifier, expected):
+    assert is_specifier_set_satisfiable(SpecifierSet(specifier)) == expected
+
+def test_conflicting_document_is_rejected_before_containerization():
+    conflicting_document = """
+"pypi:numpy[>=2.0]@numpy.random.rand"
+"pypi:numpy[<1.26]@numpy.linalg.solve"
+""".strip()
+    with pytest.raises(DependencyConflictError):
+        determine_dependencies(conflicting_document, ["pypi:numpy"])
+
 def _perform_execution_with_whitelist(input_pbif_as_string: str, whitelist_str: str):
     correct_answer = \
 """
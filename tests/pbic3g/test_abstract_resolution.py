@@ -0,0 +1,124 @@
+import json
+import os
+import tempfile
+
+import pytest
+
+from bsander.bsandr_utils.pbif_stream import PbifFormatError
+from bsander.pbic3g.abstract_resolution import *
+from bsander.pbic3g.registry_cache import RegistryEntry
+
+_local_registry = {
+    "growth-sim": [
+        RegistryEntry("growth_sim.processes", "Growth", "Process", ("process_bigraph.Process",),
+                      ("mass",), ("mass",), ("rate",)),
+        RegistryEntry("growth_sim.processes", "DetailedGrowth", "Process",
+                      ("growth_sim.processes.Growth", "process_bigraph.Process"),
+                      ("mass",), ("mass", "volume"), ("rate", "temperature")),
+        RegistryEntry("growth_sim.steps", "Summary", "Step", ("process_bigraph.Step",),
+                      ("mass",), ("report",), ()),
+    ],
+    "opaque-sim": [
+        RegistryEntry("opaque_sim", "Dynamic", "Process", ("process_bigraph.Process",)),
+    ],
+}
+
+
+def _make_document(nodes: dict) -> str:
+    return json.dumps({"state": nodes}, indent=4)
+
+
+def test_find_best_implementation_prefers_fewest_unused_ports():
+    index = ImplementationIndex(_local_registry)
+    requirement = AbstractRequirement("Process", frozenset({"mass"}), frozenset({"mass"}), frozenset({"rate"}))
+    distribution_name, entry = index.find_best_implementation(requirement)
+    assert (distribution_name, entry.address) == ("growth-sim", "growth_sim.processes.Growth")
+
+
+def test_find_best_implementation_filters_on_config_and_kind():
+    index = ImplementationIndex(_local_registry)
+    needs_temperature = AbstractRequirement("growth_sim.processes.Growth", frozenset(), frozenset({"volume"}),
+                                            frozenset({"temperature"}))
+    assert index.find_best_implementation(needs_temperature)[1].class_name == "DetailedGrowth"
+    steps_only = AbstractRequirement(None, frozenset({"mass"}), frozenset(), frozenset(), frozenset({"Step"}))
+    assert index.find_best_implementation(steps_only)[1].class_name == "Summary"
+    unknown_config = AbstractRequirement("Growth", frozenset(), frozenset(), frozenset({"viscosity"}))
+    assert index.find_best_implementation(unknown_config) is None
+
+
+def test_find_best_implementation_falls_back_to_undeclared_interfaces():
+    index = ImplementationIndex(_local_registry)
+    requirement = AbstractRequirement("Process", frozenset({"concentration"}), frozenset(), frozenset())
+    assert index.find_best_implementation(requirement)[1].address == "opaque_sim.Dynamic"
+
+
+def test_resolve_abstract_text_only_rewrites_abstract_addresses():
+    document = _make_document({
+        "grow": {"_type": "process", "address": "abstract:Process", "config": {"rate": 0.1},
+                 "inputs": {"mass": ["mass_store"]}, "outputs": {"mass": ["mass_store"]}},
+        "report": {"_type": "step", "address": "abstract:", "inputs": {"mass": ["mass_store"]},
+                   "outputs": {"report": ["report_store"]}},
+        "other": {"_type": "process", "address": "local:somewhere.Else"},
+    })
+    resolved_document, resolved_count = resolve_abstract_text(document, ImplementationIndex(_local_registry))
+    assert resolved_count == 2
+    resolved_state = json.loads(resolved_document)["state"]
+    assert resolved_state["grow"]["address"] == "pypi:growth-sim@growth_sim.processes.Growth"
+    assert resolved_state["report"]["address"] == "pypi:growth-sim@growth_sim.steps.Summary"
+    assert resolved_state["other"]["address"] == "local:somewhere.Else"
+    # Formatting is left exactly as written
+    assert resolved_document == document.replace("abstract:Process", "pypi:growth-sim@growth_sim.processes.Growth") \
+        .replace('"abstract:"', '"pypi:growth-sim@growth_sim.steps.Summary"')
+
+
+def test_resolve_abstract_text_reports_every_unresolved_node():
+    document = _make_document({
+        "first": {"address": "abstract:Missing"},
+        "second": {"address": "abstract:"},
+    })
+    with pytest.raises(AbstractResolutionError) as error:
+        resolve_abstract_text(document, ImplementationIndex(_local_registry))
+    assert len(error.value.unresolved_nodes) == 2
+    assert "state.first" in error.value.unresolved_nodes[0]
+
+
+@pytest.mark.parametrize("document", [
+    '{"state": {"grow": {"address": "abstract:Process", "address": "abstract:"}}}',
+    # `json` would keep the second `grow` only, so the implementations found would land on the wrong nodes
+    '{"state": {"grow": {"address": "local:somewhere.Else"}, "report": {"_type": "step", "address": "abstract:"},'
+    ' "grow": {"_type": "process", "address": "abstract:Process"}}}',
+])
+def test_resolve_abstract_text_rejects_duplicate_keys(document):
+    with pytest.raises(PbifFormatError, match="duplicate keys"):
+        resolve_abstract_text(document, ImplementationIndex(_local_registry))
+
+
+def test_resolve_abstract_text_rejects_documents_that_are_not_objects():
+    with pytest.raises(PbifFormatError, match="must be JSON objects"):
+        resolve_abstract_text('[{"address": "abstract:Process"}]', ImplementationIndex(_local_registry))
+
+
+def test_resolve_abstract_file_leaves_concrete_documents_untouched():
+    with tempfile.TemporaryDirectory() as tmpdir:
+        pbif_path = os.path.join(tmpdir, "concrete.pbif")
+        with open(pbif_path, "w") as pbif_file:
+            pbif_file.write(_make_document({"other": {"address": "local:somewhere.Else"}}))
+        modified_time = os.path.getmtime(pbif_path)
+        assert resolve_abstract_file(pbif_path, get_implementation_index(_local_registry)) == 0
+        assert os.path.getmtime(pbif_path) == modified_time
+
+
+def test_resolve_abstract_file_writes_only_the_resolved_output():
+    with tempfile.TemporaryDirectory() as tmpdir:
+        source_path = os.path.join(tmpdir, "source.pbif")
+        output_path = os.path.join(tmpdir, "output.pbif")
+        document = _make_document({"grow": {"_type": "process", "address": "abstract:Process",
+                                            "inputs": {"mass": []}, "outputs": {"mass": []}}})
+        with open(source_path, "w") as source_file:
+            source_file.write(document)
+        assert file_contains_abstract_processes(source_path)
+        assert resolve_abstract_file(output_path, get_implementation_index(_local_registry), source_path) == 1
+        with open(source_path, "r") as source_file:
+            assert source_file.read() == document
+        assert not file_contains_abstract_processes(output_path)
+        assert sorted(os.listdir(tmpdir)) == ["output.pbif", "source.pbif"]  # no temporary file left behind
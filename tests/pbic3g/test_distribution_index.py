@@ -0,0 +1,95 @@
+import os
+import tempfile
+
+import pytest
+
+import bsander.pbic3g.distribution_index as distribution_index_module
+from bsander.pbic3g.distribution_index import *
+
+
+def _make_fake_dist_info(site_dir: str, name: str, version: str, requirements: list[str], description: str = ""):
+    dist_info_dir = os.path.join(site_dir, f"{name.replace('-', '_')}-{version}.dist-info")
+    os.makedirs(dist_info_dir, exist_ok=True)
+    with open(os.path.join(dist_info_dir, "METADATA"), "w") as metadata_file:
+        metadata_file.write(f"Metadata-Version: 2.1\nName: {name}\nVersion: {version}\n")
+        metadata_file.writelines(f"Requires-Dist: {requirement}\n" for requirement in requirements)
+        metadata_file.write(f"\n{description}")
+
+
+def test_index_reads_requirements_from_metadata_headers_only():
+    with tempfile.TemporaryDirectory() as site_dir:
+        # The description below the headers mentions a requirement, which must not count
+        _make_fake_dist_info(site_dir, "fake-sim", "1.0", ["bsail (>=0.1,<1.0)", "numpy"],
+                             "Requires-Dist: unrelated-package\n")
+        _make_fake_dist_info(site_dir, "Fake.Other_Sim", "2.3", ["BSail>=0.2; extra == 'sim'"])
+        _make_fake_dist_info(site_dir, "fake-unrelated", "0.1", ["bsailor"])
+        index = load_distribution_index(use_cache=False, search_paths=[site_dir])
+        assert index.get_distribution("fake_sim").requirements == [DistributionRequirement("bsail", "<1.0,>=0.1"),
+                                                                   DistributionRequirement("numpy", "")]
+        assert index.get_dependents("unrelated-package") == []
+        dependents = {dependent.distribution_name: dependent for dependent in index.get_dependents("bsail")}
+        assert set(dependents) == {"fake-sim", "Fake.Other_Sim"}
+        assert dependents["Fake.Other_Sim"].distribution_version == "2.3"
+        assert dependents["Fake.Other_Sim"].requirement == DistributionRequirement("bsail", ">=0.2", 'extra == "sim"')
+        # Only needed for the `sim` extra, so it's not a distribution requiring BSail here
+        assert [distribution.name for distribution in index.get_distributions_requiring("bsail")] == ["fake-sim"]
+
+
+def test_only_active_requirements_make_a_distribution_require_another():
+    with tempfile.TemporaryDirectory() as site_dir:
+        _make_fake_dist_info(site_dir, "fake-sim", "1.0", ["bsail; python_version >= '3'"])
+        _make_fake_dist_info(site_dir, "fake-windows-sim", "1.0", ["bsail; sys_platform == 'no-such-platform'"])
+        _make_fake_dist_info(site_dir, "fake-tested-sim", "1.0", ["bsail; extra == 'test'"])
+        _make_fake_dist_info(site_dir, "fake-either-sim", "1.0",
+                             ["bsail; extra == 'test' or sys_platform != 'no-such-platform'"])
+        index = load_distribution_index(use_cache=False, search_paths=[site_dir])
+        assert len(index.get_dependents("bsail")) == 4  # every dependent is still listed, with its marker
+        assert sorted(distribution.name for distribution in index.get_distributions_requiring("bsail")) \
+               == ["fake-either-sim", "fake-sim"]
+
+
+def test_index_reads_egg_info_requirements():
+    with tempfile.TemporaryDirectory() as site_dir:
+        egg_info_dir = os.path.join(site_dir, "legacy_sim.egg-info")
+        os.makedirs(egg_info_dir)
+        with open(os.path.join(egg_info_dir, "PKG-INFO"), "w") as metadata_file:
+            metadata_file.write("Metadata-Version: 1.1\nName: legacy-sim\nVersion: 0.9\n")
+        with open(os.path.join(egg_info_dir, "requires.txt"), "w") as requires_file:
+            requires_file.write("numpy\n\n[plots]\nmatplotlib\n\n[:python_version < \"3.12\"]\nbsail>=0.1\n")
+        index = load_distribution_index(use_cache=False, search_paths=[site_dir])
+        assert index.get_dependents("bsail")[0].requirement \
+               == DistributionRequirement("bsail", ">=0.1", 'python_version < "3.12"')
+        assert index.get_dependents("matplotlib")[0].requirement.marker == 'extra == "plots"'
+        assert index.get_distribution("legacy-sim").load().version == "0.9"
+
+
+def test_earlier_search_paths_shadow_later_ones():
+    with tempfile.TemporaryDirectory() as first_dir, tempfile.TemporaryDirectory() as second_dir:
+        _make_fake_dist_info(first_dir, "fake-sim", "2.0", [])
+        _make_fake_dist_info(second_dir, "fake-sim", "1.0", ["bsail"])
+        index = load_distribution_index(use_cache=False, search_paths=[first_dir, second_dir])
+        assert index.get_distribution("fake-sim").version == "2.0"
+        assert index.get_dependents("bsail") == []
+
+
+def test_index_cache_rescans_only_changed_directories(monkeypatch):
+    with tempfile.TemporaryDirectory() as site_dir, tempfile.TemporaryDirectory() as cache_dir:
+        cache_path = os.path.join(cache_dir, "distribution_index.json")
+        _make_fake_dist_info(site_dir, "fake-sim", "1.0", ["bsail"])
+        assert len(load_distribution_index(cache_path=cache_path, search_paths=[site_dir]).get_dependents("bsail")) == 1
+
+        real_scan = distribution_index_module.scan_directory_distributions
+
+        def fail_scan(directory: str):
+            pytest.fail(f"`{directory}` was rescanned although it didn't change")
+
+        monkeypatch.setattr(distribution_index_module, "scan_directory_distributions", fail_scan)
+        cached_index = load_distribution_index(cache_path=cache_path, search_paths=[site_dir])
+        assert cached_index.get_distribution("fake-sim").requirements == [DistributionRequirement("bsail", "")]
+
+        # Installing another distribution changes the directory; only then is it read again
+        monkeypatch.setattr(distribution_index_module, "scan_directory_distributions", real_scan)
+        _make_fake_dist_info(site_dir, "fake-other-sim", "1.0", ["bsail>=0.2"])
+        os.utime(site_dir, ns=(0, os.stat(site_dir).st_mtime_ns + 1))
+        updated_index = load_distribution_index(cache_path=cache_path, search_paths=[site_dir])
+        assert len(updated_index.get_dependents("bsail")) == 2
@@ -0,0 +1,78 @@
+import json
+import os
+import tempfile
+
+from bsander.pbic3g.incremental import *
+
+_processes = {
+    f"process_{index}": {"_type": "process", "address": f"pypi:package-{index % 3}@package_{index % 3}.Process",
+                         "config": {"rate": index}}
+    for index in range(12)
+}
+_document = json.dumps({"state": _processes, "emitter": {"address": "local:ram-emitter"}}, indent=2)
+
+
+def _localize(address: str) -> str:
+    return "local:" + address.rpartition("@")[2] if address.startswith("pypi:") else address
+
+
+def _build_manifest(pb_document_str: str) -> tuple[IncrementalLocalization, IncrementalManifest]:
+    localization = localize_document_fully(pb_document_str, _localize)
+    return localization, IncrementalManifest("settings", hash_text(pb_document_str),
+                                             hash_text(localization.localized_document), localization.checkpoints)
+
+
+def _assert_matches_full_run(localization: IncrementalLocalization, pb_document_str: str):
+    full_localization = localize_document_fully(pb_document_str, _localize)
+    assert localization.localized_document == full_localization.localized_document
+    assert localization.checkpoints == full_localization.checkpoints
+
+
+def test_unchanged_document_walks_nothing():
+    previous, manifest = _build_manifest(_document)
+    localization = localize_document_incrementally(_document, previous.localized_document, manifest, _localize)
+    assert localization.walked_address_count == 0
+    assert not localization.addresses_changed
+    assert localization.localized_document == previous.localized_document
+
+
+def test_edits_only_walk_the_addresses_around_them():
+    previous, manifest = _build_manifest(_document)
+    config_edit = _document.replace('"rate": 6', '"rate": 600')
+    localization = localize_document_incrementally(config_edit, previous.localized_document, manifest, _localize)
+    assert localization.walked_address_count == 1
+    assert not localization.addresses_changed
+    _assert_matches_full_run(localization, config_edit)
+
+    address_edit = _document.replace("package-1@package_1.Process", "package-9@package_9.Other", 1)
+    localization = localize_document_incrementally(address_edit, previous.localized_document, manifest, _localize)
+    assert localization.walked_address_count == 1
+    assert localization.addresses_changed
+    _assert_matches_full_run(localization, address_edit)
+
+    removal = json.dumps({"state": {name: node for name, node in _processes.items() if name != "process_4"},
+                          "emitter": {"address": "local:ram-emitter"}}, indent=2)
+    localization = localize_document_incrementally(removal, previous.localized_document, manifest, _localize)
+    assert localization.addresses_changed
+    _assert_matches_full_run(localization, removal)
+
+
+def test_edits_that_change_how_the_rest_reads_are_refused():
+    previous, manifest = _build_manifest(_document)
+    broken = _document.replace('"rate": 6', '"rate": "6', 1)  # an unclosed string swallows the following text
+    assert localize_document_incrementally(broken, previous.localized_document, manifest, _localize) is None
+    touched_output = previous.localized_document.replace("local:", "local: ", 1)
+    assert localize_document_incrementally(_document, touched_output, manifest, _localize) is None
+
+
+def test_manifest_round_trip():
+    _, manifest = _build_manifest(_document)
+    manifest.output_files = {"Dockerfile": hash_text("FROM base")}
+    with tempfile.TemporaryDirectory() as tmpdir:
+        manifest_path = get_manifest_path(os.path.join(tmpdir, "document.pbif"))
+        save_manifest(manifest_path, manifest)
+        assert load_manifest(manifest_path, "settings") == manifest
+        assert load_manifest(manifest_path, "other settings") is None
+    assert collect_distinct_addresses(manifest.checkpoints) == [
+        "pypi:package-0@package_0.Process", "pypi:package-1@package_1.Process", "pypi:package-2@package_2.Process",
+        "local:ram-emitter"]
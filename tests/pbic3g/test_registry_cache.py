@@ -0,0 +1,46 @@
+import importlib.metadata
+import os
+import pathlib
+import tempfile
+
+from bsander.pbic3g.registry_cache import *
+
+
+def _make_fake_distribution(root_dir: str, version: str, record: str) -> importlib.metadata.Distribution:
+    dist_info_dir = os.path.join(root_dir, f"fake_sim-{version}.dist-info")
+    os.makedirs(dist_info_dir, exist_ok=True)
+    with open(os.path.join(dist_info_dir, "METADATA"), "w") as metadata_file:
+        metadata_file.write(f"Metadata-Version: 2.1\nName: fake-sim\nVersion: {version}\nRequires-Dist: bsail (>=0.1)\n")
+    with open(os.path.join(dist_info_dir, "RECORD"), "w") as record_file:
+        record_file.write(record)
+    return importlib.metadata.PathDistribution(pathlib.Path(dist_info_dir))
+
+
+def test_registry_cache_round_trip():
+    with tempfile.TemporaryDirectory() as tmpdir:
+        cache_path = os.path.join(tmpdir, "registry.json")
+        description = describe_distribution(_make_fake_distribution(tmpdir, "1.0", "fake_sim/__init__.py,,\n"))
+        description.entries = [RegistryEntry("fake_sim.processes", "FakeProcess", "Process")]
+        save_registry_cache({description.name: description}, cache_path)
+        results = load_registry_cache(cache_path)
+        assert list(results.keys()) == ["fake-sim"]
+        assert results["fake-sim"].matches(description)
+        assert results["fake-sim"].entries == description.entries
+        assert results["fake-sim"].entries[0].address == "fake_sim.processes.FakeProcess"
+
+
+def test_registry_cache_detects_changed_distribution():
+    with tempfile.TemporaryDirectory() as tmpdir:
+        original = describe_distribution(_make_fake_distribution(tmpdir, "1.0", "fake_sim/__init__.py,,\n"))
+        reinstalled = describe_distribution(_make_fake_distribution(tmpdir, "1.0", "fake_sim/__init__.py,sha256=abc,\n"))
+        assert original.version == reinstalled.version
+        assert not original.matches(reinstalled)
+
+
+def test_registry_cache_ignores_broken_cache():
+    with tempfile.TemporaryDirectory() as tmpdir:
+        cache_path = os.path.join(tmpdir, "registry.json")
+        with open(cache_path, "w") as cache_file:
+            cache_file.write("{ not json")
+        assert load_registry_cache(cache_path) == {}
+        assert load_registry_cache(os.path.join(tmpdir, "missing.json")) == {}
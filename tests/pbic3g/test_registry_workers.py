@@ -0,0 +1,55 @@
+import os
+
+from bsander.pbic3g.registry_cache import RegistryEntry
+from bsander.pbic3g.registry_workers import *
+
+_fake_modules = {
+    "fake_worker_sim.py": """
+from process_bigraph import Process, Step
+
+print("noisy import output that must not corrupt the results")
+
+class SlowReaDDy(Process):
+    pass
+
+class Summary(Step):
+    pass
+""",
+    "fake_worker_hang.py": """
+import time
+time.sleep(60)
+""",
+    "fake_worker_crash.py": """
+import os
+os._exit(3)
+""",
+}
+
+
+def _write_fake_modules(tmp_path, monkeypatch):
+    for file_name, contents in _fake_modules.items():
+        (tmp_path / file_name).write_text(contents.strip())
+    monkeypatch.syspath_prepend(str(tmp_path))
+
+
+def test_scan_distributions_in_workers(tmp_path, monkeypatch):
+    _write_fake_modules(tmp_path, monkeypatch)
+    import_requests = [
+        ImportRequest("fake-worker-sim", ["fake_worker_sim"]),
+        ImportRequest("fake-worker-crash", ["fake_worker_crash"]),
+    ]
+    results = scan_distributions_in_workers(import_requests, max_workers=2, timeout=60)
+    results_by_name = {result.distribution_name: result for result in results}
+    assert set(results_by_name["fake-worker-sim"].entries) == {
+        RegistryEntry("fake_worker_sim", "SlowReaDDy", "Process"),
+        RegistryEntry("fake_worker_sim", "Summary", "Step"),
+    }
+    assert results_by_name["fake-worker-crash"].entries is None
+    assert "code 3" in results_by_name["fake-worker-crash"].error
+
+
+def test_scan_distributions_in_workers_times_out(tmp_path, monkeypatch):
+    _write_fake_modules(tmp_path, monkeypatch)
+    results = scan_distributions_in_workers([ImportRequest("fake-worker-hang", ["fake_worker_hang"])], timeout=2)
+    assert results[0].entries is None
+    assert "timed out" in results[0].error
@@ -0,0 +1,127 @@
+import importlib.metadata
+import os
+import pathlib
+import tempfile
+
+from bsander.pbic3g.registry_cache import RegistryEntry
+from bsander.pbic3g.static_discovery import *
+
+_fake_package_sources = {
+    "fake_sim/__init__.py": """
+from .processes import ReaDDyProcess as ExportedProcess
+""",
+    "fake_sim/processes.py": """
+import process_bigraph as pb
+from process_bigraph import Step
+from process_bigraph.composite import Composite
+import numpy
+
+class ReaDDyProcess(pb.Process):
+    pass
+
+class Analysis(Step):
+    pass
+
+class Wrapper(Composite):
+    pass
+
+class Helper(object):
+    pass
+
+class NumpyBacked(numpy.ndarray):
+    pass
+""",
+    "fake_sim/extended/more.py": """
+from ..processes import Analysis
+from fake_sim import ExportedProcess
+
+class DeeperAnalysis(Analysis):
+    pass
+
+class ReexportedProcess(ExportedProcess):
+    pass
+""",
+}
+
+
+def _write_fake_package(root_dir: str) -> dict[str, str]:
+    for relative_path, contents in _fake_package_sources.items():
+        file_path = os.path.join(root_dir, relative_path)
+        os.makedirs(os.path.dirname(file_path), exist_ok=True)
+        with open(file_path, "w") as source_file:
+            source_file.write(contents.strip())
+    return {
+        "fake_sim": os.path.join(root_dir, "fake_sim/__init__.py"),
+        "fake_sim.processes": os.path.join(root_dir, "fake_sim/processes.py"),
+        "fake_sim.extended.more": os.path.join(root_dir, "fake_sim/extended/more.py"),
+    }
+
+
+def test_discover_modules_statically():
+    with tempfile.TemporaryDirectory() as tmpdir:
+        results = discover_modules_statically(_write_fake_package(tmpdir))
+    correct_entries = {
+        RegistryEntry("fake_sim.processes", "ReaDDyProcess", "Process"),
+        RegistryEntry("fake_sim.processes", "Analysis", "Step"),
+        RegistryEntry("fake_sim.processes", "Wrapper", "Composite"),
+        RegistryEntry("fake_sim.extended.more", "DeeperAnalysis", "Step"),
+        RegistryEntry("fake_sim.extended.more", "ReexportedProcess", "Process"),
+    }
+    assert set(results.entries) == correct_entries
+    # `NumpyBacked` derives from another distribution's class, so only importing can settle it
+    assert results.unresolved_modules == ["fake_sim.processes"]
+
+
+def test_discover_modules_statically_marks_unparsable_modules():
+    with tempfile.TemporaryDirectory() as tmpdir:
+        broken_path = os.path.join(tmpdir, "broken.py")
+        with open(broken_path, "w") as broken_file:
+            broken_file.write("class Broken(:\n")
+        results = discover_modules_statically({"broken": broken_path})
+    assert results.entries == []
+    assert results.unresolved_modules == ["broken"]
+
+
+def test_find_distribution_source_files():
+    with tempfile.TemporaryDirectory() as tmpdir:
+        _write_fake_package(tmpdir)
+        dist_info_dir = os.path.join(tmpdir, "fake_sim-1.0.dist-info")
+        os.makedirs(dist_info_dir)
+        with open(os.path.join(dist_info_dir, "METADATA"), "w") as metadata_file:
+            metadata_file.write("Metadata-Version: 2.1\nName: fake-sim\nVersion: 1.0\n")
+        with open(os.path.join(dist_info_dir, "RECORD"), "w") as record_file:
+            record_file.write("\n".join([f"{path},," for path in _fake_package_sources]
+                                        + ["fake_sim-1.0.dist-info/METADATA,,", "../../bin/fake-sim,,"]))
+        package = importlib.metadata.PathDistribution(pathlib.Path(dist_info_dir))
+        results = find_distribution_source_files(package)
+    assert set(results.keys()) == {"fake_sim", "fake_sim.processes", "fake_sim.extended.more"}
+
+
+def test_discover_modules_statically_reads_ancestry_and_declarations():
+    with tempfile.TemporaryDirectory() as tmpdir:
+        source_path = os.path.join(tmpdir, "declared.py")
+        with open(source_path, "w") as source_file:
+            source_file.write("""
+from process_bigraph import Process
+
+class Growth(Process):
+    config_schema = {"rate": "float"}
+
+    def inputs(self):
+        return {"mass": "float"}
+
+    def outputs(self):
+        return {"mass": "float", "volume": "float"}
+
+class FastGrowth(Growth):
+    def outputs(self):
+        return make_ports()
+""")
+        results = discover_modules_statically({"declared": source_path})
+    entries = { entry.class_name : entry for entry in results.entries }
+    assert entries["Growth"].bases == ("process_bigraph.Process",)
+    assert entries["Growth"].config_keys == ("rate",)
+    assert entries["Growth"].outputs == ("mass", "volume")
+    assert entries["FastGrowth"].bases == ("declared.Growth", "process_bigraph.Process")
+    assert entries["FastGrowth"].inputs == ("mass",)  # inherited
+    assert entries["FastGrowth"].outputs is None  # not a literal
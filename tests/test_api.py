@@ -0,0 +1,59 @@
+import io
+import json
+import os
+import tempfile
+
+import pytest
+
+from bsander.api import *
+from bsander.bsandr_utils.input_types import ContainerizationEngine, ContainerizationTypes, ProgramArguments
+from bsander.pbic3g.registry_cache import RegistryEntry
+
+_document = {"state": {"scan": {"_type": "process", "address": "pypi:process-bigraph[<1.0]@process_bigraph.Scan"}}}
+
+
+def test_every_form_of_content_resolves_alike(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    document_str = json.dumps(_document, indent=2)
+    results = [resolve_environment(content, containerization_engine=ContainerizationEngine.BOTH)
+               for content in (_document, document_str, document_str.encode("utf-8"), io.StringIO(document_str),
+                               io.BytesIO(document_str.encode("utf-8")))]
+    assert all(result == results[0] for result in results)
+    assert results[0].pypi_deps == ["process-bigraph<1.0"] and results[0].conda_deps == []
+    assert results[0].load_localized_document()["state"]["scan"]["address"] == "local:process_bigraph.Scan"
+    assert set(results[0].container_files) == {"Dockerfile", "singularity.def"}
+    assert os.listdir(tmp_path) == []  # nothing was written
+    with pytest.raises(TypeError):
+        resolve_environment(42)
+
+
+def test_matches_a_file_based_run():
+    resolved = resolve_environment(_document)
+    with tempfile.TemporaryDirectory() as tmpdir:
+        input_path = os.path.join(tmpdir, "document.pbif")
+        with open(input_path, "w") as document_file:
+            json.dump(_document, document_file, indent=2)
+        output_dir = os.path.join(tmpdir, "out")
+        os.mkdir(output_dir)
+        from bsander.execution import execute_bsander
+        image_tag = execute_bsander(ProgramArguments(input_path, output_dir, None, ContainerizationTypes.SINGLE,
+                                                     ContainerizationEngine.DOCKER, use_cache=False), {})
+        with open(os.path.join(output_dir, "Dockerfile"), "r") as dockerfile, \
+                open(os.path.join(output_dir, "document.pbif"), "r") as output_file:
+            assert resolved.container_files == {"Dockerfile": dockerfile.read()}
+            assert resolved.localized_document == output_file.read()
+    assert resolved.image_tag == image_tag
+
+
+def test_abstract_processes_resolve_against_the_given_registry():
+    local_registry = {"growth-sim": [RegistryEntry("growth_sim.processes", "Growth", "Process",
+                                                   ("process_bigraph.Process",), ("mass",), ("mass",), ())]}
+    document = {"state": {"grow": {"_type": "process", "address": "abstract:Process",
+                                   "inputs": {"mass": []}, "outputs": {"mass": []}}}}
+    resolved = resolve_environment(document, containerization_engine=ContainerizationEngine.NONE,
+                                   local_registry=local_registry)
+    assert resolved.abstract_processes_resolved == 1
+    assert resolved.load_localized_document()["state"]["grow"]["address"] == "local:growth_sim.processes.Growth"
+    assert resolved.container_files == {} and resolved.image_tag is None
+    with pytest.raises(ValueError):
+        resolve_environment(_document, whitelist_entries=["pypi::numpy"])
@@ -0,0 +1,63 @@
+import json
+import os
+import tempfile
+import zipfile
+
+from bsander.batch import *
+from bsander.bsandr_utils.input_types import ContainerizationTypes, ContainerizationEngine, ProgramArguments
+
+fake_input_file = \
+"""
+"pypi:numpy[>=2.0.0]@numpy.random.rand"
+"pypi:process-bigraph[<1.0]@process_bigraph.processes.ParameterScan"
+""".strip()
+
+
+def _write_batch_inputs(input_dir: str) -> list[str]:
+    os.makedirs(os.path.join(input_dir, "nested"))
+    paths = [os.path.join(input_dir, "first.pbif"), os.path.join(input_dir, "nested", "first.json"),
+             os.path.join(input_dir, "broken.pbif"), os.path.join(input_dir, "archive.omex")]
+    for path in paths[:2]:
+        with open(path, "w") as input_file:
+            input_file.write(fake_input_file)
+    with open(paths[2], "w") as input_file:
+        input_file.write('{"noise": {"_type": "process", "address": "local:numpy.random.rand"}}')
+    with zipfile.ZipFile(paths[3], "w") as archive:
+        archive.writestr("inputFile.pbif", fake_input_file)
+    with open(os.path.join(input_dir, "notes.md"), "w") as ignored_file:
+        ignored_file.write("not an input")
+    return sorted(paths)
+
+
+def test_collect_batch_inputs():
+    with tempfile.TemporaryDirectory() as tmpdir:
+        input_dir = os.path.join(tmpdir, "inputs")
+        correct_answer = _write_batch_inputs(input_dir)
+        assert collect_batch_inputs(input_dir) == correct_answer
+        assert collect_batch_inputs(os.path.join(input_dir, "*.pbif")) == [correct_answer[1], correct_answer[2]]
+        manifest_path = os.path.join(tmpdir, "manifest.txt")
+        with open(manifest_path, "w") as manifest_file:
+            manifest_file.write("# nightly inputs\ninputs/archive.omex\n\ninputs/nested/first.json  # duplicate name\n")
+        assert collect_batch_inputs(manifest_path) == [correct_answer[0], correct_answer[3]]
+
+
+def test_execute_bsander_batch():
+    with tempfile.TemporaryDirectory() as tmpdir:
+        input_dir = os.path.join(tmpdir, "inputs")
+        output_dir = os.path.join(tmpdir, "outputs")
+        os.makedirs(output_dir)
+        input_file_paths = _write_batch_inputs(input_dir)
+        shared_args = ProgramArguments(input_dir, output_dir, None, ContainerizationTypes.SINGLE,
+                                       ContainerizationEngine.DOCKER, batch_mode=True)
+        results = execute_bsander_batch(input_file_paths, shared_args, max_workers=2, local_registry={})
+        results_by_input = {os.path.basename(result.input_file_path): result for result in results}
+        assert not results_by_input["broken.pbif"].succeeded
+        assert "local protocols" in results_by_input["broken.pbif"].error
+        for succeeded_input in ["archive.omex", "first.pbif", "first.json"]:
+            assert results_by_input[succeeded_input].succeeded
+            assert os.path.isfile(os.path.join(results_by_input[succeeded_input].output_dir, "Dockerfile"))
+        # Inputs sharing a name still get separate output directories
+        assert results_by_input["first.pbif"].output_dir != results_by_input["first.json"].output_dir
+        with open(os.path.join(output_dir, BATCH_REPORT_FILE_NAME), "r") as report_file:
+            report = json.load(report_file)
+        assert (report["total_inputs"], report["succeeded"], report["failed"]) == (4, 3, 1)
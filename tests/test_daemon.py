@@ -0,0 +1,88 @@
+import asyncio
+import os
+import threading
+import time
+
+import pytest
+
+import bsander.daemon as daemon_module
+from bsander.bsandr_utils.input_types import ContainerizationTypes, ContainerizationEngine, ProgramArguments, \
+    program_arguments_to_json, program_arguments_from_json
+from bsander.daemon import BsanderDaemon, send_daemon_request, forward_to_daemon
+from main import run_through_daemon
+
+
+@pytest.fixture
+def small_message_limit(monkeypatch):
+    monkeypatch.setattr(daemon_module, "_max_message_bytes", 1024)
+
+
+@pytest.fixture
+def running_daemon(tmp_path):
+    daemon = BsanderDaemon(str(tmp_path / "bsander.sock"), local_registry={})
+    server_thread = threading.Thread(target=asyncio.run, args=(daemon.serve(),))
+    server_thread.start()
+    deadline = time.monotonic() + 30
+    while not os.path.exists(daemon.socket_path) and time.monotonic() < deadline:
+        time.sleep(0.05)
+    yield daemon
+    send_daemon_request({"command": "shutdown"}, daemon.socket_path, timeout=10)
+    server_thread.join(timeout=10)
+    assert not os.path.exists(daemon.socket_path)
+
+
+def test_program_arguments_round_trip_through_json():
+    program_arguments = ProgramArguments("in.pbif", "out", ["pypi:numpy"], ContainerizationTypes.SINGLE,
+                                         ContainerizationEngine.BOTH, batch_workers=4)
+    assert program_arguments_from_json(program_arguments_to_json(program_arguments)) == program_arguments
+    with pytest.raises(ValueError):
+        program_arguments_from_json({"containerization_type": "SOMETIMES"})
+
+
+def test_daemon_serves_repeated_requests(running_daemon, tmp_path):
+    assert send_daemon_request({"command": "ping"}, running_daemon.socket_path)["pid"] == os.getpid()
+    input_path = tmp_path / "experiment.pbif"
+    input_path.write_text('{"a": {"address": "pypi:numpy[>=2.0.0]@numpy.random.rand"}}')
+    for run in range(2):
+        output_dir = tmp_path / f"out-{run}"
+        output_dir.mkdir()
+        response = forward_to_daemon(ProgramArguments(str(input_path), str(output_dir), ["pypi:numpy"],
+                                                      ContainerizationTypes.SINGLE, ContainerizationEngine.DOCKER),
+                                     running_daemon.socket_path)
+        assert response["ok"] and response["image_tag"].startswith("bsander-env:")
+        assert "Container build file located at" in response["output"]
+        assert "'numpy>=2.0.0'" in (output_dir / "Dockerfile").read_text()
+    failed_response = forward_to_daemon(ProgramArguments(str(input_path), str(output_dir), ["pypi:scipy"],
+                                                         ContainerizationTypes.SINGLE, ContainerizationEngine.DOCKER),
+                                        running_daemon.socket_path)
+    assert not failed_response["ok"] and "not a trusted package" in failed_response["error"]
+    with pytest.raises(SystemExit) as exit_info:
+        run_through_daemon(ProgramArguments(str(input_path), str(output_dir), ["pypi:scipy"],
+                                            ContainerizationTypes.SINGLE, ContainerizationEngine.DOCKER),
+                           running_daemon.socket_path)
+    assert exit_info.value.code == 11  # as a local run fails
+    assert send_daemon_request({"command": "launch"}, running_daemon.socket_path)["ok"] is False
+
+
+def test_daemon_captures_the_output_of_batch_workers(running_daemon, tmp_path):
+    input_dir = tmp_path / "inputs"
+    input_dir.mkdir()
+    for name, package in [("first", "numpy"), ("second", "scipy")]:
+        (input_dir / f"{name}.pbif").write_text(f'{{"a": {{"address": "pypi:{package}@{package}.thing"}}}}')
+    output_dir = tmp_path / "out"
+    output_dir.mkdir()
+    response = forward_to_daemon(ProgramArguments(str(input_dir), str(output_dir), ["pypi:numpy"],
+                                                  ContainerizationTypes.SINGLE, ContainerizationEngine.DOCKER,
+                                                  batch_mode=True, batch_workers=2),
+                                 running_daemon.socket_path)
+    assert not response["ok"]
+    # Printed on the batch's worker threads, not the request's own
+    assert "Container build file located at" in response["output"]
+    assert "second.pbif` failed" in response["output"] and "not a trusted package" in response["output"]
+    assert "1/2 succeeded" in response["output"]
+
+
+def test_daemon_answers_an_oversize_request(small_message_limit, running_daemon):
+    response = send_daemon_request({"command": "ping", "padding": "x" * 4096}, running_daemon.socket_path)
+    assert not response["ok"] and "longer than 1024 bytes" in response["error"]
+    assert send_daemon_request({"command": "ping"}, running_daemon.socket_path)["ok"]  # still serving others
@@ -2,7 +2,8 @@ import os
 import tempfile
 import zipfile
 
-from bsander.bsandr_utils.input_types import ContainerizationTypes, ContainerizationEngine, ProgramArguments
+from bsander.bsandr_utils.input_types import ContainerizationTypes, ContainerizationEngine, ProgramArguments, \
+    ArchiveMode
 from bsander.execution import execute_bsander as run_bsander
 
 
@@ -44,4 +45,190 @@ ENTRYPOINT ["python3", "/runtime/main.py"]
         output_dockerfile = os.path.join(tmpdir, "Dockerfile")
         with open(output_dockerfile, "r") as results_file:
             results = results_file.read()
-        assert results == correct_answer
\ No newline at end of file
+        assert results == correct_answer
+
+def test_streamed_archive_is_rewritten_without_extraction() -> None:
+    fake_input_file = '{"state": {"scan": {"address": "pypi:process-bigraph[<1.0]@process_bigraph.processes.ParameterScan"}}}'
+    with tempfile.TemporaryDirectory() as tmpdir:
+        zip_path = os.path.join(tmpdir, "inputArchive.omex")
+        output_dir = os.path.join(tmpdir, "out")
+        os.mkdir(output_dir)
+        with zipfile.ZipFile(zip_path, "w") as zip_ref:
+            zip_ref.writestr("inputFile.pbif", fake_input_file)
+            zip_ref.writestr("results.h5", b"\x00" * 4096, compress_type=zipfile.ZIP_DEFLATED)
+        test_args = ProgramArguments(zip_path, output_dir, None, ContainerizationTypes.SINGLE,
+                                     ContainerizationEngine.DOCKER, archive_mode=ArchiveMode.STREAMING)
+        run_bsander(test_args)
+        assert sorted(os.listdir(output_dir)) == ["Dockerfile", "inputArchive.omex"]
+        with zipfile.ZipFile(os.path.join(output_dir, "inputArchive.omex")) as zip_ref:
+            assert "local:process_bigraph.processes.ParameterScan" in zip_ref.read("inputFile.pbif").decode()
+            assert zip_ref.read("results.h5") == b"\x00" * 4096
+
+
+def test_every_document_in_a_multi_pbif_archive_is_localized() -> None:
+    manifest = """<?xml version="1.0" encoding="UTF-8"?>
+<omexManifest xmlns="http://identifiers.org/combine.specifications/omex-manifest">
+  <content location="./experiments/first.pbif" format="pbif"/>
+  <content location="./experiments/second.pbif" format="pbif"/>
+</omexManifest>"""
+    with tempfile.TemporaryDirectory() as tmpdir:
+        zip_path = os.path.join(tmpdir, "inputArchive.omex")
+        output_dir = os.path.join(tmpdir, "out")
+        os.mkdir(output_dir)
+        with zipfile.ZipFile(zip_path, "w") as zip_ref:
+            zip_ref.writestr("manifest.xml", manifest)
+            zip_ref.writestr("experiments/first.pbif", '{"a": {"address": "pypi:numpy[>=2.0.0]@numpy.random.rand"}}')
+            zip_ref.writestr("experiments/second.pbif", '{"b": {"address": "conda:readdy@readdy.Simulation"}}')
+        test_args = ProgramArguments(zip_path, output_dir, None, ContainerizationTypes.SINGLE,
+                                     ContainerizationEngine.DOCKER)
+        run_bsander(test_args)
+        with open(os.path.join(output_dir, "Dockerfile"), "r") as results_file:
+            results = results_file.read()
+        assert "'numpy>=2.0.0'" in results and "-c conda-forge readdy python=3.12" in results
+        with zipfile.ZipFile(os.path.join(output_dir, "inputArchive.omex")) as zip_ref:
+            assert "local:numpy.random.rand" in zip_ref.read("experiments/first.pbif").decode()
+            assert "local:readdy.Simulation" in zip_ref.read("experiments/second.pbif").decode()
+
+
+def test_multiple_containerization_emits_one_image_per_cluster() -> None:
+    with tempfile.TemporaryDirectory() as tmpdir:
+        input_path = os.path.join(tmpdir, "experiment.pbif")
+        output_dir = os.path.join(tmpdir, "out")
+        os.mkdir(output_dir)
+        with open(input_path, "w") as input_file:
+            input_file.write('{"a": {"address": "pypi:numpy[>=2.0.0]@numpy.random.rand"},'
+                             ' "b": {"address": "pypi:numpy[<1.26]@numpy.linalg.solve"}}')
+        test_args = ProgramArguments(input_path, output_dir, None, ContainerizationTypes.MULTIPLE,
+                                     ContainerizationEngine.DOCKER)
+        run_bsander(test_args)
+        assert sorted(os.listdir(output_dir)) == ["base", "cluster-1", "cluster-2", "docker-compose.yml",
+                                                  "experiment.pbif"]
+        with open(os.path.join(output_dir, "cluster-2", "Dockerfile"), "r") as results_file:
+            assert "'numpy<1.26'" in results_file.read()
+        with open(os.path.join(output_dir, "experiment.pbif"), "r") as results_file:
+            assert "local:numpy.linalg.solve" in results_file.read()
+
+
+def test_incremental_runs_only_regenerate_what_changed() -> None:
+    def write_document(path: str, rate: int, package: str):
+        with open(path, "w") as document_file:
+            document_file.write('{"state": {"scan": {"address": "pypi:' + package + '@process_bigraph.Scan", '
+                                '"config": {"rate": ' + str(rate) + '}}}}')
+
+    with tempfile.TemporaryDirectory() as tmpdir:
+        input_path = os.path.join(tmpdir, "document.pbif")
+        output_dir = os.path.join(tmpdir, "out")
+        os.mkdir(output_dir)
+        test_args = ProgramArguments(input_path, output_dir, None, ContainerizationTypes.SINGLE,
+                                     ContainerizationEngine.DOCKER, use_cache=False, incremental=True)
+        write_document(input_path, 1, "process-bigraph")
+        first_tag = run_bsander(test_args)
+        assert os.path.exists(os.path.join(output_dir, "document.pbif.bsander-manifest.json"))
+        dockerfile_path = os.path.join(output_dir, "Dockerfile")
+        os.utime(dockerfile_path, (0, 0))
+
+        write_document(input_path, 2, "process-bigraph")  # no address changed: the Dockerfile is left alone
+        assert run_bsander(test_args) == first_tag
+        assert os.path.getmtime(dockerfile_path) == 0
+        with open(os.path.join(output_dir, "document.pbif"), "r") as output_file:
+            assert '"rate": 2' in output_file.read()
+
+        write_document(input_path, 2, "numpy")
+        assert run_bsander(test_args) != first_tag
+        with open(dockerfile_path, "r") as dockerfile:
+            assert "'numpy'" in dockerfile.read()
+
+
+def test_profiled_run_times_every_stage() -> None:
+    from bsander.bsandr_utils.instrumentation import profiling
+    with tempfile.TemporaryDirectory() as tmpdir:
+        input_path = os.path.join(tmpdir, "document.pbif")
+        with open(input_path, "w") as document_file:
+            document_file.write('{"state": {"scan": {"address": "pypi:process-bigraph@process_bigraph.Scan"}}}')
+        output_dir = os.path.join(tmpdir, "out")
+        os.mkdir(output_dir)
+        test_args = ProgramArguments(input_path, output_dir, None, ContainerizationTypes.SINGLE,
+                                     ContainerizationEngine.DOCKER, use_cache=False)
+        with profiling() as profiler:
+            run_bsander(test_args)
+    report = profiler.report()
+    assert {"execute_bsander", "copy_input", "load_local_modules", "resolve_abstracts", "localize",
+            "generate_lockfiles", "render_container_files"} <= set(report.get_stage_durations())
+    assert report.counters["addresses_localized"] == 1
+    assert report.counters["bytes_read"] > 0 and report.counters["bytes_written"] > 0
+
+
+def test_async_pipeline_matches_the_sync_one(monkeypatch) -> None:
+    import asyncio
+    import time
+    import bsander.execution as execution_module
+    from bsander.bsandr_utils.instrumentation import profiling
+
+    def load_slowly(use_cache: bool = True):
+        time.sleep(0.5)
+        return {}
+    monkeypatch.setattr(execution_module, "load_local_modules", load_slowly)
+    with tempfile.TemporaryDirectory() as tmpdir:
+        input_path = os.path.join(tmpdir, "document.pbif")
+        with open(input_path, "w") as document_file:
+            document_file.write('{"state": {"scan": {"address": "pypi:process-bigraph@process_bigraph.Scan"}}}')
+        outputs: list[tuple[str, str]] = []
+        for run in (run_bsander, lambda args: asyncio.run(execution_module.execute_bsander_async(args))):
+            output_dir = tempfile.mkdtemp(dir=tmpdir)
+            with profiling() as profiler:
+                run(ProgramArguments(input_path, output_dir, None, ContainerizationTypes.SINGLE,
+                                     ContainerizationEngine.DOCKER, use_cache=False))
+            with open(os.path.join(output_dir, "Dockerfile"), "r") as dockerfile, \
+                    open(os.path.join(output_dir, "document.pbif"), "r") as output_file:
+                outputs.append((dockerfile.read(), output_file.read()))
+        assert outputs[0] == outputs[1]
+    # Without abstract processes, the async run localized while the registry was still loading
+    spans = { span_record.name : span_record for span_record in profiler.report().spans }
+    registry_load = spans["load_local_modules"]
+    assert spans["localize"].start_time < registry_load.start_time + registry_load.duration_seconds
+
+
+def test_zero_copy_writes_only_the_localized_document() -> None:
+    from bsander.bsandr_utils.instrumentation import profiling
+    document = '{"state": {"scan": {"address": "pypi:process-bigraph@process_bigraph.Scan"}}}'
+    with tempfile.TemporaryDirectory() as tmpdir:
+        input_path = os.path.join(tmpdir, "document.pbif")
+        with open(input_path, "w") as document_file:
+            document_file.write(document)
+        output_dir = os.path.join(tmpdir, "out")
+        os.mkdir(output_dir)
+        test_args = ProgramArguments(input_path, output_dir, None, ContainerizationTypes.SINGLE,
+                                     ContainerizationEngine.DOCKER, use_cache=False, zero_copy=True)
+        with profiling() as profiler:
+            run_bsander(test_args)
+        assert "copy_input" not in profiler.report().get_stage_durations()
+        with open(os.path.join(output_dir, "document.pbif"), "r") as output_file:
+            assert "local:process_bigraph.Scan" in output_file.read()
+        with open(input_path, "r") as document_file:
+            assert document_file.read() == document
+
+        # Without containerization nothing is rewritten, so the output is the input as is
+        run_bsander(ProgramArguments(input_path, output_dir, None, ContainerizationTypes.NONE,
+                                     ContainerizationEngine.NONE, use_cache=False, zero_copy=True))
+        with open(os.path.join(output_dir, "document.pbif"), "r") as output_file:
+            assert output_file.read() == document
+
+        # Once the output is the input as is, running again writes nothing
+        with profiling() as profiler:
+            run_bsander(ProgramArguments(input_path, output_dir, None, ContainerizationTypes.NONE,
+                                         ContainerizationEngine.NONE, use_cache=False, zero_copy=True))
+        assert "copy_input" not in profiler.report().get_stage_durations()
+
+
+def test_input_in_the_output_directory_is_validated_without_being_rewritten() -> None:
+    document = '{"state": {"scan": {"address": "pypi:process-bigraph@process_bigraph.Scan"}}}'
+    with tempfile.TemporaryDirectory() as tmpdir:
+        input_path = os.path.join(tmpdir, "document.pbif")
+        with open(input_path, "w") as document_file:
+            document_file.write(document)
+        run_bsander(ProgramArguments(input_path, tmpdir, None, ContainerizationTypes.SINGLE,
+                                     ContainerizationEngine.DOCKER, use_cache=False))
+        with open(input_path, "r") as document_file:
+            assert document_file.read() == document
+        with open(os.path.join(tmpdir, "Dockerfile"), "r") as dockerfile:
+            assert "'process-bigraph'" in dockerfile.read()
@@ -0,0 +1,24 @@
+import os
+import subprocess
+import sys
+
+_repository_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def _modules_loaded_by(code: str) -> set[str]:
+    completed = subprocess.run([sys.executable, "-c", code + "\nimport sys\nprint('\\n'.join(sys.modules))"],
+                               cwd=_repository_dir, capture_output=True, text=True, check=True)
+    return set(completed.stdout.split())
+
+
+def test_cli_help_loads_no_heavy_modules():
+    loaded_modules = _modules_loaded_by("import main")
+    assert "bsander.execution" not in loaded_modules
+    assert "process_bigraph" not in loaded_modules
+
+
+def test_validation_path_defers_containerization():
+    loaded_modules = _modules_loaded_by("import bsander.execution")
+    assert "process_bigraph" not in loaded_modules
+    assert "bsander.pbic3g.containerization.container_constructor" not in loaded_modules
+    assert "bsander.pbic3g.dependency_resolution.lockfile" not in loaded_modules